@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 13:00
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:18
+Description        : Headless batch mode: ask a question set about many papers, with resumable output.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Set, Tuple
+
+from src.arguments import get_batch_args
+from src.conversation import ConversationHistory
+from src.metrics import format_profile
+from src.process_file import upload_file, upload_file_from_arxiv, index_file_from_arxiv, ingest_file_from_arxiv
+from src.process_file import query_arxiv_id_list
+from src.query_api import query_api_batch
+from src.retrieval import index_file
+from src.utils import ends_with_torn_record
+from src.config_and_variables import SYSTEM_PROMPT, ENDPOINT, ARXIV_MAX_IDS_PER_QUERY
+
+
+def load_manifest(manifest_path: str = None) -> List[dict]:
+    """Load the papers and their questions.
+
+    Each line of the manifest is a JSON object with either an `arxiv` id or a local `file` path,
+    and a list of `questions`, e.g. `{"arxiv": "2311.11100", "questions": ["What is the main idea?"]}`.
+
+    Parameters
+    ----------
+    manifest_path : str, optional
+        path to the JSONL manifest, by default None
+
+    Returns
+    -------
+    List[dict]
+        items with keys `paper` ('arxiv:<id>' or 'file:<path>') and `questions`
+
+    Raises
+    ------
+    ValueError
+        raised when a line is not a valid item
+    """
+    items = []
+    with open(manifest_path, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+
+            record = json.loads(line)
+            if 'arxiv' in record:
+                paper = f"arxiv:{record['arxiv']}"
+            elif 'file' in record:
+                paper = f"file:{record['file']}"
+            else:
+                raise ValueError(f"Line {line_number} of {manifest_path} has neither 'arxiv' nor 'file'.")
+
+            questions = record.get('questions')
+            if not isinstance(questions, list) or len(questions) == 0:
+                raise ValueError(f"Line {line_number} of {manifest_path} has no 'questions'.")
+
+            items.append({'paper': paper, 'questions': questions})
+
+    return items
+
+
+def load_finished(output_path: str = None) -> Set[Tuple[str, str]]:
+    """Read the (paper, question) pairs already answered in the output, to resume after a crash.
+
+    Parameters
+    ----------
+    output_path : str, optional
+        path to the JSONL output, by default None
+
+    Returns
+    -------
+    Set[Tuple[str, str]]
+        answered (paper, question) pairs, failed ones being run again
+    """
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+
+    with open(output_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # torn record, written by a crashed process
+                continue
+
+            if 'answer' in record:
+                finished.add((record['paper'], record['question']))
+
+    return finished
+
+
+def prefetch_arxiv_metadata(arxiv_ids: List[str] = None) -> None:
+    """Resolve the metadata of many papers with a few ArXiv API queries, into `arxiv_cache`.
+
+    Parameters
+    ----------
+    arxiv_ids : List[str], optional
+        arxiv ids of the papers, by default None
+    """
+    for start in range(0, len(arxiv_ids), ARXIV_MAX_IDS_PER_QUERY):
+        query_arxiv_id_list(id_list=','.join(arxiv_ids[start:start + ARXIV_MAX_IDS_PER_QUERY]))
+
+
+class AnswerWriter:
+    """Append answers to the JSONL output, one line per answer, from several threads.
+
+    Parameters
+    ----------
+    output_path : str
+        path to the JSONL output
+    """
+
+    def __init__(self, output_path: str) -> None:
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(output_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # do not glue the first record to a line torn by a crash
+        prefix = '\n' if os.path.exists(output_path) and ends_with_torn_record(output_path) else ''
+        self._file = open(output_path, 'a')
+        self._file.write(prefix)
+
+    def write(self, record: dict) -> None:
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def main():
+    args = get_batch_args()
+
+    from src.client_pool import ClientPool, split_entries
+
+    client = ClientPool(
+        api_keys=split_entries(args.accessKey),
+        endpoints=split_entries(ENDPOINT),
+        max_retries=0   # retries are handled by `src/rate_limit.py`
+    )
+
+    items = load_manifest(manifest_path=args.manifest)
+    finished = load_finished(output_path=args.output)
+
+    pending = []
+    for item in items:
+        questions = [question for question in item['questions'] if (item['paper'], question) not in finished]
+        if len(questions) > 0:
+            pending.append({'paper': item['paper'], 'questions': questions})
+
+    num_questions = sum(len(item['questions']) for item in pending)
+    print(f"=== {len(pending)} papers, {num_questions} questions to answer ({len(finished)} already answered) ===")
+
+    arxiv_ids = [item['paper'][len('arxiv:'):] for item in pending if item['paper'].startswith('arxiv:')]
+    if len(arxiv_ids) > 0:
+        prefetch_arxiv_metadata(arxiv_ids=arxiv_ids)
+
+    writer = AnswerWriter(output_path=args.output)
+
+    def process(item: dict) -> int:
+        paper = item['paper']
+        path = paper.split(':', 1)[1]
+
+        if paper.startswith('arxiv:') and args.retrieval:
+            steps = index_file_from_arxiv(arxiv_id=path)
+        elif paper.startswith('arxiv:'):
+            # papers are uploaded as they are downloaded, without a local copy, in diskless mode
+            ingest = ingest_file_from_arxiv if args.diskless else upload_file_from_arxiv
+            steps = ingest(client=client, arxiv_id=path)
+        else:
+            steps = index_file(file_path=path) if args.retrieval else upload_file(client=client, file_path=path)
+        for file_id in steps:
+            pass
+        attachment = f"{'docid' if args.retrieval else 'fileid'}://{file_id}"
+
+        num_failed = 0
+        for question in item['questions']:
+            # questions are independent, each one is asked in a fresh conversation
+            messages = ConversationHistory()
+            messages.append(role='system', content=SYSTEM_PROMPT)
+            messages.append(role='system', content=attachment)
+
+            start = time.perf_counter()
+            try:
+                answer = query_api_batch(client=client, query=question, messages=messages)
+            except Exception as e:
+                num_failed += 1
+                writer.write({'paper': paper, 'question': question, 'error': str(e)})
+                continue
+
+            writer.write({
+                'paper': paper,
+                'question': question,
+                'answer': answer,
+                'file_id': file_id,
+                'elapsed': round(time.perf_counter() - start, 3),
+            })
+
+        return num_failed
+
+    num_failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = {executor.submit(process, item): item for item in pending}
+
+            for i, future in enumerate(as_completed(futures)):
+                paper = futures[future]['paper']
+                try:
+                    failed = future.result()
+                except Exception as e:
+                    # the paper could not be downloaded/uploaded, none of its questions is answered
+                    failed = len(futures[future]['questions'])
+                    writer.write({'paper': paper, 'error': str(e)})
+
+                num_failed += failed
+                print(f"[{i + 1} / {len(pending)}]: {paper} {'finished' if failed == 0 else f'{failed} questions failed'}")
+    finally:
+        writer.close()
+
+    print(f"\n=== Batch Finished: {num_questions - num_failed} answered, {num_failed} failed, see {args.output} ===\n")
+
+    if args.profile:
+        print(format_profile())
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 12:57
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 12:57
+Description        : __init__.py
+--------
+Copyright (c) 2026 Wei Chen.
+'''
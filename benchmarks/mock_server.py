@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 12:57
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:38
+Description        : Local stand-in for the DashScope compatible-mode endpoint and the ArXiv API.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+
+class MockState:
+    """State shared by the requests served by `MockServer`.
+
+    Parameters
+    ----------
+    pdf_bytes : bytes
+        content served for every paper PDF
+    num_remote_files : int, optional
+        number of files already listed by the file endpoint, by default 0
+    latency : float, optional
+        seconds before the first token of a chat completion, by default 0.0
+    token_rate : float, optional
+        tokens per second streamed by chat completions, unlimited if 0, by default 0.0
+    num_tokens : int, optional
+        tokens per chat completion, by default 256
+    num_search_results : int, optional
+        results of every keyword search, by default 500
+    files_page_size : int, optional
+        files per page of the file listing when no `limit` is given, by default 100
+
+    Attributes
+    ----------
+    failures : List[int]
+        statuses answered to the next `/v1/` requests, one each, e.g. `[500, 400]`
+    """
+
+    def __init__(
+        self,
+        pdf_bytes: bytes,
+        num_remote_files: int = 0,
+        latency: float = 0.0,
+        token_rate: float = 0.0,
+        num_tokens: int = 256,
+        num_search_results: int = 500,
+        files_page_size: int = 100
+    ) -> None:
+        self.pdf_bytes = pdf_bytes
+        self.latency = latency
+        self.token_rate = token_rate
+        self.num_tokens = num_tokens
+        self.num_search_results = num_search_results
+        self.files_page_size = files_page_size
+        self.failures = []
+
+        self.lock = threading.Lock()
+        self.files = {
+            f"file-mock-{i}": {
+                "id": f"file-mock-{i}",
+                "object": "file",
+                "bytes": len(pdf_bytes),
+                "created_at": 1700000000 + i,
+                "filename": f"remote-{i}.pdf",
+                "purpose": "file-extract",
+                "status": "processed",
+            }
+            for i in range(num_remote_files)
+        }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Serve `/v1/files`, `/v1/chat/completions`, `/api/query` (Atom feed) and `/pdf/<arxiv_id>`."""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "MockServer/1.0"
+
+    @property
+    def state(self) -> MockState:
+        return self.server.state
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, obj: dict, status: int = 200) -> None:
+        self._send(status, json.dumps(obj).encode("utf-8"))
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _inject_failure(self, path: str) -> bool:
+        """Answer the next status of `failures` to a `/v1/` request, returning True if one was sent."""
+        with self.state.lock:
+            status = self.state.failures.pop(0) if path.startswith("/v1/") and len(self.state.failures) > 0 else None
+        if status is None:
+            return False
+
+        self._read_body()
+        self._send_json({"error": {"message": f"injected {status}"}}, status=status)
+        return True
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if self._inject_failure(url.path):
+            return
+
+        if url.path == "/v1/files":
+            # paginated by cursor, as the OpenAI file listing
+            params = parse_qs(url.query)
+            limit = int(params.get("limit", [self.state.files_page_size])[0])
+            with self.state.lock:
+                data = list(self.state.files.values())
+            if "after" in params:
+                ids = [file_object["id"] for file_object in data]
+                data = data[ids.index(params["after"][0]) + 1:] if params["after"][0] in ids else []
+            self._send_json({"object": "list", "data": data[:limit], "has_more": len(data) > limit})
+        elif url.path.startswith("/v1/files/"):
+            with self.state.lock:
+                file_object = self.state.files.get(url.path[len("/v1/files/"):])
+            if file_object is None:
+                self._send_json({"error": {"message": "file not found"}}, status=404)
+            else:
+                self._send_json(file_object)
+        elif url.path == "/api/query":
+            params = parse_qs(url.query)
+            if "search_query" in params:
+                # the same ranked results for every keyword, served page by page
+                start = int(params.get("start", ["0"])[0])
+                stop = min(start + int(params.get("max_results", ["10"])[0]), self.state.num_search_results)
+                arxiv_ids = [f"2402.{i:05d}" for i in range(start, stop)]
+                total = self.state.num_search_results
+            else:
+                id_list = params.get("id_list", [""])[0]
+                arxiv_ids = [i for i in id_list.split(",") if i]
+                total = len(arxiv_ids)
+            self._send(200, self._atom_feed(arxiv_ids, total), "application/atom+xml")
+        elif url.path.startswith("/pdf/"):
+            self._send(200, self.state.pdf_bytes, "application/pdf")
+        else:
+            self._send_json({"error": {"message": "not found"}}, status=404)
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        if self._inject_failure(url.path):
+            return
+
+        if url.path == "/v1/files":
+            body = self._read_body()
+            match = re.search(rb'filename="([^"]*)"', body)
+            file_object = {
+                "id": f"file-{uuid.uuid4().hex}",
+                "object": "file",
+                "bytes": len(body),
+                "created_at": int(time.time()),
+                "filename": match.group(1).decode("utf-8") if match else "upload.pdf",
+                "purpose": "file-extract",
+                "status": "processed",
+            }
+            with self.state.lock:
+                self.state.files[file_object["id"]] = file_object
+            self._send_json(file_object)
+        elif url.path == "/v1/chat/completions":
+            request = json.loads(self._read_body())
+            self._stream_chat(model=request.get("model", "mock"))
+        else:
+            self._send_json({"error": {"message": "not found"}}, status=404)
+
+    def do_DELETE(self) -> None:
+        url = urlparse(self.path)
+        if self._inject_failure(url.path):
+            return
+
+        if url.path.startswith("/v1/files/"):
+            file_id = url.path[len("/v1/files/"):]
+            with self.state.lock:
+                self.state.files.pop(file_id, None)
+            self._send_json({"id": file_id, "object": "file", "deleted": True})
+        else:
+            self._send_json({"error": {"message": "not found"}}, status=404)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream_chat(self, model: str) -> None:
+        """Stream `num_tokens` tokens as server-sent events, after `latency` and at `token_rate`."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        time.sleep(self.state.latency)
+
+        start = time.monotonic()
+        for i in range(self.state.num_tokens + 1):
+            finish_reason = "stop" if i == self.state.num_tokens else None
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": "" if finish_reason else f"token{i} "},
+                    "finish_reason": finish_reason,
+                }],
+            }
+            if self.state.token_rate > 0:
+                delay = start + i / self.state.token_rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _atom_feed(self, arxiv_ids: List[str], total: int) -> bytes:
+        host = f"http://{self.headers.get('Host')}"
+        entries = "".join(
+            f"""
+  <entry>
+    <id>http://arxiv.org/abs/{escape(arxiv_id)}v1</id>
+    <title>Mock paper {escape(arxiv_id)}</title>
+    <summary>Abstract of mock paper {escape(arxiv_id)}.</summary>
+    <author><name>Mock Author</name></author>
+    <link href="http://arxiv.org/abs/{escape(arxiv_id)}v1" rel="alternate" type="text/html"/>
+    <link title="pdf" href="{host}/pdf/{escape(arxiv_id)}" rel="related" type="application/pdf"/>
+  </entry>"""
+            for arxiv_id in arxiv_ids
+        )
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">
+  <title>ArXiv Query</title>
+  <id>http://arxiv.org/api/mock</id>
+  <opensearch:totalResults>{total}</opensearch:totalResults>{entries}
+</feed>
+""".encode("utf-8")
+
+
+class _ThreadingServer(ThreadingHTTPServer):
+
+    def handle_error(self, request, client_address) -> None:
+        # clients closing a stream early, e.g. a dropped chat
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class MockServer:
+    """Serve `MockHandler` on a local port in a background thread.
+
+    Parameters
+    ----------
+    state : MockState
+        state shared by the requests
+    host : str, optional
+        address to bind, by default "127.0.0.1"
+    port : int, optional
+        port to bind, a free one if 0, by default 0
+    """
+
+    def __init__(self, state: MockState, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._server = _ThreadingServer((host, port), MockHandler)
+        self._server.daemon_threads = True
+        self._server.state = state
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "MockServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 12:57
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:09
+Description        : Offline benchmarks of the hot paths against local mock servers.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from typing import Callable, List
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.mock_server import MockServer, MockState
+
+SAMPLE_PAPER = os.path.join(ROOT_DIR, "files", "HowtoReadPaper.pdf")
+RETRIEVAL_QUERIES = [
+    "What is the three-pass approach?",
+    "How should I do a literature survey?",
+    "What should I look for in the first pass?",
+]
+
+
+def get_args() -> Namespace:
+    parser = argparse.ArgumentParser(description='Paper Reading LLM Benchmarks.')
+    parser.add_argument('--output', '-o', type=str, default='benchmark_results.json', help='JSON file to write results to')
+    parser.add_argument('--repeat', '-n', type=int, default=20, help='Samples per benchmark')
+    parser.add_argument('--remote-files', type=int, default=10000, help='Files listed by the mock file endpoint')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds before the first token of the mock LLM')
+    parser.add_argument('--token-rate', type=float, default=0.0, help='Tokens per second of the mock LLM, unlimited if 0')
+    parser.add_argument('--num-tokens', type=int, default=256, help='Tokens per answer of the mock LLM')
+    parser.add_argument('--search-results', type=int, default=500, help='Entries listed by the search benchmark')
+
+    return parser.parse_args()
+
+
+def summarize(samples: List[float]) -> dict:
+    """Summarize samples in seconds as milliseconds."""
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        "min_ms": samples[0] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+def measure(func: Callable, repeat: int) -> List[float]:
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+
+    return samples
+
+
+def configure(server_url: str) -> None:
+    """Point the configuration at the mock server, before any other `src` module reads it."""
+    from src import config_and_variables as config
+
+    config.ARXIV_API_URL = f"{server_url}/api/query"
+    config.USE_PROXY = False
+    config.USE_RESPONSE_CACHE = False
+    for policy in config.UPSTREAM_POLICIES.values():
+        # measure our code paths, not the politeness delays
+        policy.update(rate=1e9, burst=1e9)
+
+
+def bench_chat(client, args: Namespace) -> dict:
+    from src.config_and_variables import SYSTEM_PROMPT
+    from src.conversation import ConversationHistory
+    from src.query_api import query_api_webapp
+
+    ttfts, rates = [], []
+    for i in range(args.repeat):
+        messages = ConversationHistory()
+        messages.append(role='system', content=SYSTEM_PROMPT)
+
+        start = time.perf_counter()
+        first_token = None
+        for _ in query_api_webapp(
+            client=client,
+            query=f"Question {i}: what is the main contribution?",
+            messages=messages,
+            flush_interval=0,
+            yield_deltas=True
+        ):
+            if first_token is None:
+                first_token = time.perf_counter()
+        end = time.perf_counter()
+
+        ttfts.append(first_token - start)
+        rates.append(args.num_tokens / (end - first_token))
+
+    return {
+        "time_to_first_token": summarize(ttfts),
+        "tokens_per_s": {"mean": statistics.fmean(rates), "median": statistics.median(rates), "min": min(rates)},
+    }
+
+
+def bench_upload_from_arxiv(client, args: Namespace) -> dict:
+    from src.process_file import upload_file_from_arxiv
+
+    def cold(i: int) -> None:
+        # a new paper every time: metadata query, download, hash and upload
+        for _ in upload_file_from_arxiv(client=client, arxiv_id=f"2401.{i:05d}"):
+            pass
+
+    def warm(i: int) -> None:
+        # already downloaded and uploaded: local checks only
+        for _ in upload_file_from_arxiv(client=client, arxiv_id="2401.00000"):
+            pass
+
+    return {"cold": summarize(measure(cold, args.repeat)), "warm": summarize(measure(warm, args.repeat))}
+
+
+def bench_get_file_id(client, args: Namespace) -> dict:
+    from src.file_registry import refresh_registry
+    from src.process_file import get_file_id
+
+    # empty registry: the miss triggers a listing of every remote file
+    start = time.perf_counter()
+    get_file_id(client=client, file_name=f"remote-{args.remote_files - 1}.pdf")
+    first_lookup = time.perf_counter() - start
+
+    return {
+        "remote_files": args.remote_files,
+        "first_lookup": summarize([first_lookup]),
+        "refresh": summarize(measure(lambda i: refresh_registry(client=client, force=True), args.repeat)),
+        "hit": summarize(measure(lambda i: get_file_id(client=client, file_name=f"remote-{i}.pdf"), args.repeat)),
+        "miss": summarize(measure(lambda i: get_file_id(client=client, file_name=f"missing-{i}.pdf"), args.repeat)),
+    }
+
+
+def bench_search(args: Namespace) -> dict:
+    from src.process_file import search_arxiv
+
+    first_entries, totals = [], []
+    for i in range(args.repeat):
+        start = time.perf_counter()
+        first_entry = None
+        # a new keyword every time, so that no page is answered from the cache
+        for _ in search_arxiv(keyword=f"survey {i}", max_results=args.search_results):
+            if first_entry is None:
+                first_entry = time.perf_counter()
+        totals.append(time.perf_counter() - start)
+        first_entries.append(first_entry - start)
+
+    return {
+        "results": args.search_results,
+        "first_entry": summarize(first_entries),
+        "all_entries": summarize(totals),
+    }
+
+
+def bench_retrieval(args: Namespace) -> dict:
+    from src.context_window import count_tokens
+    from src.retrieval import chunk_pages, extract_pdf_text, index_file, retrieve
+
+    try:
+        pages = extract_pdf_text(file_path=SAMPLE_PAPER)
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    start = time.perf_counter()
+    for doc_id in index_file(file_path=SAMPLE_PAPER):
+        pass
+    index_time = time.perf_counter() - start
+
+    passages = retrieve(doc_ids=[doc_id], query=RETRIEVAL_QUERIES[0])
+    passage_tokens = sum(count_tokens(passage['text']) for passage in passages)
+
+    return {
+        "extract_and_chunk": summarize(measure(lambda i: chunk_pages(pages=extract_pdf_text(file_path=SAMPLE_PAPER)), 3)),
+        "index": summarize([index_time]),
+        "retrieve": summarize(measure(
+            lambda i: retrieve(doc_ids=[doc_id], query=RETRIEVAL_QUERIES[i % len(RETRIEVAL_QUERIES)]), args.repeat
+        )),
+        "document_tokens": count_tokens('\n'.join(pages)),
+        "retrieved_tokens": passage_tokens,
+    }
+
+
+def main():
+    args = get_args()
+    output = os.path.abspath(args.output)
+
+    with open(SAMPLE_PAPER, 'rb') as f:
+        pdf_bytes = f.read()
+
+    state = MockState(
+        pdf_bytes=pdf_bytes,
+        num_remote_files=args.remote_files,
+        latency=args.latency,
+        token_rate=args.token_rate,
+        num_tokens=args.num_tokens,
+        num_search_results=args.search_results
+    )
+
+    # files, logs and caches are created relative to the working directory
+    with MockServer(state) as server, tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        configure(server.url)
+
+        from openai import OpenAI
+
+        client = OpenAI(api_key="mock", base_url=f"{server.url}/v1", max_retries=0)
+
+        results = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            results["chat"] = bench_chat(client, args)
+            results["upload_file_from_arxiv"] = bench_upload_from_arxiv(client, args)
+            results["get_file_id"] = bench_get_file_id(client, args)
+            results["search_arxiv"] = bench_search(args)
+            results["retrieval"] = bench_retrieval(args)
+
+        os.chdir(ROOT_DIR)
+
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": vars(args),
+        "results": results,
+    }
+
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(results, indent=2))
+    print(f"\n=== Results written to {output} ===")
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 13:03
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:26
+Description        : Cold start benchmark of the entry points, failing over the startup time budget.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from argparse import Namespace
+from typing import List
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.run import summarize
+from src.config_and_variables import STARTUP_TIME_BUDGET
+
+ENTRY_POINTS = ["main.py", "webapp.py", "batch.py"]
+
+# loaded on first use only, none of them may be imported by an entry point
+LAZY_MODULES = ["openai", "gradio", "feedparser", "httpx", "pypdf", "http.server"]
+
+
+def get_args() -> Namespace:
+    parser = argparse.ArgumentParser(description='Paper Reading LLM Startup Benchmark.')
+    parser.add_argument('--output', '-o', type=str, default=None, help='JSON file to write results to')
+    parser.add_argument('--repeat', '-n', type=int, default=10, help='Cold starts per entry point')
+    parser.add_argument('--budget', '-b', type=float, default=STARTUP_TIME_BUDGET, help='Median cold start of main.py allowed, in seconds')
+
+    return parser.parse_args()
+
+
+def cold_start(entry_point: str) -> float:
+    """Time a fresh interpreter running `<entry_point> --help`, i.e. importing everything and parsing arguments."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, entry_point, "--help"], cwd=ROOT_DIR, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def loaded_lazy_modules(entry_point: str) -> List[str]:
+    """Import an entry point in a fresh interpreter and list the lazy modules it loaded."""
+    module = os.path.splitext(entry_point)[0]
+    code = (
+        f"import sys, {module}\n"
+        f"print(' '.join(name for name in {LAZY_MODULES!r} if name in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+
+def main():
+    args = get_args()
+
+    results = {}
+    for entry_point in ENTRY_POINTS:
+        samples = [cold_start(entry_point) for _ in range(args.repeat)]
+        results[entry_point] = {
+            "cold_start": summarize(samples),
+            "loaded_lazy_modules": loaded_lazy_modules(entry_point),
+        }
+
+    # interpreter alone, the floor of every cold start
+    samples = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        samples.append(time.perf_counter() - start)
+    results["interpreter"] = {"cold_start": summarize(samples)}
+
+    median = results["main.py"]["cold_start"]["median_ms"] / 1000
+    failures = []
+    if median > args.budget:
+        failures.append(f"main.py starts in {median:.3f}s, over the budget of {args.budget:.3f}s")
+    for entry_point in ENTRY_POINTS:
+        if results[entry_point]["loaded_lazy_modules"]:
+            failures.append(f"{entry_point} imports {', '.join(results[entry_point]['loaded_lazy_modules'])} at startup")
+
+    print(json.dumps(results, indent=2))
+
+    if args.output is not None:
+        report = {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+            "results": results,
+            "failures": failures,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n=== Results written to {args.output} ===")
+
+    if failures:
+        for failure in failures:
+            print(f"\n=== Startup Budget Exceeded: {failure} ===")
+        sys.exit(1)
+
+    print(f"\n=== Startup Within Budget: main.py {median:.3f}s <= {args.budget:.3f}s ===")
+
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,8 @@
 '''
 Author             : 陈蔚 (weichen.cw@zju.edu.cn)
 Date               : 2024-08-17 14:28
-Last Modified By   : 陈蔚 (weichen.cw@zju.edu.cn)
-Last Modified Date : 2024-08-20 01:08
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:30
 Description        : This is the main file for command line interface.
 -------- 
 Copyright (c) 2024 Wei Chen. 
@@ -12,12 +12,17 @@ Copyright (c) 2024 Wei Chen.
 
 import time
 
-from openai import OpenAI
-
 from src.arguments import get_args
-from src.process_file import upload_file, upload_file_from_arxiv, get_file_id
+from src.process_file import upload_file, upload_file_from_arxiv, upload_files_from_arxiv, get_file_id, delete_file
+from src.process_file import index_file_from_arxiv, get_arxiv_file_path, search_arxiv, format_arxiv_entry
+from src.prefetch import Prefetcher
+from src.lifecycle import LifecycleManager
 from src.query_api import query_api_command_line
-from src.utils import log_history, load_log, append_message, remove_message
+from src.retrieval import index_file, lookup_doc_id
+from src.conversation import ConversationHistory
+from src.metrics import format_profile, snapshot
+from src.utils import log_history, load_log
+from src.log_index import list_logs, search_logs, resolve_log_name, load_log_page, format_log_entry
 from src.config_and_variables import SYSTEM_PROMPT, INSTRUCTION, ENDPOINT
 
 
@@ -26,60 +31,186 @@ def main():
     print(args)
     print(INSTRUCTION)
 
-    client = OpenAI(
-        api_key=args.accessKey,
-        base_url=ENDPOINT
-    )
-    messages = []
-    append_message(messages=messages, role='system', content=SYSTEM_PROMPT)
+    messages = ConversationHistory()
+    messages.append(role='system', content=SYSTEM_PROMPT)
     log_name = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
 
+    # files attached to the current chat are never evicted
+    lifecycle = None
+    if args.lifecycle is not None:
+        lifecycle = LifecycleManager(active_file_ids=lambda: messages.attachments(scheme='fileid'), interval=args.lifecycle)
+
+    client = None
+
+    def get_client():
+        # `openai` is imported and the client built by the first command needing them, for a fast startup
+        nonlocal client
+        if client is None:
+            from src.client_pool import ClientPool, split_entries
+
+            client = ClientPool(
+                api_keys=split_entries(args.accessKey),
+                endpoints=split_entries(ENDPOINT),
+                max_retries=0   # retries are handled by `src/rate_limit.py`
+            )
+            if lifecycle is not None:
+                lifecycle.set_client(client)
+        return client
+
+    def get_pinned_client():
+        # new files go to the key storing the files already attached, a chat cannot span keys
+        return get_client().pinned(file_ids=messages.attachments(scheme='fileid'))
+
+    # papers are attached as whole remote files, or as local documents searched on each query
+    scheme, action = ('docid', 'Indexing') if args.retrieval else ('fileid', 'Uploading')
+
+    prefetcher = None
+
+    def prefetch_references(arxiv_id: str) -> None:
+        nonlocal prefetcher
+        if prefetcher is None:
+            prefetcher = Prefetcher(client=None if args.retrieval else get_client(), retrieval=args.retrieval)
+        prefetcher.submit(file_path=get_arxiv_file_path(arxiv_id), arxiv_id=arxiv_id)
+
     while True:
         query = input("HUMAN: ")
         file_id = None
 
         if query == 'Quit':
+            if prefetcher is not None:
+                prefetcher.close()
+            if lifecycle is not None:
+                lifecycle.close()
+            if args.profile:
+                print(format_profile())
             break
-        elif query == 'Clear':
-            messages = []
-            append_message(messages=messages, role='system', content=SYSTEM_PROMPT)
-
-            log_name = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
-        elif query.startswith('arxiv:'):
-            arxiv_id = query.split(':')[1]
-            for i, msg in enumerate(upload_file_from_arxiv(client=client, arxiv_id=arxiv_id)):
-                print(f"[STEP {i + 1}/3]: {msg}")
-            file_id = msg
-
-            append_message(messages=messages, role='system', content=f'fileid://{file_id}')
-
-            print(f"\n=== Uploading file id: {file_id} Finished ===\n")
-        elif query.startswith('file:'):
-            file_path = query.split(':')[1]
-            for i, msg in enumerate(upload_file(client=client, file_path=file_path)):
-                print(f"[STEP {i + 1} / 2]: {msg}")
-            file_id = msg
-            append_message(messages=messages, role='system', content=f'fileid://{file_id}')
-
-            print(f"\n=== Uploading file id: {file_id} Finished ===\n")
-        elif query.startswith('delete:'):
-            file_name = query.split(':')[1].split('/')[-1]
-
-            file_id = get_file_id(client=client, file_name=file_name)
-            if file_id is not None:
-                client.files.delete(file_id)
-
-                # remove the file in the message history.
-                remove_message(messages=messages, role='system', content=f'fileid://{file_id}')
-                print(f"\n=== Deleting file id: {file_id} Finished ===\n")
-        elif query.startswith('load-log:'):
-            log_name = query.split(':')[1]
-            messages = load_log(file_name=log_name)
-
-            print(f"\n=== Loading log: {log_name}.log Finished ===\n")
-        else:
-            messages = query_api_command_line(client=client, query=query, messages=messages)
-            
+
+        baseline = snapshot() if args.profile else None
+
+        try:
+            if query == 'Clear':
+                messages = ConversationHistory()
+                messages.append(role='system', content=SYSTEM_PROMPT)
+
+                log_name = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
+            elif query.startswith('arxiv:') and ',' in query:
+                arxiv_ids = [arxiv_id.strip() for arxiv_id in query.split(':')[1].split(',') if arxiv_id.strip()]
+                if prefetcher is not None:
+                    for arxiv_id in arxiv_ids:
+                        prefetcher.wait(arxiv_id)
+                for msg in upload_files_from_arxiv(client=get_pinned_client(), arxiv_ids=arxiv_ids, retrieval=args.retrieval):
+                    if isinstance(msg, tuple):
+                        print(f"[{msg[0] or 'ARXIV'}]: {msg[1]}")
+                file_ids = msg
+
+                for arxiv_id, file_id in file_ids.items():
+                    messages.append(role='system', content=f'{scheme}://{file_id}')
+                    print(f"\n=== {action} {arxiv_id} {scheme}: {file_id} Finished ===")
+                    if args.prefetch:
+                        prefetch_references(arxiv_id)
+                print()
+            elif query.startswith('arxiv:'):
+                arxiv_id = query.split(':')[1]
+                if prefetcher is not None:
+                    # a paper being prefetched is finished rather than downloaded twice
+                    prefetcher.wait(arxiv_id)
+                if args.retrieval:
+                    steps = index_file_from_arxiv(arxiv_id=arxiv_id)
+                else:
+                    steps = upload_file_from_arxiv(client=get_pinned_client(), arxiv_id=arxiv_id)
+                for i, msg in enumerate(steps):
+                    print(f"[STEP {i + 1}]: {msg}")
+                file_id = msg
+
+                messages.append(role='system', content=f'{scheme}://{file_id}')
+
+                print(f"\n=== {action} {scheme}: {file_id} Finished ===\n")
+
+                if args.prefetch:
+                    prefetch_references(arxiv_id)
+            elif query.startswith('file:'):
+                file_path = query.split(':')[1]
+                if args.retrieval:
+                    steps = index_file(file_path=file_path)
+                else:
+                    steps = upload_file(client=get_pinned_client(), file_path=file_path)
+                for i, msg in enumerate(steps):
+                    print(f"[STEP {i + 1} / 2]: {msg}")
+                file_id = msg
+                messages.append(role='system', content=f'{scheme}://{file_id}')
+
+                print(f"\n=== {action} {scheme}: {file_id} Finished ===\n")
+            elif query.startswith('delete:') and args.retrieval:
+                file_name = query.split(':')[1].split('/')[-1]
+
+                # indexed papers are only detached from the chat, the local index is kept
+                doc_id = lookup_doc_id(file_name=file_name)
+                if doc_id is not None:
+                    messages.remove(role='system', content=f'docid://{doc_id}')
+                    print(f"\n=== Removing docid: {doc_id} Finished ===\n")
+            elif query.startswith('delete:'):
+                file_name = query.split(':')[1].split('/')[-1]
+
+                file_id = get_file_id(client=get_client(), file_name=file_name)
+                if file_id is not None:
+                    delete_file(client=get_client(), file_id=file_id)
+
+                    # remove the file in the message history.
+                    messages.remove(role='system', content=f'fileid://{file_id}')
+                    print(f"\n=== Deleting file id: {file_id} Finished ===\n")
+            elif query.startswith('load-log:'):
+                # the beginning of the name is enough, e.g. the day
+                log_name = resolve_log_name(prefix=query.split(':')[1].strip()) or query.split(':')[1]
+                messages = load_log(file_name=log_name)
+
+                print(f"\n=== Loading log: {log_name} Finished ===\n")
+            elif query.startswith('list-logs:'):
+                page = int(query.split(':')[1] or 1)
+                entries, num_pages = list_logs(page=page)
+                for entry in entries:
+                    print(format_log_entry(entry))
+
+                print(f"\n=== Logs page {page} / {num_pages}, load one with 'load-log:<file_name>' ===\n")
+            elif query.startswith('search-logs:'):
+                keyword = query.split(':', 1)[1].strip()
+                entries = search_logs(query=keyword)
+                for i, entry in enumerate(entries):
+                    print(f"[{i + 1}] {format_log_entry(entry)}")
+
+                print(f"\n=== Searching logs {keyword}: {len(entries)} logs found, load one with 'load-log:<file_name>' ===\n")
+            elif query.startswith('read-log:'):
+                # large histories are read page by page, without loading them
+                name, page = (query.split(':')[1:] + [''])[:2]
+                read_name = resolve_log_name(prefix=name.strip())
+                if read_name is None:
+                    raise FileNotFoundError(f"Log {name} not found.")
+
+                page = int(page or 1)
+                log_page, num_pages = load_log_page(log_name=read_name, page=page)
+                for message in log_page:
+                    print(f"{message['role'].upper()}: {message['content']}\n")
+
+                print(f"=== Log {read_name} page {page} / {num_pages} ===\n")
+            elif query.startswith('search:'):
+                keyword = query.split(':', 1)[1].strip()
+
+                # entries are printed as soon as their page arrives
+                i = 0
+                for entry in search_arxiv(keyword=keyword):
+                    i += 1
+                    print(f"[{i}] {format_arxiv_entry(entry)}")
+
+                print(f"\n=== Searching {keyword}: {i} papers found, load them with 'arxiv:<arxiv_id>' ===\n")
+            else:
+                messages = query_api_command_line(client=get_client(), query=query, messages=messages)
+        except Exception as e:
+            # report the failure and keep the session alive
+            print(f"\n=== Error: {e} ===\n")
+            continue
+        finally:
+            if args.profile:
+                print(format_profile(baseline=baseline) + "\n")
+
         log_history(history=messages, file_name=log_name)
 
 
@@ -3,8 +3,8 @@
 '''
 Author             : 陈蔚 (weichen.cw@zju.edu.cn)
 Date               : 2024-08-17 14:46
-Last Modified By   : 陈蔚 (weichen.cw@zju.edu.cn)
-Last Modified Date : 2024-08-20 13:28
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:28
 Description        : Arugments
 -------- 
 Copyright (c) 2024 Wei Chen. 
@@ -13,7 +13,8 @@ Copyright (c) 2024 Wei Chen.
 import argparse
 from argparse import Namespace
 
-from src.config_and_variables import HTTP_PROXY, ALL_PROXY, NO_PROXY
+from src.config_and_variables import HTTP_PROXY, ALL_PROXY, NO_PROXY, RETRIEVAL_MODE, BATCH_MAX_WORKERS
+from src.config_and_variables import PREFETCH_REFERENCES, DISKLESS_INGEST, LIFECYCLE_INTERVAL, LIFECYCLE_FLAG_INTERVAL
 
 
 def get_args() -> Namespace:
@@ -25,7 +26,54 @@ def get_args() -> Namespace:
         arguments of the program
     """
     parser = argparse.ArgumentParser(description='Paper Reading LLM Arguments.')
-    parser.add_argument('--accessKey', '-a', type=str, default=None, help='DashScope API Key')
+    parser.add_argument('--accessKey', '-a', type=str, default=None, help='DashScope API Key, several keys separated by commas')
+    parser.add_argument(
+        '--retrieval', '-r', action='store_true', default=RETRIEVAL_MODE,
+        help='Index papers locally and send only the passages relevant to each query'
+    )
+    parser.add_argument(
+        '--prefetch', action='store_true', default=PREFETCH_REFERENCES,
+        help='Download the ArXiv papers cited by each paper loaded with arxiv: in the background'
+    )
+    parser.add_argument(
+        '--lifecycle', type=float, nargs='?', const=LIFECYCLE_FLAG_INTERVAL, default=LIFECYCLE_INTERVAL, metavar='SECONDS',
+        help='Delete idle or over quota local papers and remote files in the background, every SECONDS seconds '
+             f'(by default {LIFECYCLE_FLAG_INTERVAL})'
+    )
+    parser.add_argument(
+        '--profile', '-p', action='store_true', default=False,
+        help='Print the time spent in each stage after each command (command line only)'
+    )
+
+    args = parser.parse_args()
+
+    assert args.accessKey is not None, 'Please set your DashScope API Key.'
+
+    return args
+
+
+def get_batch_args() -> Namespace:
+    """Parse and return the arguments of the batch mode.
+
+    Returns
+    -------
+    Namespace
+        arguments of the batch mode
+    """
+    parser = argparse.ArgumentParser(description='Paper Reading LLM Batch Arguments.')
+    parser.add_argument('--accessKey', '-a', type=str, default=None, help='DashScope API Key, several keys separated by commas')
+    parser.add_argument('--manifest', '-m', type=str, required=True, help='JSONL file of papers and their questions')
+    parser.add_argument('--output', '-o', type=str, required=True, help='JSONL file the answers are appended to')
+    parser.add_argument('--workers', '-w', type=int, default=BATCH_MAX_WORKERS, help='Papers processed at the same time')
+    parser.add_argument(
+        '--retrieval', '-r', action='store_true', default=RETRIEVAL_MODE,
+        help='Index papers locally and send only the passages relevant to each query'
+    )
+    parser.add_argument(
+        '--diskless', '-d', action='store_true', default=DISKLESS_INGEST,
+        help='Upload ArXiv papers as they are downloaded, without storing them in the file directory'
+    )
+    parser.add_argument('--profile', '-p', action='store_true', default=False, help='Print the time spent in each stage at the end')
 
     args = parser.parse_args()
 
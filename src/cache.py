@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 12:45
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:25
+Description        : Persistent key-value cache with TTL and LRU eviction.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, NamedTuple, Optional
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key             TEXT PRIMARY KEY,
+    value           BLOB NOT NULL,
+    etag            TEXT,
+    last_modified   TEXT,
+    fetched_at      REAL NOT NULL,
+    accessed_at     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cache_accessed_at ON cache (accessed_at);
+"""
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+
+class DiskCache:
+    """Key-value cache backed by SQLite, fronted by an in-memory LRU.
+
+    Entries older than `ttl` seconds are still returned by `get` so that they can be revalidated
+    with their HTTP validators (ETag / Last-Modified), see `is_fresh` and `touch`. The database keeps
+    at most `max_entries` entries, evicting the least recently used ones.
+
+    Parameters
+    ----------
+    path : str
+        path to the SQLite database
+    ttl : float
+        seconds during which an entry is fresh
+    max_entries : int
+        maximum number of entries kept on disk
+    memory_entries : int, optional
+        maximum number of entries kept in memory, by default 1024
+    access_batch : int, optional
+        in-memory hits whose access time is written back to disk at once, by default 256
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int, memory_entries: int = 1024, access_batch: int = 256) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.access_batch = access_batch
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._accessed = {}     # access times of in-memory hits not written to disk yet, by key
+        self._connection = None
+        self._num_entries = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript(_SCHEMA)
+            self._connection.commit()
+            self._num_entries = self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+        return self._connection
+
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            evicted_key, _ = self._memory.popitem(last=False)
+            if evicted_key in self._accessed:
+                self._flush_accesses()
+
+    def _flush_accesses(self) -> None:
+        """Write back the access times of in-memory hits, for the least recently used eviction on disk."""
+        if len(self._accessed) == 0:
+            return
+
+        conn = self._get_connection()
+        conn.executemany(
+            "UPDATE cache SET accessed_at = ? WHERE key = ? AND accessed_at < ?",
+            [(accessed_at, key, accessed_at) for key, accessed_at in self._accessed.items()]
+        )
+        conn.commit()
+        self._accessed.clear()
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        """Whether an entry is younger than the TTL.
+
+        Parameters
+        ----------
+        entry : CacheEntry
+            entry returned by `get`
+
+        Returns
+        -------
+        bool
+            True if the entry can be used without revalidation
+        """
+        return time.time() - entry.fetched_at < self.ttl
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Get an entry, fresh or stale.
+
+        Parameters
+        ----------
+        key : str
+            key of the entry
+
+        Returns
+        -------
+        Optional[CacheEntry]
+            cached entry, None if missing
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                # written back in batches, rather than one transaction per hit
+                self._accessed[key] = time.time()
+                if len(self._accessed) >= self.access_batch:
+                    self._flush_accesses()
+                return entry
+
+            conn = self._get_connection()
+            row = conn.execute(
+                "SELECT value, etag, last_modified, fetched_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+
+            entry = CacheEntry(pickle.loads(row[0]), row[1], row[2], row[3])
+            self._remember(key, entry)
+
+        return entry
+
+    def set(self, key: str, value: Any, etag: str = None, last_modified: str = None) -> None:
+        """Store an entry, evicting the least recently used entries beyond `max_entries`.
+
+        Parameters
+        ----------
+        key : str
+            key of the entry
+        value : Any
+            picklable value
+        etag : str, optional
+            ETag header of the response, by default None
+        last_modified : str, optional
+            Last-Modified header of the response, by default None
+        """
+        now = time.time()
+        entry = CacheEntry(value, etag, last_modified, now)
+
+        with self._lock:
+            conn = self._get_connection()
+            exists = conn.execute("SELECT 1 FROM cache WHERE key = ?", (key,)).fetchone() is not None
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, etag, last_modified, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, pickle.dumps(value), etag, last_modified, now, now)
+            )
+            if not exists:
+                self._num_entries += 1
+
+            if self._num_entries > self.max_entries:
+                # entries hit in memory are not evicted as if unused
+                self._flush_accesses()
+                num_evicted = self._num_entries - self.max_entries
+                evicted = conn.execute(
+                    "SELECT key FROM cache ORDER BY accessed_at LIMIT ?", (num_evicted,)
+                ).fetchall()
+                conn.executemany("DELETE FROM cache WHERE key = ?", evicted)
+                for (evicted_key,) in evicted:
+                    self._memory.pop(evicted_key, None)
+                self._num_entries -= len(evicted)
+
+            conn.commit()
+            self._remember(key, entry)
+
+    def touch(self, key: str) -> None:
+        """Mark an entry as fresh again, e.g. after a `304 Not Modified` response.
+
+        Parameters
+        ----------
+        key : str
+            key of the entry
+        """
+        now = time.time()
+
+        with self._lock:
+            conn = self._get_connection()
+            conn.execute("UPDATE cache SET fetched_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+            conn.commit()
+
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._remember(key, entry._replace(fetched_at=now))
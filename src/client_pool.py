@@ -0,0 +1,675 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 13:13
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:40
+Description        : Pool of API keys and endpoints, balanced by outstanding requests, with failover.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Any, AsyncGenerator, Iterable, List, Optional, Union
+
+from src.config_and_variables import CLIENT_FAILURE_THRESHOLD, CLIENT_COOLDOWN, CLIENT_NOT_FOUND_TTL
+from src.file_registry import set_file_owners, claim_unowned_files, lookup_file_owners
+from src.metrics import increment
+from src.rate_limit import call_with_retry, async_call_with_retry, is_retryable, scale_upstream
+
+
+FILE_ID_PATTERN = re.compile(r'fileid://([\w-]+)')
+NOT_FOUND_MAX_ENTRIES = 4096    # file ids found by no key, remembered at most
+
+
+def split_entries(value: Union[str, List[str]] = None) -> List[str]:
+    """Split comma separated keys or endpoints, e.g. `--accessKey sk-a,sk-b`.
+
+    Parameters
+    ----------
+    value : Union[str, List[str]], optional
+        comma separated entries, or a list of them, by default None
+
+    Returns
+    -------
+    List[str]
+        non-empty entries
+    """
+    if isinstance(value, str):
+        value = value.split(',')
+
+    return [entry.strip() for entry in value if entry.strip()]
+
+
+def get_owner(api_key: str = None, base_url: str = None) -> str:
+    """Id of the file store of a key on an endpoint, recorded in the registry instead of the key itself.
+
+    Parameters
+    ----------
+    api_key : str, optional
+        API key, by default None
+    base_url : str, optional
+        endpoint, by default None
+
+    Returns
+    -------
+    str
+        16 hexadecimal digits
+    """
+    return hashlib.sha256(f"{base_url}\n{api_key}".encode('utf-8')).hexdigest()[:16]
+
+
+def is_health_failure(exception: Exception = None) -> bool:
+    """Whether a failed call says something about the key or endpoint, rather than about the request."""
+    return is_retryable(exception) or getattr(exception, "status_code", None) in (401, 403)
+
+
+class CircuitBreaker:
+    """Take a key out of the pool after `failure_threshold` consecutive failures. After `cooldown`
+    seconds a single request probes it: the key is back on success, out again on failure.
+
+    Not thread-safe, guarded by the lock of the pool.
+
+    Parameters
+    ----------
+    failure_threshold : int, optional
+        consecutive failures opening the circuit, by default CLIENT_FAILURE_THRESHOLD
+    cooldown : float, optional
+        seconds before a probe request, by default CLIENT_COOLDOWN
+    """
+
+    __slots__ = ('failure_threshold', 'cooldown', 'failures', 'opened_at', 'probing')
+
+    def __init__(self, failure_threshold: int = CLIENT_FAILURE_THRESHOLD, cooldown: float = CLIENT_COOLDOWN) -> None:
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def available(self, now: float) -> bool:
+        if self.opened_at is None:
+            return True
+
+        return not self.probing and now - self.opened_at >= self.cooldown
+
+    def retry_in(self, now: float) -> float:
+        """Seconds before the key may be tried again, 0 if a probe is already in flight."""
+        return max(0.0, self.opened_at + self.cooldown - now) if self.opened_at is not None else 0.0
+
+    def on_start(self, now: float) -> None:
+        if self.opened_at is not None and now - self.opened_at >= self.cooldown:
+            self.probing = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def end_probe(self) -> None:
+        """Forget a probe which ended without telling whether the key works, e.g. a stream closed early,
+        so that the next request probes again."""
+        self.probing = False
+
+    def record_failure(self, now: float) -> bool:
+        """Count a failure, returning True if it opens the circuit."""
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.failure_threshold:
+            opened = self.opened_at is None
+            self.opened_at = now
+            return opened
+
+        return False
+
+
+class KeyUnavailableError(RuntimeError):
+    """Raised when the only key able to serve a request, the one storing its files, is out of the pool."""
+
+
+class PoolMember:
+    """Client of one API key on one endpoint.
+
+    Parameters
+    ----------
+    client : Any
+        `OpenAI` or `AsyncOpenAI` client
+    owner : str
+        id of the file store of the key, see `get_owner`
+    """
+
+    __slots__ = ('client', 'owner', 'outstanding', 'breaker')
+
+    def __init__(self, client: Any, owner: str) -> None:
+        self.client = client
+        self.owner = owner
+        self.outstanding = 0
+        self.breaker = CircuitBreaker()
+
+
+class _BaseClientPool:
+    """Members, selection and accounting shared by `ClientPool` and `AsyncClientPool`.
+
+    Keys and endpoints are paired one to one, or a single endpoint (key) is shared by every key
+    (endpoint). Requests go to the available member with the fewest outstanding requests, except
+    requests about files, which go to the member whose file store holds them.
+    """
+
+    owner = None    # any member, see `pinned`
+
+    def __init__(self, client_class: type, api_keys: Union[str, List[str]] = None, endpoints: Union[str, List[str]] = None, **kwargs) -> None:
+        api_keys, endpoints = split_entries(api_keys), split_entries(endpoints)
+        if len(api_keys) == len(endpoints):
+            pairs = list(zip(api_keys, endpoints))
+        elif len(endpoints) == 1:
+            pairs = [(api_key, endpoints[0]) for api_key in api_keys]
+        elif len(api_keys) == 1:
+            pairs = [(api_keys[0], endpoint) for endpoint in endpoints]
+        else:
+            raise ValueError(f"Got {len(api_keys)} keys for {len(endpoints)} endpoints, give one of them or as many of each.")
+
+        self.members = [
+            PoolMember(client=client_class(api_key=api_key, base_url=endpoint, **kwargs), owner=get_owner(api_key, endpoint))
+            for api_key, endpoint in dict.fromkeys(pairs)
+        ]
+        self._by_owner = {member.owner: member for member in self.members}
+        self._lock = threading.Lock()
+        self._next = 0
+        self._not_found = OrderedDict()     # `time.monotonic()` when each file id was found by no key
+
+        # rate limits are per key, so the pool serves as many requests as its keys together
+        for upstream in ("files", "chat"):
+            scale_upstream(upstream, len(self.members))
+
+        if len(self.members) == 1:
+            claim_unowned_files(owner=self.members[0].owner)
+
+    def _select(self, owner: str = None) -> PoolMember:
+        """Take the member of `owner`, or the available member with the fewest outstanding requests.
+
+        Raises
+        ------
+        KeyUnavailableError
+            raised when the member of `owner` is taken out of the pool, rather than waiting on a failing key
+        """
+        now = time.monotonic()
+        with self._lock:
+            if owner is not None:
+                member = self._by_owner[owner]
+                if not member.breaker.available(now):
+                    raise KeyUnavailableError(
+                        f"The key storing the files of this chat is failing (owner {owner}), "
+                        f"please retry in {member.breaker.retry_in(now):.0f}s."
+                    )
+            else:
+                # rotate the starting point, so that ties are spread over the members
+                members = self.members[self._next:] + self.members[:self._next]
+                self._next = (self._next + 1) % len(self.members)
+                available = [member for member in members if member.breaker.available(now)] or members
+                member = min(available, key=lambda member: member.outstanding)
+
+            member.outstanding += 1
+            member.breaker.on_start(now)
+
+        return member
+
+    def _release(self, member: PoolMember, exception: Exception = None) -> None:
+        with self._lock:
+            member.outstanding -= 1
+            if exception is None or not is_health_failure(exception):
+                # e.g. a 400 for a bad request, answered by a working key
+                member.breaker.record_success()
+            elif member.breaker.record_failure(time.monotonic()):
+                increment("client_circuit_opened_total", member=member.owner)
+
+        increment("client_requests_total", member=member.owner, result="ok" if exception is None else "failed")
+
+    def _owner_of(self, file_ids: Iterable[str], resolved: dict) -> Optional[str]:
+        # files of keys no longer in the pool are left to fail on any key
+        owners = {owner for owner in resolved.values() if owner in self._by_owner}
+        if len(owners) > 1:
+            raise ValueError(f"Files {', '.join(file_ids)} are stored by different keys and cannot be used in one chat.")
+
+        return owners.pop() if len(owners) > 0 else None
+
+    def _record_owners(self, member: PoolMember, remote_files: list) -> None:
+        set_file_owners(remote_files=remote_files, owner=member.owner)
+        with self._lock:
+            for remote_file in remote_files:
+                self._not_found.pop(remote_file.id, None)
+
+    def _probe_targets(self, file_id: str) -> Optional[List[PoolMember]]:
+        """Members to ask about a file missing from the registry, None if it was recently found by no key."""
+        now = time.monotonic()
+        with self._lock:
+            found_at = self._not_found.get(file_id)
+            if found_at is not None and now - found_at < CLIENT_NOT_FOUND_TTL:
+                return None
+
+            # keys out of the pool are not asked, their answer would only be an error
+            return [member for member in self.members if member.breaker.available(now)]
+
+    def _record_not_found(self, file_id: str, num_asked: int) -> None:
+        # only an answer of every key says the file is nowhere
+        if num_asked < len(self.members):
+            return
+
+        with self._lock:
+            self._not_found[file_id] = time.monotonic()
+            self._not_found.move_to_end(file_id)
+            while len(self._not_found) > NOT_FOUND_MAX_ENTRIES:
+                self._not_found.popitem(last=False)
+
+
+class _TrackedStream:
+    """Streamed completion counted as outstanding on its member until consumed, closed or dropped.
+
+    Parameters
+    ----------
+    pool : _BaseClientPool
+        pool of the member
+    member : PoolMember
+        member serving the completion
+    stream : Any
+        stream returned by `client.chat.completions.create(..., stream=True)`
+    """
+
+    def __init__(self, pool: _BaseClientPool, member: PoolMember, stream: Any) -> None:
+        self._pool = pool
+        self._member = member
+        self._stream = stream
+        self._iterator = None
+        self._released = False
+
+    def _release(self, exception: Exception = None) -> None:
+        if not self._released:
+            self._released = True
+            self._pool._release(self._member, exception)
+
+    def __iter__(self) -> "_TrackedStream":
+        return self
+
+    def __next__(self) -> Any:
+        if self._iterator is None:
+            self._iterator = iter(self._stream)
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            self._release()
+            raise
+        except Exception as e:
+            self._release(e)
+            raise
+
+    def _abandon(self) -> None:
+        # dropped before the end, neither a success nor a failure of the key
+        if not self._released:
+            self._released = True
+            with self._pool._lock:
+                self._member.outstanding -= 1
+                self._member.breaker.end_probe()
+
+    def close(self) -> None:
+        getattr(self._stream, "close", lambda: None)()
+        self._abandon()
+
+    def __del__(self) -> None:
+        self.close()
+
+
+class _AsyncTrackedStream(_TrackedStream):
+    """Asynchronous version of `_TrackedStream`."""
+
+    def __aiter__(self) -> "_AsyncTrackedStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._iterator is None:
+            self._iterator = self._stream.__aiter__()
+        try:
+            return await self._iterator.__anext__()
+        except StopAsyncIteration:
+            self._release()
+            raise
+        except Exception as e:
+            self._release(e)
+            raise
+
+    def close(self) -> None:
+        # the asynchronous stream is closed by its own finalizer
+        self._abandon()
+
+
+class _Files:
+
+    def __init__(self, pool: "ClientPool", owner: str = None) -> None:
+        self._pool = pool
+        self._owner = owner
+
+    def create(self, **kwargs) -> Any:
+        member = self._pool._select(owner=self._owner)
+        try:
+            file_object = member.client.files.create(**kwargs)
+        except Exception as e:
+            self._pool._release(member, e)
+            raise
+        self._pool._release(member)
+
+        self._pool._record_owners(member, [file_object])
+        return file_object
+
+    def list(self) -> "FileListing":
+        # every page of every available key is listed, a failure fails the whole listing so that no file is dropped from the registry
+        listing = FileListing()
+        for member in self._pool.members:
+            try:
+                self._pool._select(owner=member.owner)
+            except KeyUnavailableError:
+                listing.unlisted_owners.append(member.owner)
+                continue
+            try:
+                member_files = list(member.client.files.list())
+            except Exception as e:
+                self._pool._release(member, e)
+                raise
+            self._pool._release(member)
+
+            self._pool._record_owners(member, member_files)
+            listing.extend(member_files)
+
+        listing.check(self._pool)
+        return listing
+
+    def delete(self, file_id: str = None) -> Any:
+        owner = self._pool.owner_of([file_id])
+        if owner is None:
+            from openai import NotFoundError
+            raise NotFoundError(f"File {file_id} not found by any key.", response=_not_found_response(), body=None)
+
+        member = self._pool._select(owner=owner)
+        try:
+            result = member.client.files.delete(file_id)
+        except Exception as e:
+            self._pool._release(member, e)
+            raise
+        self._pool._release(member)
+
+        return result
+
+
+class FileListing(list):
+    """Files of every key of a pool, except the keys out of the pool, whose files are left in the registry.
+
+    Attributes
+    ----------
+    unlisted_owners : List[str]
+        owners of the keys which could not be listed
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.unlisted_owners = []
+
+    def check(self, pool: "_BaseClientPool") -> None:
+        """Raise `KeyUnavailableError` if no key of `pool` could be listed."""
+        if len(self.unlisted_owners) == len(pool.members):
+            raise KeyUnavailableError("No key of the pool is available to list the files, please retry later.")
+
+
+class _AsyncFileListing(FileListing):
+    """Asynchronous version of `FileListing`, filled while iterated with `async for`."""
+
+    def __init__(self, files: "_AsyncFiles") -> None:
+        super().__init__()
+        self._files = files
+
+    async def __aiter__(self) -> AsyncGenerator[Any, None]:
+        async for file in self._files._list(self):
+            self.append(file)
+            yield file
+
+
+class _Completions:
+
+    def __init__(self, pool: "ClientPool") -> None:
+        self._pool = pool
+
+    def create(self, messages: List[dict] = None, **kwargs) -> Any:
+        # a chat about uploaded files can only be answered with the key storing them
+        owner = self._pool.owner_of(FILE_ID_PATTERN.findall('\n'.join(
+            message['content'] for message in messages if message['role'] == 'system'
+        )))
+
+        member = self._pool._select(owner=owner)
+        try:
+            completion = member.client.chat.completions.create(messages=messages, **kwargs)
+        except Exception as e:
+            self._pool._release(member, e)
+            raise
+
+        if kwargs.get("stream"):
+            return _TrackedStream(self._pool, member, completion)
+
+        self._pool._release(member)
+        return completion
+
+
+def _not_found_response() -> Any:
+    import httpx
+    return httpx.Response(404, request=httpx.Request("GET", "https://localhost/files"))
+
+
+class ClientPool(_BaseClientPool):
+    """Drop-in replacement of `OpenAI` for `client.files` and `client.chat.completions`, spreading
+    the requests over several API keys and endpoints.
+
+    Parameters
+    ----------
+    api_keys : Union[str, List[str]], optional
+        API keys, comma separated or as a list, by default None
+    endpoints : Union[str, List[str]], optional
+        base urls, comma separated or as a list, by default None
+    **kwargs
+        arguments of `OpenAI`, e.g. `max_retries`
+    """
+
+    def __init__(self, api_keys: Union[str, List[str]] = None, endpoints: Union[str, List[str]] = None, **kwargs) -> None:
+        from openai import OpenAI
+
+        super().__init__(OpenAI, api_keys=api_keys, endpoints=endpoints, **kwargs)
+        self.files = _Files(self)
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def owner_of(self, file_ids: List[str] = None) -> Optional[str]:
+        """Find the key storing files, asking every key about files not in the registry. Files found by
+        no key are not asked about again for `CLIENT_NOT_FOUND_TTL` seconds.
+
+        Parameters
+        ----------
+        file_ids : List[str], optional
+            remote file ids, by default None
+
+        Returns
+        -------
+        Optional[str]
+            owner of the files, None if there is no file or no key stores them
+
+        Raises
+        ------
+        ValueError
+            raised when the files are stored by different keys
+        """
+        from openai import NotFoundError
+
+        resolved = lookup_file_owners(file_ids=file_ids)
+        for file_id in file_ids:
+            members = None if file_id in resolved else self._probe_targets(file_id)
+            if members is None:
+                continue
+
+            for member in members:
+                try:
+                    file_object = call_with_retry("files", member.client.files.retrieve, file_id)
+                except NotFoundError:
+                    continue
+                self._record_owners(member, [file_object])
+                resolved[file_id] = member.owner
+                break
+            else:
+                self._record_not_found(file_id, num_asked=len(members))
+
+        return self._owner_of(file_ids, resolved)
+
+    def pinned(self, file_ids: List[str] = None) -> Union["ClientPool", SimpleNamespace]:
+        """Client uploading to the key storing `file_ids`, e.g. the files already attached to a chat,
+        so that the chat keeps all its files in one file store.
+
+        Parameters
+        ----------
+        file_ids : List[str], optional
+            remote file ids, by default None
+
+        Returns
+        -------
+        Union[ClientPool, SimpleNamespace]
+            the pool itself if there is no file, otherwise a view of it with the same interface
+        """
+        owner = self.owner_of(file_ids=file_ids or [])
+        if owner is None:
+            return self
+
+        return SimpleNamespace(owner=owner, files=_Files(self, owner=owner), chat=self.chat)
+
+
+class _AsyncFiles(_Files):
+
+    async def create(self, **kwargs) -> Any:
+        member = self._pool._select(owner=self._owner)
+        try:
+            file_object = await member.client.files.create(**kwargs)
+        except Exception as e:
+            self._pool._release(member, e)
+            raise
+        self._pool._release(member)
+
+        self._pool._record_owners(member, [file_object])
+        return file_object
+
+    def list(self) -> _AsyncFileListing:
+        # iterated with `async for`, as the listing of `AsyncOpenAI`
+        return _AsyncFileListing(self)
+
+    async def _list(self, listing: _AsyncFileListing) -> AsyncGenerator[Any, None]:
+        for member in self._pool.members:
+            try:
+                self._pool._select(owner=member.owner)
+            except KeyUnavailableError:
+                listing.unlisted_owners.append(member.owner)
+                continue
+            try:
+                member_files = [file async for file in member.client.files.list()]
+            except Exception as e:
+                self._pool._release(member, e)
+                raise
+            self._pool._release(member)
+
+            self._pool._record_owners(member, member_files)
+            for file in member_files:
+                yield file
+
+        listing.check(self._pool)
+
+    async def delete(self, file_id: str = None) -> Any:
+        owner = await self._pool.owner_of([file_id])
+        if owner is None:
+            from openai import NotFoundError
+            raise NotFoundError(f"File {file_id} not found by any key.", response=_not_found_response(), body=None)
+
+        member = self._pool._select(owner=owner)
+        try:
+            result = await member.client.files.delete(file_id)
+        except Exception as e:
+            self._pool._release(member, e)
+            raise
+        self._pool._release(member)
+
+        return result
+
+
+class _AsyncCompletions(_Completions):
+
+    async def create(self, messages: List[dict] = None, **kwargs) -> Any:
+        owner = await self._pool.owner_of(FILE_ID_PATTERN.findall('\n'.join(
+            message['content'] for message in messages if message['role'] == 'system'
+        )))
+
+        member = self._pool._select(owner=owner)
+        try:
+            completion = await member.client.chat.completions.create(messages=messages, **kwargs)
+        except Exception as e:
+            self._pool._release(member, e)
+            raise
+
+        if kwargs.get("stream"):
+            return _AsyncTrackedStream(self._pool, member, completion)
+
+        self._pool._release(member)
+        return completion
+
+
+class AsyncClientPool(_BaseClientPool):
+    """Asynchronous version of `ClientPool`, a drop-in replacement of `AsyncOpenAI`.
+
+    Parameters
+    ----------
+    api_keys : Union[str, List[str]], optional
+        API keys, comma separated or as a list, by default None
+    endpoints : Union[str, List[str]], optional
+        base urls, comma separated or as a list, by default None
+    **kwargs
+        arguments of `AsyncOpenAI`, e.g. `max_retries`
+    """
+
+    def __init__(self, api_keys: Union[str, List[str]] = None, endpoints: Union[str, List[str]] = None, **kwargs) -> None:
+        from openai import AsyncOpenAI
+
+        super().__init__(AsyncOpenAI, api_keys=api_keys, endpoints=endpoints, **kwargs)
+        self.files = _AsyncFiles(self)
+        self.chat = SimpleNamespace(completions=_AsyncCompletions(self))
+
+    async def owner_of(self, file_ids: List[str] = None) -> Optional[str]:
+        """Asynchronous version of `ClientPool.owner_of`."""
+        from openai import NotFoundError
+
+        resolved = lookup_file_owners(file_ids=file_ids)
+        for file_id in file_ids:
+            members = None if file_id in resolved else self._probe_targets(file_id)
+            if members is None:
+                continue
+
+            for member in members:
+                try:
+                    file_object = await async_call_with_retry("files", member.client.files.retrieve, file_id)
+                except NotFoundError:
+                    continue
+                self._record_owners(member, [file_object])
+                resolved[file_id] = member.owner
+                break
+            else:
+                self._record_not_found(file_id, num_asked=len(members))
+
+        return self._owner_of(file_ids, resolved)
+
+    async def pinned(self, file_ids: List[str] = None) -> Union["AsyncClientPool", SimpleNamespace]:
+        """Asynchronous version of `ClientPool.pinned`."""
+        owner = await self.owner_of(file_ids=file_ids or [])
+        if owner is None:
+            return self
+
+        return SimpleNamespace(owner=owner, files=_AsyncFiles(self, owner=owner), chat=self.chat)
@@ -3,8 +3,8 @@
 '''
 Author             : 陈蔚 (weichen.cw@zju.edu.cn)
 Date               : 2024-08-17 14:23
-Last Modified By   : 陈蔚 (weichen.cw@zju.edu.cn)
-Last Modified Date : 2024-10-17 13:07
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:30
 Description        : Configuration and global variables.
 -------- 
 Copyright (c) 2024 Wei Chen. 
@@ -21,24 +21,99 @@ NO_PROXY    = "localhost, 127.0.0.1, ::1"   # No proxy, no need to be changed. Y
 
 FILE_DIR        = "files"       # Temporary directory to store files
 LOG_DIR         = "logs"        # Log directory
-ENDPOINT        = "https://dashscope.aliyuncs.com/compatible-mode/v1"   # Endpoint
+LOG_FSYNC       = False         # Whether to fsync logs after each turn, safer but slower
+LOG_STATE_MAX_COUNT = 1024      # Maximum number of logs whose written messages are tracked in memory
+LOG_INDEX_FILE  = "index.db"    # Searchable index of the logs, stored under `LOG_DIR`
+LOG_PAGE_SIZE   = 20            # Logs listed by 'list-logs:', and messages shown by 'read-log:', per page
+LOG_SEARCH_MAX_RESULTS = 10     # Logs listed by 'search-logs:<keywords>' at most
+REGISTRY_FILE   = "registry.db" # Local file id registry, stored under `FILE_DIR`
+REGISTRY_REFRESH_INTERVAL = 300 # Minimum seconds between two remote listings on registry misses
+HASH_CHUNK_SIZE = 1 << 20       # Bytes read at a time when hashing files
+STARTUP_TIME_BUDGET = 0.5      # Seconds allowed for a cold start of `main.py`, checked by `benchmarks/startup.py`
+LOCAL_MAX_BYTES = 2 << 30       # Bytes of papers kept in `FILE_DIR`, the least recently used are evicted first, unlimited if None
+LOCAL_MAX_FILES = 1000          # Papers kept in `FILE_DIR`, unlimited if None
+REMOTE_MAX_BYTES = None         # Bytes of files kept uploaded by us, the least recently used are deleted first, unlimited if None
+REMOTE_MAX_FILES = 5000         # Files kept uploaded by us, below the file quota of DashScope, unlimited if None
+REMOTE_MAX_IDLE_DAYS = 30       # Files uploaded by us and unused for this many days are deleted, never if None
+LIFECYCLE_INTERVAL = None       # Seconds between two background passes enforcing the above, disabled if None, as they delete files ('--lifecycle')
+LIFECYCLE_FLAG_INTERVAL = 3600  # Seconds between two passes when enabled by '--lifecycle' without a value
+LIFECYCLE_GRACE_PERIOD = 600    # Seconds after its last use during which a file is never evicted
+
+# 3. Download Configuration
+
+ARXIV_API_URL           = "http://export.arxiv.org/api/query"   # ArXiv API endpoint
+DOWNLOAD_CHUNK_SIZE     = 1 << 16   # Bytes written at a time when downloading files
+DOWNLOAD_TIMEOUT        = 60        # Seconds before a stalled connection is given up
+HTTP_MAX_CONNECTIONS    = 16        # Size of the keep-alive connection pool
+PROGRESS_INTERVAL       = 0.5       # Minimum seconds between two progress messages
+ARXIV_MAX_WORKERS       = 4         # Papers downloaded/uploaded at the same time with 'arxiv:<id1>,<id2>,...'
+ARXIV_MAX_IDS_PER_QUERY = 100       # Arxiv ids resolved by one ArXiv API query in batch mode
+DISKLESS_INGEST         = False     # Whether batch mode pipes ArXiv downloads into uploads, without storing papers in `FILE_DIR`
+DISKLESS_SPOOL_MAX_BYTES = 32 << 20 # Bytes of a paper buffered in memory in diskless mode, beyond which it spills to a temporary file
+ARXIV_SEARCH_MAX_RESULTS = 100      # Entries listed by 'search:<keywords>' at most
+ARXIV_SEARCH_PAGE_SIZE  = 50        # Entries per ArXiv API query when searching, the first ones are shown after one query
+ARXIV_SEARCH_MAX_WORKERS = 4        # Search result pages fetched at the same time, still paced by the 'arxiv' rate limit
+BATCH_MAX_WORKERS       = 4         # Papers processed at the same time by `batch.py`
+PREFETCH_REFERENCES     = False     # Whether to prefetch in the background the ArXiv papers cited by papers loaded with 'arxiv:'
+PREFETCH_TOP_N          = 5         # Most cited papers prefetched per loaded paper
+PREFETCH_MAX_BYTES      = 200 << 20 # Bytes downloaded by the prefetcher per session at most
+PREFETCH_MAX_RATE       = 2 << 20   # Bytes per second downloaded by the prefetcher at most, unlimited if None
+PREFETCH_UPLOAD         = False     # Whether prefetched papers are also uploaded (indexed in retrieval mode), command line only for uploads
+ENDPOINT        = "https://dashscope.aliyuncs.com/compatible-mode/v1"   # Endpoint, several ones separated by commas are paired with the keys of `--accessKey`
 MODEL_TYPE      = "qwen-long"   # Model type
+CONTEXT_TOKEN_BUDGET = 16000    # Maximum (estimated) tokens of chat history sent with each query, oldest turns are dropped first
+TOKEN_CACHE_MAX_COUNT = 65536   # Maximum number of message token counts cached
+RETRIEVAL_MODE  = False         # Whether to index papers locally and send only relevant passages instead of whole `fileid://` documents
+RETRIEVAL_INDEX_FILE    = "retrieval.db"    # Local BM25 index of papers, stored under `FILE_DIR`
+RETRIEVAL_CHUNK_WORDS   = 200   # Words per indexed passage
+RETRIEVAL_CHUNK_OVERLAP = 50    # Words shared by two consecutive passages
+RETRIEVAL_TOP_K = 5             # Passages sent with each query in retrieval mode
 SYSTEM_PROMPT   = "You are an expert in the field of deep learning research."
 INSTRUCTION     = r"""
 === Instruction ===
 Chat with LLM about papers!
 
 1. Input 'Q' to exit / Input 'C' to clear history.
-2. Input 'arxiv:<arxiv_paper_id>', e.g. 'arxiv:2311.11100', to download and chat about the paper.
+2. Input 'arxiv:<arxiv_paper_id>', e.g. 'arxiv:2311.11100', to download and chat about the paper. Separate several ids by commas, e.g. 'arxiv:2311.11100,2402.14700', to load them at once.
 3. Input 'file:<your_file_path>', e.g. 'file:files/HowtoReadPaper.pdf', to upload and chat about the paper.
 4. Input 'delete:<arxiv_paper_id/file_name>', e.g. 'delete:2311.11100.pdf' or 'delete:HowtoReadPaper.pdf', to delete the paper.
-5. Input 'load-log:<file_name>' , e.g. 'load-log:2024-08-19_15-56-26', to load the chat history.
-6. It may take a while to download/upload the paper.
+5. Input 'load-log:<file_name>' , e.g. 'load-log:2024-08-19_15-56-26' or 'load-log:2024-08-19' for the latest one of the day, to load the chat history.
+6. Input 'list-logs:' or 'list-logs:<page>' to list the chat histories, 'search-logs:<keywords>' to find them by content, and 'read-log:<file_name>:<page>' to read one page by page.
+7. Input 'search:<keywords>', e.g. 'search:visual instruction tuning', to list papers on ArXiv, then load them with 'arxiv:'.
+8. It may take a while to download/upload the paper.
+9. With '--lifecycle', papers in 'files/' and remote files uploaded by this application are DELETED in the background when idle or over quota (see 'LIFECYCLE_*' in 'src/config_and_variables.py').
 
 === Instruction End ===
 """
 
-# 3. Gradio Configuration
+# 4. Rate Limit and Retry Configuration
+#   rate / burst    : sustained requests per second / maximum burst of the token bucket
+#   max_attempts    : attempts before giving up, only on network errors, 408, 429 and 5xx responses
+#   base_delay      : backoff before the first retry in seconds, doubled (with full jitter) on each retry
+#   max_delay       : upper bound of the backoff in seconds
+
+UPSTREAM_POLICIES = {
+    "arxiv":    {"rate": 1 / 3, "burst": 1,  "max_attempts": 4, "base_delay": 3.0, "max_delay": 30.0},  # ArXiv asks for 1 request / 3 seconds
+    "download": {"rate": 4,     "burst": 4,  "max_attempts": 4, "base_delay": 1.0, "max_delay": 20.0},
+    "files":    {"rate": 5,     "burst": 10, "max_attempts": 4, "base_delay": 1.0, "max_delay": 20.0},
+    "chat":     {"rate": 10,    "burst": 20, "max_attempts": 3, "base_delay": 1.0, "max_delay": 20.0},
+}
+# 'files' and 'chat' are policies per API key, scaled by the number of keys of the client pool
+
+CLIENT_FAILURE_THRESHOLD = 3    # Consecutive failures (network errors, 401, 403, 408, 429, 5xx) before a key is taken out of the pool
+CLIENT_COOLDOWN         = 30    # Seconds before a key taken out of the pool is tried again by one request
+CLIENT_NOT_FOUND_TTL    = 300   # Seconds during which a file id found by no key is not looked up again
+
+# 5. Cache Configuration
+
+CACHE_DIR               = "cache"   # Directory to store persistent caches
+ARXIV_CACHE_TTL         = 86400     # Seconds before a cached ArXiv response needs revalidation
+ARXIV_CACHE_MAX_ENTRIES = 10000     # Maximum number of ArXiv responses kept on disk
+USE_RESPONSE_CACHE      = True      # Whether to answer repeated questions on the same papers from the cache
+RESPONSE_CACHE_TTL      = 604800    # Seconds during which a cached answer is reused
+RESPONSE_CACHE_MAX_ENTRIES = 10000  # Maximum number of answers kept on disk
+
+# 6. Gradio Configuration
 
 LATEX_DELIMITERS    = [
     { "left": "$$",  "right": "$$",  "display": True  },
@@ -47,6 +122,12 @@ LATEX_DELIMITERS    = [
     { "left": "\\[", "right": "\\]", "display": True  },
 ]   # LaTeX delimiters
 
+STREAM_FLUSH_INTERVAL = 0.05    # Minimum seconds between two updates of a streamed answer in the Web APP
+WEBAPP_CONCURRENCY_LIMIT = 256  # Maximum number of requests served at the same time by the Web APP
+SESSION_MAX_COUNT   = 1024      # Maximum number of chat sessions kept in memory by the Web APP
+SESSION_IDLE_TIMEOUT = 3600     # Seconds after which an inactive chat session is evicted
+METRICS_PORT        = 9464      # Port of the Prometheus metrics endpoint served next to the Web APP, None to disable
+
 APP_TITLE       = "Paper Reading LLM"
 APP_DESCRIPTION = "Ask Paper Reading LLM any question!\n\nYou could specify a paper using Arxiv Id in format 'arxiv:2402.14700'. It may take a while to download the paper."
 APP_INSTRUCTION = r"""
@@ -56,9 +137,11 @@ APP_INSTRUCTION = r"""
 Ask the Paper Reading LLM any question! Here are some instructions that might be helpful:
 
 <ol>
-<li>You could specify a paper using arxiv id in format 'arxiv:<arxiv_id>', e.g. 'arxiv:2311.11100'.</li>
+<li>You could specify a paper using arxiv id in format 'arxiv:<arxiv_id>', e.g. 'arxiv:2311.11100', or several papers using 'arxiv:<arxiv_id>,<arxiv_id>,...'.</li>
 <li>You could specify a local paper using file path in format 'file:<your_file_path>', e.g. 'file:files/HowtoReadPaper.pdf'.</li>
 <li>You could delete a paper using file name in the format 'delete:<arxiv_id/file_name>', e.g. 'delete:2311.11100.pdf' or 'delete:HowtoReadPaper.pdf'.</li>
+<li>You could search papers on ArXiv using 'search:<keywords>', e.g. 'search:visual instruction tuning', then load them with 'arxiv:<arxiv_id>'.</li>
 <li>It may take a while to download/upload the paper.</li>
+<li>With '--lifecycle', papers in 'files/' and remote files uploaded by this application are <strong>deleted</strong> in the background when idle or over quota.</li>
 </ol>
 </div>"""
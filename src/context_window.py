@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 12:50
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 12:50
+Description        : Keep the messages sent to the LLM within a token budget.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import re
+import threading
+from collections import OrderedDict
+from typing import List
+
+from src.config_and_variables import CONTEXT_TOKEN_BUDGET, TOKEN_CACHE_MAX_COUNT
+
+
+MESSAGE_OVERHEAD = 4    # tokens taken by the role and separators of a message
+
+_CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')    # kana, CJK ideographs, hangul, full-width forms
+
+_token_counts = OrderedDict()
+_lock = threading.Lock()
+
+
+def count_tokens(content: str = None) -> int:
+    """Estimate the number of tokens of a message content, caching the result per content.
+
+    The estimate counts one token per CJK character and one token per 4 other characters, which is
+    close enough to the tokenizers of `qwen` / `gpt` models for budgeting purposes.
+
+    Parameters
+    ----------
+    content : str, optional
+        content of the message, by default None
+
+    Returns
+    -------
+    int
+        estimated number of tokens, including the message overhead
+    """
+    with _lock:
+        num_tokens = _token_counts.get(content)
+        if num_tokens is not None:
+            _token_counts.move_to_end(content)
+            return num_tokens
+
+    num_cjk = len(_CJK_PATTERN.findall(content))
+    num_tokens = MESSAGE_OVERHEAD + num_cjk + (len(content) - num_cjk + 3) // 4
+
+    with _lock:
+        _token_counts[content] = num_tokens
+        while len(_token_counts) > TOKEN_CACHE_MAX_COUNT:
+            _token_counts.popitem(last=False)
+
+    return num_tokens
+
+
+def fit_context(messages: List[dict] = None, budget: int = CONTEXT_TOKEN_BUDGET) -> List[dict]:
+    """Select the messages to be sent so that they fit in the token budget.
+
+    System messages (`SYSTEM_PROMPT` and `fileid://` entries) and the last message are always kept.
+    The remaining budget goes to the most recent turns, older turns being dropped first.
+
+    Parameters
+    ----------
+    messages : List[dict], optional
+        messages in the history, by default None
+    budget : int, optional
+        maximum number of tokens, by default CONTEXT_TOKEN_BUDGET
+
+    Returns
+    -------
+    List[dict]
+        messages to be sent, in their original order; `messages` itself if nothing is dropped
+    """
+    remaining = budget
+    for message in messages:
+        if message['role'] == 'system':
+            remaining -= count_tokens(message['content'])
+
+    # walk back from the latest message, keeping turns while they fit
+    first_kept = len(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i]['role'] == 'system':
+            continue
+
+        num_tokens = count_tokens(messages[i]['content'])
+        if num_tokens > remaining and first_kept < len(messages):
+            break
+
+        remaining -= num_tokens
+        first_kept = i
+
+    # do not start the conversation with an orphan answer
+    while first_kept < len(messages) - 1 and messages[first_kept]['role'] == 'assistant':
+        first_kept += 1
+
+    if all(message['role'] == 'system' for message in messages[:first_kept]):
+        return messages
+
+    return [
+        message for i, message in enumerate(messages) if i >= first_kept or message['role'] == 'system'
+    ]
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 12:55
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:07
+Description        : Indexed conversation history, snapshotted to the OpenAI wire format.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+from collections.abc import Sequence
+from itertools import islice
+from typing import Iterable, Iterator, List, Union
+
+
+class Message:
+    """One message of a conversation.
+
+    Parameters
+    ----------
+    role : str
+        role of the message, 'system', 'user' or 'assistant'
+    content : str
+        content of the message
+    """
+
+    __slots__ = ('role', 'content', 'wire')
+
+    def __init__(self, role: str, content: str) -> None:
+        self.role = role
+        self.content = content
+        # built once, shared by every snapshot of the conversation
+        self.wire = {'role': role, 'content': content}
+
+
+class MessagesSnapshot(Sequence):
+    """Read-only view of the first messages of a conversation, in OpenAI format.
+
+    Conversations only append to their wire list in place and replace it on removal, so a
+    snapshot stays valid however the conversation changes afterwards.
+
+    Parameters
+    ----------
+    wire : List[dict]
+        wire list of the conversation
+    length : int
+        number of messages in the snapshot
+    """
+
+    __slots__ = ('_wire', '_length')
+
+    def __init__(self, wire: List[dict], length: int) -> None:
+        self._wire = wire
+        self._length = length
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[dict, List[dict]]:
+        if isinstance(index, slice):
+            return [self._wire[i] for i in range(*index.indices(self._length))]
+
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("snapshot index out of range")
+
+        return self._wire[index]
+
+    def __iter__(self) -> Iterator[dict]:
+        return islice(self._wire, self._length)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class ConversationHistory:
+    """Messages of a conversation, with system entries (`SYSTEM_PROMPT`, `fileid://`, `docid://`)
+    indexed by content so that deduplicating and finding them takes no scan.
+
+    Parameters
+    ----------
+    messages : Iterable[dict], optional
+        initial messages in OpenAI format, by default ()
+    """
+
+    __slots__ = ('_records', '_wire', '_system_index')
+
+    def __init__(self, messages: Iterable[dict] = ()) -> None:
+        self._records = []
+        self._wire = []
+        self._system_index = {}
+
+        for message in messages:
+            self.append(role=message['role'], content=message['content'])
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def append(self, role: str = None, content: str = None) -> None:
+        """Append a message, system entries being added only once.
+
+        Parameters
+        ----------
+        role : str, optional
+            role of the message, by default None
+        content : str, optional
+            content of the message, by default None
+        """
+        if role == 'system':
+            if content in self._system_index:
+                return
+
+            self._system_index[content] = len(self._records)
+
+        message = Message(role=role, content=content)
+        self._records.append(message)
+        self._wire.append(message.wire)
+
+    def remove(self, role: str = None, content: str = None) -> None:
+        """Remove every message with this role and content.
+
+        Parameters
+        ----------
+        role : str, optional
+            role of the message, by default None
+        content : str, optional
+            content of the message, by default None
+        """
+        if role == 'system':
+            if self._system_index.pop(content, None) is None:
+                return
+        elif not any(message.role == role and message.content == content for message in self._records):
+            return
+
+        # outstanding snapshots keep the previous lists
+        self._rebuild([
+            message for message in self._records if not (message.role == role and message.content == content)
+        ])
+
+    def pop(self) -> dict:
+        """Remove the last message, e.g. a query whose request failed.
+
+        Returns
+        -------
+        dict
+            removed message in OpenAI format
+        """
+        message = self._records[-1]
+        if message.role == 'system':
+            del self._system_index[message.content]
+
+        self._rebuild(self._records[:-1])
+        return message.wire
+
+    def _rebuild(self, records: List[Message]) -> None:
+        self._records = records
+        self._wire = [message.wire for message in records]
+        self._system_index = {
+            message.content: i for i, message in enumerate(records) if message.role == 'system'
+        }
+
+    def attachments(self, scheme: str = 'fileid') -> List[str]:
+        """Ids of the papers attached to the conversation.
+
+        Parameters
+        ----------
+        scheme : str, optional
+            'fileid' for uploaded files, 'docid' for indexed documents, by default 'fileid'
+
+        Returns
+        -------
+        List[str]
+            file or document ids, in attachment order
+        """
+        prefix = f'{scheme}://'
+        # copied at once, the conversation may be changed by another thread
+        return [content[len(prefix):] for content in list(self._system_index) if content.startswith(prefix)]
+
+    def to_messages(self) -> MessagesSnapshot:
+        """Snapshot the conversation in OpenAI format, without copying any message.
+
+        Returns
+        -------
+        MessagesSnapshot
+            messages at the time of the call, the same dicts being returned by every snapshot
+        """
+        return MessagesSnapshot(wire=self._wire, length=len(self._wire))
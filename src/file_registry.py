@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 12:42
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:40
+Description        : Local registry mapping uploaded files to their remote file ids.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from src.config_and_variables import FILE_DIR, REGISTRY_FILE, REGISTRY_REFRESH_INTERVAL
+from src.metrics import span
+from src.rate_limit import call_with_retry, async_call_with_retry
+
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id     TEXT PRIMARY KEY,
+    filename    TEXT NOT NULL,
+    sha256      TEXT,
+    created_at  INTEGER,
+    bytes       INTEGER,
+    last_used_at INTEGER,
+    owner       TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_filename ON files (filename);
+CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files (sha256);
+CREATE TABLE IF NOT EXISTS meta (
+    key         TEXT PRIMARY KEY,
+    value       TEXT
+);
+"""
+
+_lock = threading.RLock()
+_connection = None
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Open (once per process) the registry database under `FILE_DIR`.
+
+    Returns
+    -------
+    sqlite3.Connection
+        connection shared by all threads, guarded by `_lock`.
+    """
+    global _connection
+
+    if _connection is None:
+        if not os.path.exists(FILE_DIR):
+            os.makedirs(FILE_DIR)
+
+        _connection = sqlite3.connect(os.path.join(FILE_DIR, REGISTRY_FILE), check_same_thread=False)
+        _connection.executescript(_SCHEMA)
+
+        # registries created before the lifecycle and client pool columns
+        columns = {row[1] for row in _connection.execute("PRAGMA table_info(files)")}
+        for column, column_type in (("bytes", "INTEGER"), ("last_used_at", "INTEGER"), ("owner", "TEXT")):
+            if column not in columns:
+                _connection.execute(f"ALTER TABLE files ADD COLUMN {column} {column_type}")
+        _connection.commit()
+
+    return _connection
+
+
+def register_file(
+    file_id: str = None,
+    filename: str = None,
+    sha256: str = None,
+    created_at: int = None,
+    size: int = None
+) -> None:
+    """Record a remote file uploaded by us in the registry, overwriting any previous record of the same id.
+
+    Parameters
+    ----------
+    file_id : str, optional
+        remote file id, by default None
+    filename : str, optional
+        name of the file, by default None
+    sha256 : str, optional
+        hex digest of the file content, by default None
+    created_at : int, optional
+        creation timestamp, by default the current time
+    size : int, optional
+        size of the file in bytes, by default None
+    """
+    if created_at is None:
+        created_at = int(time.time())
+
+    with _lock:
+        conn = _get_connection()
+        # the owner recorded by the client pool is kept
+        conn.execute(
+            "INSERT INTO files (file_id, filename, sha256, created_at, bytes, last_used_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (file_id) DO UPDATE SET filename = excluded.filename, sha256 = excluded.sha256, "
+            "created_at = excluded.created_at, bytes = excluded.bytes, last_used_at = excluded.last_used_at",
+            (file_id, filename, sha256, created_at, size, int(time.time()))
+        )
+        conn.commit()
+
+
+def set_file_owners(remote_files: list = None, owner: str = None) -> None:
+    """Record which API key stores remote files, for `src/client_pool.py` to send their requests to it.
+
+    Parameters
+    ----------
+    remote_files : list, optional
+        file objects returned by `client.files.create` or `client.files.list`, by default None
+    owner : str, optional
+        id of the key storing the files, by default None
+    """
+    with _lock:
+        conn = _get_connection()
+        conn.executemany(
+            "INSERT INTO files (file_id, filename, created_at, bytes, owner) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (file_id) DO UPDATE SET owner = excluded.owner",
+            [(file.id, file.filename, file.created_at, getattr(file, "bytes", None), owner) for file in remote_files]
+        )
+        conn.commit()
+
+
+def claim_unowned_files(owner: str = None) -> None:
+    """Record files registered before the client pool as stored by `owner`, when it is the only key.
+
+    Parameters
+    ----------
+    owner : str, optional
+        id of the key, by default None
+    """
+    with _lock:
+        conn = _get_connection()
+        conn.execute("UPDATE files SET owner = ? WHERE owner IS NULL", (owner,))
+        conn.commit()
+
+
+def lookup_file_owners(file_ids: List[str] = None) -> Dict[str, str]:
+    """Look up which API keys store remote files.
+
+    Parameters
+    ----------
+    file_ids : List[str], optional
+        remote file ids, by default None
+
+    Returns
+    -------
+    Dict[str, str]
+        owner by file id, files of unknown owner being left out
+    """
+    with _lock:
+        conn = _get_connection()
+        return {
+            file_id: owner
+            for file_id in file_ids
+            for (owner,) in conn.execute("SELECT owner FROM files WHERE file_id = ? AND owner IS NOT NULL", (file_id,))
+        }
+
+
+def unregister_file(file_id: str = None) -> None:
+    """Remove a file from the registry, e.g. after `client.files.delete`.
+
+    Parameters
+    ----------
+    file_id : str, optional
+        remote file id, by default None
+    """
+    with _lock:
+        conn = _get_connection()
+        conn.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+        conn.commit()
+
+
+def touch_files(file_ids: List[str] = None) -> None:
+    """Record that remote files are in use, for the least recently used eviction of `src/lifecycle.py`.
+
+    Parameters
+    ----------
+    file_ids : List[str], optional
+        remote file ids, by default None
+    """
+    now = int(time.time())
+    with _lock:
+        conn = _get_connection()
+        conn.executemany("UPDATE files SET last_used_at = ? WHERE file_id = ?", [(now, file_id) for file_id in file_ids])
+        conn.commit()
+
+
+def list_uploaded_files() -> List[Tuple[str, str, int, int]]:
+    """List the remote files uploaded by us, i.e. with a known content hash, least recently used first.
+
+    Files only seen in remote listings may belong to other applications of the account, they are left out.
+
+    Returns
+    -------
+    List[Tuple[str, str, int, int]]
+        (file id, file name, size or 0 if unknown, last use or creation timestamp)
+    """
+    with _lock:
+        return _get_connection().execute(
+            "SELECT file_id, filename, COALESCE(bytes, 0), COALESCE(last_used_at, created_at, 0) AS last_used "
+            "FROM files WHERE sha256 IS NOT NULL ORDER BY last_used"
+        ).fetchall()
+
+
+def lookup_file_id(filename: str = None, sha256: str = None, owner: str = None) -> Optional[str]:
+    """Look up a file id locally, without any network round trip.
+
+    Parameters
+    ----------
+    filename : str, optional
+        name of the file, by default None
+    sha256 : str, optional
+        hex digest of the file content, takes precedence over `filename`, by default None
+    owner : str, optional
+        id of the API key the file must be stored by (or unknown), any key if None, by default None
+
+    Returns
+    -------
+    Optional[str]
+        file id of the most recent matching file, None if not registered
+    """
+    column, key = ("sha256", sha256) if sha256 is not None else ("filename", filename)
+    sql, params = f"SELECT file_id FROM files WHERE {column} = ?", (key,)
+    if owner is not None:
+        sql, params = sql + " AND (owner = ? OR owner IS NULL)", (key, owner)
+
+    with _lock:
+        row = _get_connection().execute(sql + " ORDER BY created_at DESC LIMIT 1", params).fetchone()
+
+    return None if row is None else row[0]
+
+
+def _should_refresh(force: bool = False) -> bool:
+    """Whether the refresh interval has elapsed since the last remote listing."""
+    if force:
+        return True
+
+    with _lock:
+        row = _get_connection().execute("SELECT value FROM meta WHERE key = 'last_refresh'").fetchone()
+
+    last_refresh = 0.0 if row is None else float(row[0])
+    return time.time() - last_refresh >= REGISTRY_REFRESH_INTERVAL
+
+
+def _apply_listing(remote_files: list = None, unlisted_owners: Iterable[str] = ()) -> None:
+    """Insert new remote files and drop local records whose remote file disappeared.
+
+    `remote_files` must be the complete listing, every page of it: a record missing from it,
+    content hash included, is dropped. Records of `unlisted_owners`, keys of a client pool which
+    could not be listed, are kept, as are records of no known key if there is any.
+    """
+    unlisted_owners = set(unlisted_owners)
+    with _lock:
+        conn = _get_connection()
+        conn.executemany(
+            "INSERT OR IGNORE INTO files (file_id, filename, created_at, bytes) VALUES (?, ?, ?, ?)",
+            [(file.id, file.filename, file.created_at, getattr(file, "bytes", None)) for file in remote_files]
+        )
+
+        remote_ids = {file.id for file in remote_files}
+        stale_ids = [
+            (file_id,) for file_id, owner in conn.execute("SELECT file_id, owner FROM files")
+            if file_id not in remote_ids and not (unlisted_owners and (owner is None or owner in unlisted_owners))
+        ]
+        conn.executemany("DELETE FROM files WHERE file_id = ?", stale_ids)
+
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_refresh', ?)", (str(time.time()),))
+        conn.commit()
+
+
+def refresh_registry(client: OpenAI = None, force: bool = False) -> bool:
+    """Synchronize the registry with the remote file listing.
+
+    New remote files are inserted (keeping the content hashes we already know), and local records
+    whose remote file disappeared are dropped. Every page of the listing is fetched before anything
+    is dropped, a failure leaves the registry untouched, and so do the keys of a client pool which
+    could not be listed. Unless `force` is set, the remote listing is fetched at most once every
+    `REGISTRY_REFRESH_INTERVAL` seconds.
+
+    Parameters
+    ----------
+    client : OpenAI, optional
+        client used, by default None
+    force : bool, optional
+        whether to ignore the refresh interval, by default False
+
+    Returns
+    -------
+    bool
+        whether the remote listing has been fetched
+    """
+    if not _should_refresh(force=force):
+        return False
+
+    def list_all_files() -> Tuple[list, Iterable[str]]:
+        # iterating the listing fetches its next pages
+        listing = client.files.list()
+        return list(listing), getattr(listing, "unlisted_owners", ())
+
+    with span("files_list"):
+        remote_files, unlisted_owners = call_with_retry("files", list_all_files)
+    _apply_listing(remote_files=remote_files, unlisted_owners=unlisted_owners)
+    return True
+
+
+async def async_refresh_registry(client: AsyncOpenAI = None, force: bool = False) -> bool:
+    """Asynchronous version of `refresh_registry`.
+
+    Parameters
+    ----------
+    client : AsyncOpenAI, optional
+        client used, by default None
+    force : bool, optional
+        whether to ignore the refresh interval, by default False
+
+    Returns
+    -------
+    bool
+        whether the remote listing has been fetched
+    """
+    if not _should_refresh(force=force):
+        return False
+
+    async def list_all_files() -> Tuple[list, Iterable[str]]:
+        listing = client.files.list()
+        return [file async for file in listing], getattr(listing, "unlisted_owners", ())
+
+    with span("files_list"):
+        remote_files, unlisted_owners = await async_call_with_retry("files", list_all_files)
+    _apply_listing(remote_files=remote_files, unlisted_owners=unlisted_owners)
+    return True
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 12:43
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:03
+Description        : Shared keep-alive HTTP client honoring the proxy configuration.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING
+
+from src.config_and_variables import USE_PROXY, HTTP_PROXY, NO_PROXY, DOWNLOAD_TIMEOUT, HTTP_MAX_CONNECTIONS
+
+if TYPE_CHECKING:
+    import httpx
+
+
+_lock = threading.Lock()
+_client = None
+_async_client = None
+
+
+def _proxy_mounts(limits: httpx.Limits = None, transport: type = None) -> dict:
+    """Build the transport mounts routing traffic through `HTTP_PROXY`, except for `NO_PROXY` hosts.
+
+    Parameters
+    ----------
+    limits : httpx.Limits, optional
+        connection pool limits of the proxy transport, by default None
+    transport : type, optional
+        transport class, `httpx.AsyncHTTPTransport` for asynchronous clients, by default None, i.e. `httpx.HTTPTransport`
+
+    Returns
+    -------
+    dict
+        mounts for `httpx.Client`, empty if proxy is not used
+    """
+    if not USE_PROXY:
+        return {}
+
+    if transport is None:
+        import httpx
+        transport = httpx.HTTPTransport
+
+    mounts = {"all://": transport(proxy=HTTP_PROXY, limits=limits)}
+    for host in NO_PROXY.split(','):
+        host = host.strip()
+        if host:
+            # IPv6 hosts need brackets in URL patterns
+            mounts[f"all://[{host}]" if ':' in host else f"all://{host}"] = None
+
+    return mounts
+
+
+def get_http_client() -> httpx.Client:
+    """Return the process-wide HTTP client, creating it on first use.
+
+    The client keeps connections alive across requests and reads its proxy settings from
+    `src/config_and_variables.py` only, so `os.environ` is never touched.
+
+    Returns
+    -------
+    httpx.Client
+        shared HTTP client
+    """
+    global _client
+
+    # `httpx` is imported on first use, for a fast startup
+    import httpx
+
+    with _lock:
+        if _client is None:
+            limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS)
+            _client = httpx.Client(
+                limits=limits,
+                mounts=_proxy_mounts(limits=limits),
+                timeout=DOWNLOAD_TIMEOUT,
+                follow_redirects=True,
+                trust_env=False
+            )
+
+    return _client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Return the process-wide asynchronous HTTP client, creating it on first use.
+
+    Returns
+    -------
+    httpx.AsyncClient
+        shared asynchronous HTTP client, configured like `get_http_client`
+    """
+    global _async_client
+
+    import httpx
+
+    with _lock:
+        if _async_client is None:
+            limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS)
+            _async_client = httpx.AsyncClient(
+                limits=limits,
+                mounts=_proxy_mounts(limits=limits, transport=httpx.AsyncHTTPTransport),
+                timeout=DOWNLOAD_TIMEOUT,
+                follow_redirects=True,
+                trust_env=False
+            )
+
+    return _async_client
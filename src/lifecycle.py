@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 13:07
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:28
+Description        : Quotas and least recently used eviction of local papers and remote files.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Iterable, List, Set, Tuple
+
+from src.config_and_variables import FILE_DIR, LOCAL_MAX_BYTES, LOCAL_MAX_FILES, REMOTE_MAX_BYTES, REMOTE_MAX_FILES
+from src.config_and_variables import REMOTE_MAX_IDLE_DAYS, LIFECYCLE_FLAG_INTERVAL, LIFECYCLE_GRACE_PERIOD
+from src.file_registry import list_uploaded_files, touch_files, unregister_file
+from src.metrics import increment, span
+from src.rate_limit import call_with_retry
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+
+# papers downloaded from ArXiv, which can be downloaded again, e.g. '2311.11100.pdf' or '2311.11100v2.pdf'
+ARXIV_FILE_PATTERN = re.compile(r'\d{4}\.\d{4,5}(?:v\d+)?\.pdf')
+
+
+def list_local_papers() -> List[Tuple[str, int, float]]:
+    """List the papers downloaded from ArXiv to `FILE_DIR`, least recently used first.
+
+    Papers are touched each time they are used, so their modification time is their last use.
+    Other files (uploaded from disk, databases, partial downloads) are never listed.
+
+    Returns
+    -------
+    List[Tuple[str, int, float]]
+        (path, size, last use timestamp)
+    """
+    if not os.path.exists(FILE_DIR):
+        return []
+
+    papers = []
+    with os.scandir(FILE_DIR) as entries:
+        for entry in entries:
+            if entry.is_file() and ARXIV_FILE_PATTERN.fullmatch(entry.name):
+                stat = entry.stat()
+                papers.append((entry.path, stat.st_size, stat.st_mtime))
+
+    return sorted(papers, key=lambda paper: paper[2])
+
+
+def _select_evictions(
+    items: List[Tuple[str, int, float]],
+    max_bytes: int = None,
+    max_count: int = None,
+    idle_before: float = None,
+    protected: Set[str] = None
+) -> List[str]:
+    """Select the least recently used items to evict, until the quotas hold.
+
+    Parameters
+    ----------
+    items : List[Tuple[str, int, float]]
+        (key, size, last use timestamp), least recently used first
+    max_bytes : int, optional
+        total size kept at most, unlimited if None, by default None
+    max_count : int, optional
+        number of items kept at most, unlimited if None, by default None
+    idle_before : float, optional
+        items last used before this timestamp are evicted whatever the quotas, by default None
+    protected : Set[str], optional
+        keys never evicted, by default None
+
+    Returns
+    -------
+    List[str]
+        keys to evict
+    """
+    protected = protected or set()
+    grace_after = time.time() - LIFECYCLE_GRACE_PERIOD
+
+    total_bytes = sum(size for _, size, _ in items)
+    count = len(items)
+
+    evicted = []
+    for key, size, last_used in items:
+        over_quota = (max_bytes is not None and total_bytes > max_bytes) or (max_count is not None and count > max_count)
+        idle = idle_before is not None and last_used < idle_before
+        if not over_quota and not idle:
+            # the items left were used more recently
+            break
+
+        if key in protected or last_used >= grace_after:
+            continue
+
+        evicted.append(key)
+        total_bytes -= size
+        count -= 1
+
+    return evicted
+
+
+def evict_local_papers(max_bytes: int = LOCAL_MAX_BYTES, max_count: int = LOCAL_MAX_FILES) -> List[str]:
+    """Delete the least recently used papers downloaded from ArXiv until `FILE_DIR` is within its quotas.
+
+    Uploads and retrieval indexes are kept, an evicted paper is only downloaded again if needed.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        total size of the papers kept at most, unlimited if None, by default LOCAL_MAX_BYTES
+    max_count : int, optional
+        number of papers kept at most, unlimited if None, by default LOCAL_MAX_FILES
+
+    Returns
+    -------
+    List[str]
+        paths of the deleted papers
+    """
+    evicted = []
+    for path in _select_evictions(list_local_papers(), max_bytes=max_bytes, max_count=max_count):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        evicted.append(path)
+        increment("lifecycle_evictions_total", store="local")
+
+    return evicted
+
+
+def evict_remote_files(
+    client: OpenAI = None,
+    active_file_ids: Iterable[str] = (),
+    max_bytes: int = REMOTE_MAX_BYTES,
+    max_count: int = REMOTE_MAX_FILES,
+    max_idle_days: float = REMOTE_MAX_IDLE_DAYS
+) -> List[str]:
+    """Delete the remote files uploaded by us that are unused for `max_idle_days`, then the least
+    recently used ones until the remote quotas hold.
+
+    Files attached to active conversations are marked as used and never deleted. Files of the
+    account not uploaded by this application are never deleted.
+
+    Parameters
+    ----------
+    client : OpenAI, optional
+        client used, by default None
+    active_file_ids : Iterable[str], optional
+        file ids attached to active conversations, by default ()
+    max_bytes : int, optional
+        total size of the remote files kept at most, unlimited if None, by default REMOTE_MAX_BYTES
+    max_count : int, optional
+        number of remote files kept at most, unlimited if None, by default REMOTE_MAX_FILES
+    max_idle_days : float, optional
+        days after their last use remote files are deleted, never if None, by default REMOTE_MAX_IDLE_DAYS
+
+    Returns
+    -------
+    List[str]
+        deleted file ids
+    """
+    from openai import NotFoundError
+
+    active_file_ids = set(active_file_ids)
+    if len(active_file_ids) > 0:
+        touch_files(file_ids=list(active_file_ids))
+
+    idle_before = None if max_idle_days is None else time.time() - max_idle_days * 86400
+    files = [(file_id, size, last_used) for file_id, _, size, last_used in list_uploaded_files()]
+
+    evicted = []
+    for file_id in _select_evictions(
+        files, max_bytes=max_bytes, max_count=max_count, idle_before=idle_before, protected=active_file_ids
+    ):
+        try:
+            with span("files_delete"):
+                call_with_retry("files", client.files.delete, file_id)
+        except NotFoundError:
+            # already deleted, e.g. by hand
+            pass
+        except Exception:
+            # kept for the next pass
+            continue
+
+        unregister_file(file_id=file_id)
+        evicted.append(file_id)
+        increment("lifecycle_evictions_total", store="remote")
+
+    return evicted
+
+
+class LifecycleManager:
+    """Enforce the local and remote quotas in a background thread, every `interval` seconds.
+
+    Parameters
+    ----------
+    client : OpenAI, optional
+        client used to delete remote files, only local papers are evicted until `set_client`, by default None
+    active_file_ids : Callable[[], Iterable[str]], optional
+        returns the file ids attached to the active conversations, by default None
+    interval : float, optional
+        seconds between two passes, by default LIFECYCLE_FLAG_INTERVAL
+    """
+
+    def __init__(
+        self,
+        client: OpenAI = None,
+        active_file_ids: Callable[[], Iterable[str]] = None,
+        interval: float = LIFECYCLE_FLAG_INTERVAL
+    ) -> None:
+        self.client = client
+        self.active_file_ids = active_file_ids or (lambda: ())
+        self.interval = interval
+
+        self._closed = False
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lifecycle", daemon=True)
+        self._thread.start()
+
+    def run_once(self) -> Tuple[List[str], List[str]]:
+        """Run a pass now.
+
+        Returns
+        -------
+        Tuple[List[str], List[str]]
+            deleted local paper paths and remote file ids
+        """
+        local = evict_local_papers()
+        remote = []
+        if self.client is not None:
+            remote = evict_remote_files(client=self.client, active_file_ids=self.active_file_ids())
+
+        return local, remote
+
+    def set_client(self, client: OpenAI = None) -> None:
+        """Set the client once built, e.g. lazily by the command line, and run a pass on remote files."""
+        self.client = client
+        self._wake.set()
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+
+    def _run(self) -> None:
+        # the first pass runs at startup, to clean up after the previous sessions
+        while not self._closed:
+            self._wake.clear()
+            try:
+                with span("lifecycle"):
+                    self.run_once()
+            except Exception:
+                # retried at the next pass
+                pass
+
+            self._wake.wait(self.interval)
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 13:17
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:30
+Description        : Incremental index of the conversation logs, to list, search and page through them.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from src.config_and_variables import LOG_DIR, LOG_INDEX_FILE, LOG_PAGE_SIZE, LOG_SEARCH_MAX_RESULTS
+from src.retrieval import tokenize
+
+
+PREVIEW_LENGTH = 200    # Characters of each message kept in the index, for titles and search snippets
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    log_name    TEXT PRIMARY KEY,
+    file_name   TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    created     REAL,
+    updated     REAL,
+    num_messages INTEGER NOT NULL,
+    num_turns   INTEGER NOT NULL,
+    title       TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    log_name    TEXT NOT NULL,
+    position    INTEGER NOT NULL,
+    role        TEXT NOT NULL,
+    offset      INTEGER,
+    preview     TEXT NOT NULL,
+    PRIMARY KEY (log_name, position)
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term        TEXT NOT NULL,
+    log_name    TEXT NOT NULL,
+    position    INTEGER NOT NULL,
+    tf          INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_postings_term ON postings (term, log_name);
+CREATE INDEX IF NOT EXISTS idx_postings_message ON postings (log_name, position);
+"""
+
+_lock = threading.RLock()
+_connection = None
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Open (once per process) the log index database under `LOG_DIR`."""
+    global _connection
+
+    if _connection is None:
+        if not os.path.exists(LOG_DIR):
+            os.makedirs(LOG_DIR)
+
+        _connection = sqlite3.connect(os.path.join(LOG_DIR, LOG_INDEX_FILE), check_same_thread=False, timeout=30)
+        _connection.executescript(_SCHEMA)
+        _connection.commit()
+
+    return _connection
+
+
+def _delete_messages(conn: sqlite3.Connection, log_name: str, start: int = 0) -> None:
+    conn.execute("DELETE FROM postings WHERE log_name = ? AND position >= ?", (log_name, start))
+    conn.execute("DELETE FROM messages WHERE log_name = ? AND position >= ?", (log_name, start))
+
+
+def _insert_message(conn: sqlite3.Connection, log_name: str, position: int, message: dict, offset: int = None) -> None:
+    content = message['content'] if isinstance(message['content'], str) else json.dumps(message['content'], ensure_ascii=False)
+    conn.execute(
+        "INSERT OR REPLACE INTO messages (log_name, position, role, offset, preview) VALUES (?, ?, ?, ?, ?)",
+        (log_name, position, message['role'], offset, ' '.join(content[:PREVIEW_LENGTH].split()))
+    )
+    conn.executemany(
+        "INSERT INTO postings (term, log_name, position, tf) VALUES (?, ?, ?, ?)",
+        [(term, log_name, position, tf) for term, tf in Counter(tokenize(content)).items()]
+    )
+
+
+def _save_log(conn: sqlite3.Connection, log_name: str, file_name: str, size: int, created: float, updated: float) -> None:
+    num_messages, num_turns = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(role = 'user'), 0) FROM messages WHERE log_name = ?", (log_name,)
+    ).fetchone()
+    title = conn.execute(
+        "SELECT preview FROM messages WHERE log_name = ? AND role = 'user' ORDER BY position LIMIT 1", (log_name,)
+    ).fetchone()
+
+    conn.execute(
+        "INSERT INTO logs (log_name, file_name, size, created, updated, num_messages, num_turns, title) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (log_name) DO UPDATE SET "
+        "file_name = excluded.file_name, size = excluded.size, created = COALESCE(excluded.created, logs.created), "
+        "updated = excluded.updated, num_messages = excluded.num_messages, num_turns = excluded.num_turns, "
+        "title = excluded.title",
+        (log_name, file_name, size, created, updated, num_messages, num_turns, None if title is None else title[0])
+    )
+
+
+def _index_jsonl(conn: sqlite3.Connection, log_name: str, file_path: str, indexed_size: int = None) -> None:
+    """Index the records appended to a JSONL log since it was last indexed."""
+    stat = os.stat(file_path)
+
+    num_messages = 0
+    if indexed_size is None or stat.st_size < indexed_size:
+        # new log, or a log rewritten from scratch
+        _delete_messages(conn, log_name)
+        indexed_size = 0
+    else:
+        num_messages = conn.execute("SELECT num_messages FROM logs WHERE log_name = ?", (log_name,)).fetchone()[0]
+
+    with open(file_path, 'rb') as f:
+        f.seek(indexed_size)
+        data = f.read()
+
+    # records are only indexed once their line is complete, the last one may still be written
+    data = data[:data.rfind(b'\n') + 1]
+
+    created = None
+    offset = indexed_size
+    for line in data.splitlines(keepends=True):
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            # torn record, written by a crashed process
+            offset += len(line)
+            continue
+
+        if record['type'] == 'header':
+            created = record.get('created')
+        elif record['type'] == 'message':
+            _insert_message(conn, log_name, num_messages, record, offset=offset)
+            num_messages += 1
+        elif record['type'] == 'truncate':
+            _delete_messages(conn, log_name, start=record['length'])
+            num_messages = min(num_messages, record['length'])
+        offset += len(line)
+
+    _save_log(conn, log_name, os.path.basename(file_path), offset, created, stat.st_mtime)
+
+
+def _index_legacy(conn: sqlite3.Connection, log_name: str, file_path: str) -> None:
+    """Index a legacy `.log` JSON file, entirely since it is rewritten on each turn."""
+    stat = os.stat(file_path)
+
+    with open(file_path, 'r') as f:
+        messages = json.load(f)
+
+    _delete_messages(conn, log_name)
+    for position, message in enumerate(messages):
+        _insert_message(conn, log_name, position, message)
+
+    _save_log(conn, log_name, os.path.basename(file_path), stat.st_size, stat.st_mtime, stat.st_mtime)
+
+
+def _find_log_file(log_name: str) -> Optional[str]:
+    # the JSONL log takes precedence, as in `load_log`
+    for extension in ('.jsonl', '.log'):
+        file_path = os.path.join(LOG_DIR, f"{log_name}{extension}")
+        if os.path.exists(file_path):
+            return file_path
+
+    return None
+
+
+def update_log(log_name: str = None) -> None:
+    """Bring the index of a log up to date, reading only the records written since the last update.
+
+    Called by `log_history` after each write.
+
+    Parameters
+    ----------
+    log_name : str, optional
+        name of the log, without extension, by default None
+    """
+    file_path = _find_log_file(log_name)
+
+    with _lock:
+        conn = _get_connection()
+        if file_path is None:
+            _delete_messages(conn, log_name)
+            conn.execute("DELETE FROM logs WHERE log_name = ?", (log_name,))
+        else:
+            row = conn.execute("SELECT file_name, size FROM logs WHERE log_name = ?", (log_name,)).fetchone()
+            if file_path.endswith('.jsonl'):
+                indexed_size = row[1] if row is not None and row[0] == os.path.basename(file_path) else None
+                _index_jsonl(conn, log_name, file_path, indexed_size=indexed_size)
+            else:
+                _index_legacy(conn, log_name, file_path)
+        conn.commit()
+
+
+def sync_logs() -> int:
+    """Index the logs written or changed outside of `log_history`, e.g. by another process or before
+    the index existed, and forget the deleted ones. Unchanged logs are only stat'ed.
+
+    Returns
+    -------
+    int
+        number of logs (re)indexed
+    """
+    if not os.path.exists(LOG_DIR):
+        return 0
+
+    on_disk = {}
+    with os.scandir(LOG_DIR) as entries:
+        for entry in entries:
+            log_name, extension = os.path.splitext(entry.name)
+            if extension not in ('.jsonl', '.log') or not entry.is_file():
+                continue
+            if extension == '.jsonl' or log_name not in on_disk:
+                stat = entry.stat()
+                on_disk[log_name] = (entry.name, stat.st_size, stat.st_mtime)
+
+    with _lock:
+        conn = _get_connection()
+        indexed = {row[0]: row[1:] for row in conn.execute("SELECT log_name, file_name, size, updated FROM logs")}
+
+    num_updated = 0
+    for log_name in set(on_disk) | set(indexed):
+        if on_disk.get(log_name) != indexed.get(log_name):
+            update_log(log_name=log_name)
+            num_updated += 1
+
+    return num_updated
+
+
+def _log_entries(conn: sqlite3.Connection, rows: List[tuple]) -> List[dict]:
+    entries = []
+    for log_name, created, updated, num_turns, title in rows:
+        attachments = [
+            preview for (preview,) in conn.execute(
+                "SELECT preview FROM messages WHERE log_name = ? AND role = 'system' "
+                "AND (preview LIKE 'fileid://%' OR preview LIKE 'docid://%') ORDER BY position",
+                (log_name,)
+            )
+        ]
+        entries.append({
+            'log_name': log_name,
+            'created': created,
+            'updated': updated,
+            'num_turns': num_turns,
+            'attachments': attachments,
+            'title': title,
+        })
+
+    return entries
+
+
+def list_logs(page: int = 1, page_size: int = LOG_PAGE_SIZE) -> Tuple[List[dict], int]:
+    """List the logs, most recently updated first.
+
+    Parameters
+    ----------
+    page : int, optional
+        page to list, starting from 1, by default 1
+    page_size : int, optional
+        logs per page, by default LOG_PAGE_SIZE
+
+    Returns
+    -------
+    Tuple[List[dict], int]
+        logs of the page, with keys `log_name`, `created`, `updated`, `num_turns`, `attachments` and
+        `title` (first question), and the number of pages
+
+    Raises
+    ------
+    ValueError
+        raised when `page` is below 1
+    """
+    if page < 1:
+        raise ValueError(f"Page {page} does not exist, pages start from 1.")
+
+    sync_logs()
+
+    with _lock:
+        conn = _get_connection()
+        num_logs = conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+        rows = conn.execute(
+            "SELECT log_name, created, updated, num_turns, title FROM logs ORDER BY updated DESC LIMIT ? OFFSET ?",
+            (page_size, (page - 1) * page_size)
+        ).fetchall()
+        entries = _log_entries(conn, rows)
+
+    return entries, max(1, math.ceil(num_logs / page_size))
+
+
+def search_logs(query: str = None, max_results: int = LOG_SEARCH_MAX_RESULTS) -> List[dict]:
+    """Find the logs containing every word of a query, ranked by tf-idf, then most recent first.
+
+    Parameters
+    ----------
+    query : str, optional
+        words to be searched in the messages, by default None
+    max_results : int, optional
+        logs returned at most, by default LOG_SEARCH_MAX_RESULTS
+
+    Returns
+    -------
+    List[dict]
+        logs as in `list_logs`, with the `snippet` of the message matching most words and its `position`
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if len(terms) == 0:
+        return []
+
+    sync_logs()
+
+    with _lock:
+        conn = _get_connection()
+        num_logs = conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+        scores, matches = Counter(), {}
+        for i, term in enumerate(terms):
+            postings = conn.execute("SELECT log_name, position, tf FROM postings WHERE term = ?", (term,)).fetchall()
+
+            term_logs = {}
+            for log_name, position, tf in postings:
+                term_logs[log_name] = term_logs.get(log_name, 0) + tf
+                matches.setdefault(log_name, Counter())[position] += 1
+
+            idf = math.log(1 + num_logs / max(1, len(term_logs)))
+            for log_name, tf in term_logs.items():
+                # logs missing an earlier word are out
+                if i == 0 or log_name in scores:
+                    scores[log_name] += idf * (1 + math.log(tf))
+            for log_name in list(scores):
+                if log_name not in term_logs:
+                    del scores[log_name]
+
+        if len(scores) == 0:
+            return []
+
+        marks = ','.join('?' * len(scores))
+        updated = dict(conn.execute(f"SELECT log_name, updated FROM logs WHERE log_name IN ({marks})", list(scores)))
+        ranked = sorted(scores, key=lambda log_name: (-scores[log_name], -(updated.get(log_name) or 0)))[:max_results]
+
+        rows = [
+            conn.execute("SELECT log_name, created, updated, num_turns, title FROM logs WHERE log_name = ?", (log_name,)).fetchone()
+            for log_name in ranked
+        ]
+        entries = _log_entries(conn, [row for row in rows if row is not None])
+        for entry in entries:
+            # earliest message matching the most words
+            position = max(sorted(matches[entry['log_name']]), key=lambda position: matches[entry['log_name']][position])
+            entry['position'] = position
+            entry['snippet'] = conn.execute(
+                "SELECT preview FROM messages WHERE log_name = ? AND position = ?", (entry['log_name'], position)
+            ).fetchone()[0]
+            entry['score'] = scores[entry['log_name']]
+
+    return entries
+
+
+def resolve_log_name(prefix: str = None) -> Optional[str]:
+    """Find a log by its name or the beginning of it, e.g. '2024-08-19' for the latest log of the day.
+
+    Parameters
+    ----------
+    prefix : str, optional
+        name of the log, or its beginning, by default None
+
+    Returns
+    -------
+    Optional[str]
+        name of the log, the most recently updated one if several match, None if none does
+
+    Raises
+    ------
+    ValueError
+        raised when `prefix` is empty, which would match every log
+    """
+    if not prefix:
+        raise ValueError("Please give the name of a log, or its beginning.")
+
+    if _find_log_file(prefix) is not None:
+        return prefix
+
+    sync_logs()
+
+    with _lock:
+        row = _get_connection().execute(
+            "SELECT log_name FROM logs WHERE substr(log_name, 1, ?) = ? ORDER BY updated DESC LIMIT 1", (len(prefix), prefix)
+        ).fetchone()
+
+    return None if row is None else row[0]
+
+
+def load_log_page(log_name: str = None, page: int = 1, page_size: int = LOG_PAGE_SIZE) -> Tuple[List[dict], int]:
+    """Load a page of the messages of a log, reading only their records instead of the whole file.
+
+    Parameters
+    ----------
+    log_name : str, optional
+        name of the log, by default None
+    page : int, optional
+        page to load, starting from 1, negative to count from the end, by default 1
+    page_size : int, optional
+        messages per page, by default LOG_PAGE_SIZE
+
+    Returns
+    -------
+    Tuple[List[dict], int]
+        messages of the page, in the OpenAI format, and the number of pages
+
+    Raises
+    ------
+    FileNotFoundError
+        raised when the log does not exist
+    ValueError
+        raised when `page` is 0 or counts back beyond the first page
+    """
+    file_path = _find_log_file(log_name)
+    if file_path is None:
+        raise FileNotFoundError(f"Log {log_name} not found.")
+
+    update_log(log_name=log_name)
+
+    with _lock:
+        conn = _get_connection()
+        num_messages = conn.execute("SELECT num_messages FROM logs WHERE log_name = ?", (log_name,)).fetchone()[0]
+        num_pages = max(1, math.ceil(num_messages / page_size))
+        if page == 0 or page < -num_pages:
+            raise ValueError(f"Page {page} does not exist, the log has {num_pages} pages.")
+        if page < 0:
+            page += num_pages + 1
+
+        rows = conn.execute(
+            "SELECT position, offset FROM messages WHERE log_name = ? ORDER BY position LIMIT ? OFFSET ?",
+            (log_name, page_size, (page - 1) * page_size)
+        ).fetchall()
+
+    if file_path.endswith('.log'):
+        with open(file_path, 'r') as f:
+            messages = json.load(f)
+        return [messages[position] for position, _ in rows], num_pages
+
+    messages = []
+    with open(file_path, 'rb') as f:
+        for _, offset in rows:
+            f.seek(offset)
+            record = json.loads(f.readline())
+            messages.append({'role': record['role'], 'content': record['content']})
+
+    return messages, num_pages
+
+
+def format_log_entry(entry: dict = None) -> str:
+    """Format a log on one line, e.g. for `list-logs:` and `search-logs:`.
+
+    Parameters
+    ----------
+    entry : dict, optional
+        log returned by `list_logs` or `search_logs`, by default None
+
+    Returns
+    -------
+    str
+        '<log name> (<turns> turns, <attachments> papers, updated <time>): <first question or snippet>'
+    """
+    updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry['updated'] or 0))
+    text = entry.get('snippet', entry['title']) or ''
+    if len(text) > 80:
+        text = text[:77] + '...'
+
+    return f"{entry['log_name']} ({entry['num_turns']} turns, {len(entry['attachments'])} papers, updated {updated}): {text}"
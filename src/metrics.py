@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 12:59
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:43
+Description        : Per-stage timing, byte and cache metrics, exposed in Prometheus format.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Tuple
+
+from src.config_and_variables import METRICS_PORT
+
+
+NAMESPACE = "paper_reading_llm"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+BYTES_BUCKETS   = tuple(float(1 << shift) for shift in range(10, 30, 2))   # 1 KiB to 256 MiB
+RATE_BUCKETS    = (1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0, 1000.0, 2000.0, 5000.0)
+
+# name: (type, help, buckets)
+METRICS = {
+    "stage_duration_seconds":           ("histogram", "Wall time of each stage, retries and rate limit waits included.", LATENCY_BUCKETS),
+    "stage_errors_total":               ("counter",   "Stages that ended with an exception.", None),
+    "transfer_bytes":                   ("histogram", "Size of downloaded and uploaded files.", BYTES_BUCKETS),
+    "cache_requests_total":             ("counter",   "Cache lookups by cache and result.", None),
+    "upstream_retries_total":           ("counter",   "Failed calls retried, by upstream.", None),
+    "prefetch_papers_total":            ("counter",   "Cited papers handled by the prefetcher, by result.", None),
+    "single_flight_total":              ("counter",   "Downloads and uploads started, or joined while in flight.", None),
+    "client_requests_total":            ("counter",   "Calls made through the client pool, by key and result.", None),
+    "client_circuit_opened_total":      ("counter",   "Keys taken out of the client pool by their circuit breaker.", None),
+    "lifecycle_evictions_total":        ("counter",   "Local papers and remote files evicted by the lifecycle manager.", None),
+    "rate_limit_wait_seconds":          ("histogram", "Time spent waiting for the rate limit of an upstream.", LATENCY_BUCKETS),
+    "chat_time_to_first_token_seconds": ("histogram", "Time from the chat request to the first streamed token.", LATENCY_BUCKETS),
+    "chat_output_tokens_per_second":    ("histogram", "Estimated tokens per second of streamed answers, after the first token.", RATE_BUCKETS),
+}
+
+
+class Histogram:
+    """Cumulative histogram with fixed bucket bounds.
+
+    Parameters
+    ----------
+    buckets : Tuple[float, ...]
+        upper bounds of the buckets, in increasing order
+    """
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+
+_lock = threading.Lock()
+_histograms: Dict[Tuple[str, tuple], Histogram] = {}
+_counters: Dict[Tuple[str, tuple], float] = {}
+_server = None
+
+
+def observe(name: str = None, value: float = 0.0, **labels) -> None:
+    """Record a value in a histogram of `METRICS`.
+
+    Parameters
+    ----------
+    name : str, optional
+        name of the histogram, by default None
+    value : float, optional
+        value observed, by default 0.0
+    """
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets=METRICS[name][2])
+        histogram.observe(value)
+
+
+def increment(name: str = None, value: float = 1, **labels) -> None:
+    """Increment a counter of `METRICS`.
+
+    Parameters
+    ----------
+    name : str, optional
+        name of the counter, by default None
+    value : float, optional
+        increment, by default 1
+    """
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+@contextmanager
+def span(stage: str = None) -> Iterator[None]:
+    """Time a stage into `stage_duration_seconds`, counting it in `stage_errors_total` if it raises.
+
+    Parameters
+    ----------
+    stage : str, optional
+        name of the stage, e.g. 'arxiv_query' or 'files_create', by default None
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        increment("stage_errors_total", stage=stage)
+        raise
+    finally:
+        observe("stage_duration_seconds", time.perf_counter() - start, stage=stage)
+
+
+def record_stream(started_at: float = None, first_token_at: float = None, num_tokens: int = 0) -> None:
+    """Record the time to first token and the throughput of a streamed answer.
+
+    Parameters
+    ----------
+    started_at : float, optional
+        `time.perf_counter()` when the request was sent, by default None
+    first_token_at : float, optional
+        `time.perf_counter()` when the first token was received, None if nothing was received, by default None
+    num_tokens : int, optional
+        (estimated) tokens of the answer, by default 0
+    """
+    if first_token_at is None:
+        return
+
+    now = time.perf_counter()
+    observe("chat_time_to_first_token_seconds", first_token_at - started_at)
+    if now > first_token_at:
+        observe("chat_output_tokens_per_second", num_tokens / (now - first_token_at))
+
+
+def snapshot() -> Dict[Tuple[str, tuple], Any]:
+    """Take the (count, sum) of every histogram and the value of every counter, to profile what
+    happens after this point.
+
+    Returns
+    -------
+    Dict[Tuple[str, tuple], Any]
+        (count, sum) of histograms and value of counters, by (name, labels)
+    """
+    with _lock:
+        values = {key: (histogram.count, histogram.sum) for key, histogram in _histograms.items()}
+        values.update(_counters)
+
+    return values
+
+
+def _format_labels(labels: tuple, **extra) -> str:
+    items = list(labels) + list(extra.items())
+    if len(items) == 0:
+        return ''
+
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in items) + '}'
+
+
+def render_prometheus() -> str:
+    """Render all metrics in the Prometheus text exposition format.
+
+    Returns
+    -------
+    str
+        metrics, one family after the other
+    """
+    lines = []
+    with _lock:
+        for name, (kind, help_text, _) in METRICS.items():
+            full_name = f"{NAMESPACE}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+
+            if kind == "counter":
+                for (key_name, labels), value in sorted(_counters.items()):
+                    if key_name == name:
+                        lines.append(f"{full_name}{_format_labels(labels)} {value}")
+                continue
+
+            for (key_name, labels), histogram in sorted(_histograms.items(), key=lambda item: item[0]):
+                if key_name != name:
+                    continue
+
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{full_name}_bucket{_format_labels(labels, le=bound)} {cumulative}")
+                lines.append(f"{full_name}_bucket{_format_labels(labels, le='+Inf')} {histogram.count}")
+                lines.append(f"{full_name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{full_name}_count{_format_labels(labels)} {histogram.count}")
+
+    return '\n'.join(lines) + '\n'
+
+
+def format_profile(baseline: Dict[Tuple[str, tuple], Any] = None) -> str:
+    """Summarize the metrics for the command line `--profile` option.
+
+    Parameters
+    ----------
+    baseline : Dict[Tuple[str, tuple], Any], optional
+        `snapshot()` taken before the profiled commands, only what happened since then is shown,
+        by default None
+
+    Returns
+    -------
+    str
+        one line per histogram and counter
+    """
+    baseline = baseline or {}
+    lines = ["=== Profile ==="]
+
+    with _lock:
+        for key, histogram in sorted(_histograms.items(), key=lambda item: item[0]):
+            base_count, base_sum = baseline.get(key, (0, 0.0))
+            count, total = histogram.count - base_count, histogram.sum - base_sum
+            if count == 0:
+                continue
+
+            name, labels = key
+            scale, unit = (1000, "ms") if name.endswith("_seconds") else (1, "")
+            lines.append(
+                f"{name}{_format_labels(labels)}: count {count}, "
+                f"total {total * scale:.1f}{unit}, mean {total / count * scale:.1f}{unit}, "
+                f"max {histogram.max * scale:.1f}{unit}"
+            )
+
+        for key, value in sorted(_counters.items()):
+            value -= baseline.get(key, 0)
+            if value != 0:
+                lines.append(f"{key[0]}{_format_labels(key[1])}: {value:g}")
+
+    lines.append("=== Profile End ===")
+    return '\n'.join(lines)
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1") -> None:
+    """Serve `/metrics` in a background thread, once per process. If the port cannot be bound, e.g.
+    already in use, a warning is printed and the process runs on without metrics.
+
+    Parameters
+    ----------
+    port : int, optional
+        port of the endpoint, by default METRICS_PORT
+    host : str, optional
+        address to bind, by default "127.0.0.1"
+    """
+    global _server
+
+    # only the web app serves metrics, `http.server` is not imported by the command line
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self) -> None:
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+
+            body = render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    with _lock:
+        if _server is not None:
+            return
+
+        try:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            # e.g. the port taken by another instance of the app, which runs on without metrics
+            print(f"Serving metrics on {host}:{port} failed ({e}), running without metrics...")
+            return
+        _server.daemon_threads = True
+
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    print(f"Serving metrics on http://{host}:{port}/metrics")
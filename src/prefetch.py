@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 13:05
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:45
+Description        : Background prefetching of the ArXiv papers cited by a loaded paper.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+from __future__ import annotations
+
+import os
+import queue
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import TYPE_CHECKING, Any, Generator, List
+
+from src.config_and_variables import PREFETCH_TOP_N, PREFETCH_MAX_BYTES, PREFETCH_MAX_RATE, PREFETCH_UPLOAD, PROGRESS_INTERVAL
+from src.metrics import increment
+from src.process_file import download_file, upload_file, query_arxiv_id_list, get_arxiv_id, get_pdf_link
+from src.process_file import downloads, get_arxiv_file_path, strip_arxiv_version
+from src.retrieval import extract_pdf_text, index_file
+from src.utils import format_size
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+
+# 'arXiv:2311.11100', 'arXiv preprint arXiv:2311.11100v2', 'arxiv.org/abs/2311.11100', 'arxiv.org/pdf/2311.11100.pdf'
+ARXIV_REFERENCE_PATTERN = re.compile(r'arxiv(?:\.org/(?:abs|pdf)/|\s*:\s*)(\d{4}\.\d{4,5})(?:v\d+)?', re.IGNORECASE)
+
+
+def find_cited_arxiv_ids(file_path: str = None, exclude: str = None) -> List[str]:
+    """Find the ArXiv papers cited by a PDF, most cited first.
+
+    The text is extracted with `pypdf` when it is installed, otherwise the raw file is scanned,
+    which only finds the identifiers of uncompressed link annotations.
+
+    Parameters
+    ----------
+    file_path : str, optional
+        path to the PDF, by default None
+    exclude : str, optional
+        arxiv id of the paper itself, by default None
+
+    Returns
+    -------
+    List[str]
+        arxiv ids without version, ordered by number of mentions
+    """
+    try:
+        text = '\n'.join(extract_pdf_text(file_path=file_path))
+    except ImportError:
+        with open(file_path, 'rb') as f:
+            text = f.read().decode('latin-1')
+
+    counts = Counter(ARXIV_REFERENCE_PATTERN.findall(text))
+    if exclude is not None:
+        counts.pop(strip_arxiv_version(exclude), None)
+
+    return [arxiv_id for arxiv_id, _ in counts.most_common()]
+
+
+class PrefetchStopped(RuntimeError):
+    """Raised in the download of a prefetched paper stopped by the quota or by `Prefetcher.close`."""
+
+
+class Prefetcher:
+    """Download the most cited references of the papers loaded with `arxiv:` in a background thread,
+    so that asking for one of them next returns at once.
+
+    Prefetching is capped by a byte quota per session and throttled to a maximum rate, so that it
+    does not compete with the commands of the user. Papers stopped by the quota keep their `.part`
+    file, which the next download of the paper resumes.
+
+    Parameters
+    ----------
+    client : OpenAI, optional
+        client used to upload prefetched papers, papers are only downloaded if None, by default None
+    retrieval : bool, optional
+        whether prefetched papers are indexed locally instead of uploaded, by default False
+    top_n : int, optional
+        most cited papers prefetched per loaded paper, by default PREFETCH_TOP_N
+    max_bytes : int, optional
+        bytes downloaded by the prefetcher per session at most, by default PREFETCH_MAX_BYTES
+    max_rate : float, optional
+        bytes per second downloaded by the prefetcher at most, unlimited if None, by default PREFETCH_MAX_RATE
+    upload : bool, optional
+        whether prefetched papers are also uploaded (indexed in retrieval mode), by default PREFETCH_UPLOAD
+    """
+
+    def __init__(
+        self,
+        client: OpenAI = None,
+        retrieval: bool = False,
+        top_n: int = PREFETCH_TOP_N,
+        max_bytes: int = PREFETCH_MAX_BYTES,
+        max_rate: float = PREFETCH_MAX_RATE,
+        upload: bool = PREFETCH_UPLOAD
+    ) -> None:
+        self.client = client
+        self.retrieval = retrieval
+        self.top_n = top_n
+        self.max_bytes = max_bytes
+        self.max_rate = max_rate
+        self.upload = upload
+
+        self._lock = threading.Lock()
+        self._tasks = queue.Queue()
+        self._seen = set()
+        self._queued = OrderedDict()    # session which cited each arxiv id waiting to be prefetched, in order
+        self._used_bytes = {}           # bytes downloaded by the prefetcher, by session
+        self._active = None
+        self._active_session = None
+        self._active_done = threading.Event()
+        self._active_stopped = threading.Event()
+        self._hurry = threading.Event()
+        self._closed = threading.Event()
+
+        self._thread = threading.Thread(target=self._run, name="prefetcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, file_path: str = None, arxiv_id: str = None, session: str = None) -> None:
+        """Prefetch the references of a paper, in the background.
+
+        Parameters
+        ----------
+        file_path : str, optional
+            path to the PDF of the paper, by default None
+        arxiv_id : str, optional
+            arxiv id of the paper, by default None
+        session : str, optional
+            session which loaded the paper, charged for the prefetched bytes, by default None
+        """
+        with self._lock:
+            self._seen.add(strip_arxiv_version(arxiv_id))
+        self._tasks.put((file_path, arxiv_id, session))
+
+    def used_bytes(self, session: str = None) -> int:
+        """Bytes downloaded by the prefetcher for a session.
+
+        Parameters
+        ----------
+        session : str, optional
+            session which loaded the papers, by default None
+
+        Returns
+        -------
+        int
+            bytes charged to the session
+        """
+        with self._lock:
+            return self._used_bytes.get(session, 0)
+
+    def forget(self, session: str = None) -> None:
+        """Drop the state of a session which ended, e.g. evicted by `SessionStore`: its quota, the
+        papers waiting to be prefetched for it, and the paper being prefetched for it, which keeps its
+        `.part` file.
+
+        Parameters
+        ----------
+        session : str, optional
+            session which loaded the papers, by default None
+        """
+        with self._lock:
+            self._used_bytes.pop(session, None)
+            for arxiv_id in [arxiv_id for arxiv_id, cited_by in self._queued.items() if cited_by == session]:
+                # left to another session citing it
+                del self._queued[arxiv_id]
+                self._seen.discard(arxiv_id)
+            if self._active is not None and self._active_session == session:
+                self._active_stopped.set()
+
+    def wait(self, arxiv_id: str = None) -> None:
+        """Called before a paper is loaded by the user: a paper being prefetched is finished at full
+        speed, a paper waiting to be prefetched is left to the caller.
+
+        Parameters
+        ----------
+        arxiv_id : str, optional
+            arxiv id of the paper, by default None
+        """
+        arxiv_id = strip_arxiv_version(arxiv_id)
+
+        with self._lock:
+            self._seen.add(arxiv_id)
+            self._queued.pop(arxiv_id, None)
+            if self._active != arxiv_id:
+                return
+            done = self._active_done
+            self._hurry.set()
+
+        done.wait()
+
+    def close(self) -> None:
+        """Stop prefetching, the paper being downloaded keeps its `.part` file."""
+        self._closed.set()
+        self._hurry.set()
+        self._tasks.put((None, None, None))
+
+    def _run(self) -> None:
+        while True:
+            file_path, arxiv_id, session = self._tasks.get()
+            if self._closed.is_set():
+                return
+
+            try:
+                self._prefetch_references(file_path=file_path, arxiv_id=arxiv_id, session=session)
+            except Exception:
+                # prefetching is best effort, the user loads the paper anyway
+                increment("prefetch_papers_total", result="failed")
+
+    def _prefetch_references(self, file_path: str, arxiv_id: str, session: str) -> None:
+        cited_ids = find_cited_arxiv_ids(file_path=file_path, exclude=arxiv_id)[:self.top_n]
+
+        with self._lock:
+            if self._used_bytes.get(session, 0) >= self.max_bytes:
+                return
+            for cited_id in cited_ids:
+                if cited_id not in self._seen and not os.path.exists(get_arxiv_file_path(cited_id)):
+                    self._seen.add(cited_id)
+                    self._queued[cited_id] = session
+            missing_ids = list(self._queued)
+
+        if len(missing_ids) == 0:
+            return
+
+        # one ArXiv API query for every reference
+        entries = {get_arxiv_id(entry): entry for entry in query_arxiv_id_list(id_list=','.join(missing_ids)).entries}
+
+        while not self._closed.is_set():
+            with self._lock:
+                if len(self._queued) == 0:
+                    return
+                cited_id, cited_by = self._queued.popitem(last=False)
+                if self._used_bytes.get(cited_by, 0) >= self.max_bytes:
+                    # left to another session citing it
+                    self._seen.discard(cited_id)
+                    increment("prefetch_papers_total", result="over_quota")
+                    continue
+                self._active = cited_id
+                self._active_session = cited_by
+                self._active_done = threading.Event()
+                self._active_stopped = threading.Event()
+                self._hurry.clear()
+
+            try:
+                if cited_id not in entries:
+                    increment("prefetch_papers_total", result="not_found")
+                    continue
+
+                cited_path = get_arxiv_file_path(cited_id)
+                if not self._download(arxiv_id=cited_id, link_href=get_pdf_link(entries[cited_id]), file_path=cited_path, session=cited_by):
+                    increment("prefetch_papers_total", result="stopped")
+                    continue
+
+                if self.upload and self.retrieval:
+                    for _ in index_file(file_path=cited_path):
+                        pass
+                elif self.upload and self.client is not None:
+                    for _ in upload_file(client=self.client, file_path=cited_path):
+                        pass
+                increment("prefetch_papers_total", result="prefetched")
+            except Exception:
+                increment("prefetch_papers_total", result="failed")
+            finally:
+                with self._lock:
+                    self._active = None
+                    self._active_session = None
+                    self._active_done.set()
+
+    def _download(self, arxiv_id: str, link_href: str, file_path: str, session: str) -> bool:
+        """Download a paper within the quota and the rate, returning False if stopped before the end."""
+        # the same flight as `download_file_from_arxiv`, so a user loading the paper joins it instead of racing on its `.part` file
+        try:
+            for _ in downloads.run(arxiv_id, lambda: self._paced_download(arxiv_id, link_href, file_path, session)):
+                pass
+        except PrefetchStopped:
+            return False
+
+        return os.path.exists(file_path)
+
+    def _paced_download(self, arxiv_id: str, link_href: str, file_path: str, session: str) -> Generator[Any, Any, Any]:
+        """Steps of `_download`, with the messages of `download_file_from_arxiv` for the users joining it."""
+        if os.path.exists(file_path):
+            yield f"File {file_path} already exists, skip downloading..."
+            return
+        yield f"Downloading paper {arxiv_id} from {link_href}..."
+
+        part_path = f"{file_path}.part"
+
+        started_at = time.monotonic()
+        last_report = started_at
+        received = 0
+        last = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+        steps = download_file(link_href=link_href, file_path=file_path)
+        try:
+            for downloaded, total in steps:
+                # a transfer restarted from scratch counts again from 0
+                delta = downloaded - last if downloaded >= last else downloaded
+                last = downloaded
+                received += delta
+                with self._lock:
+                    stopped = self._active_stopped.is_set()
+                    if not stopped:
+                        # a forgotten session is not charged anymore, nor kept in `_used_bytes`
+                        used_bytes = self._used_bytes.get(session, 0) + delta
+                        self._used_bytes[session] = used_bytes
+
+                if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    yield f"Downloading paper {arxiv_id}: {format_size(downloaded)} / {format_size(total)}..."
+
+                if self._closed.is_set():
+                    raise PrefetchStopped(f"Prefetching of paper {arxiv_id} closed.")
+                if self._hurry.is_set():
+                    continue
+                if stopped:
+                    raise PrefetchStopped(f"Prefetching of paper {arxiv_id} stopped with its session.")
+                if used_bytes >= self.max_bytes:
+                    raise PrefetchStopped(f"Prefetching of paper {arxiv_id} stopped by the quota.")
+
+                if self.max_rate is not None:
+                    delay = received / self.max_rate - (time.monotonic() - started_at)
+                    if delay > 0:
+                        # woken up early when the user waits for this paper
+                        self._hurry.wait(delay)
+        finally:
+            steps.close()
+
+        yield f"Downloaded paper {arxiv_id} ({format_size(last)})."
@@ -3,29 +3,172 @@
 '''
 Author             : 陈蔚 (weichen.cw@zju.edu.cn)
 Date               : 2024-08-17 14:21
-Last Modified By   : 陈蔚 (weichen.cw@zju.edu.cn)
-Last Modified Date : 2024-09-22 19:33
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:44
 Description        : Download, process and upload the file.
 -------- 
 Copyright (c) 2024 Wei Chen. 
 '''
 
+from __future__ import annotations
+
+import asyncio
+import hashlib
 import os
-import urllib.request as libreq
+import queue
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Generator, Any
+from tempfile import SpooledTemporaryFile
+from typing import IO, TYPE_CHECKING, AsyncGenerator, Generator, Any, Tuple, List, Optional
 from urllib.parse import urlencode
 
-import feedparser
-from openai import OpenAI
+from src.cache import DiskCache
+from src.config_and_variables import FILE_DIR, DOWNLOAD_CHUNK_SIZE, PROGRESS_INTERVAL, ARXIV_MAX_WORKERS
+from src.config_and_variables import ARXIV_API_URL, CACHE_DIR, ARXIV_CACHE_TTL, ARXIV_CACHE_MAX_ENTRIES
+from src.config_and_variables import ARXIV_SEARCH_MAX_RESULTS, ARXIV_SEARCH_PAGE_SIZE, ARXIV_SEARCH_MAX_WORKERS
+from src.config_and_variables import DISKLESS_SPOOL_MAX_BYTES
+from src.file_registry import lookup_file_id, refresh_registry, register_file, unregister_file, async_refresh_registry
+from src.file_registry import touch_files
+from src.http_client import get_http_client, get_async_http_client
+from src.metrics import increment, observe, span
+from src.rate_limit import acquire, backoff, call_with_retry, async_acquire, async_backoff, async_call_with_retry
+from src.retrieval import index_file, async_index_file
+from src.single_flight import SingleFlight, AsyncSingleFlight
+from src.utils import hash_file, format_size
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import OpenAI, AsyncOpenAI
+
+
+# Parsed ArXiv responses, keyed by request url ('url:...') or by arxiv id ('id:...')
+arxiv_cache = DiskCache(
+    path=os.path.join(CACHE_DIR, "arxiv.db"),
+    ttl=ARXIV_CACHE_TTL,
+    max_entries=ARXIV_CACHE_MAX_ENTRIES
+)
+
+# Downloads (by paper) and uploads (by key and content) in progress, joined by concurrent identical requests
+downloads = SingleFlight(name="download")
+uploads = SingleFlight(name="upload")
+async_downloads = AsyncSingleFlight(name="download")
+async_uploads = AsyncSingleFlight(name="upload")
+
+
+class _SinkDownload:
+    """Progress of a download into a sink, shared by `download_to_sink` and `async_download_to_sink`,
+    whose loops only differ by their HTTP client.
+
+    Parameters
+    ----------
+    sink : IO[bytes]
+        seekable binary file object the file is appended to
+    hash_name : str, optional
+        `hashlib` algorithm hashing the file in the same pass, by default None
+    """
+
+    def __init__(self, sink: IO[bytes], hash_name: str = None) -> None:
+        self.sink = sink
+        self.hash_name = hash_name
+        self.hasher = hashlib.new(hash_name) if hash_name is not None else None
+        self.offset = 0
+        self.total = 0
+        self.started_at = time.perf_counter()
+
+    def range_headers(self) -> dict:
+        """Headers of a request resuming from the end of the sink."""
+        self.offset = self.sink.seek(0, os.SEEK_END)
+        return {"Range": f"bytes={self.offset}-"} if self.offset > 0 else {}
+
+    def start(self, response: httpx.Response) -> bool:
+        """Prepare the sink for the body of `response`, False if there is no body to read."""
+        if response.status_code == 416:
+            # the partial file is already complete
+            self.total = self.offset
+            return False
 
-from src.config_and_variables import FILE_DIR
-from src.utils import proxy_context
+        response.raise_for_status()
+        if response.status_code != 206 and self.offset > 0:
+            # server ignored the range, restart from scratch
+            self.offset = 0
+            self.sink.seek(0)
+            self.sink.truncate()
+            self.hasher = hashlib.new(self.hash_name) if self.hash_name is not None else None
 
+        length = int(response.headers.get("Content-Length", 0))
+        self.total = self.offset + length if length > 0 else 0
+        return True
+
+    def write(self, chunk: bytes) -> Tuple[int, int]:
+        """Append a chunk to the sink, returning (downloaded bytes, total bytes)."""
+        self.sink.write(chunk)
+        if self.hasher is not None:
+            self.hasher.update(chunk)
+        self.offset += len(chunk)
+        return self.offset, self.total
+
+    def finish(self) -> Optional[str]:
+        """Record the metrics of the download, returning the hex digest of the file, None without `hash_name`."""
+        observe("stage_duration_seconds", time.perf_counter() - self.started_at, stage="download")
+        observe("transfer_bytes", self.offset, direction="download")
+        return self.hasher.hexdigest() if self.hasher is not None else None
+
+
+def download_to_sink(link_href: str = None, sink: IO[bytes] = None, hash_name: str = None) -> Generator[Tuple[int, int], Any, Optional[str]]:
+    """Download a file into a binary file object, resuming from the bytes already in it.
+
+    Interrupted transfers are retried with backoff, resuming with an HTTP Range request from the end
+    of `sink`, which is emptied if the server ignores the range.
+
+    Parameters
+    ----------
+    link_href : str, optional
+        hyper link to download the file, by default None
+    sink : IO[bytes], optional
+        seekable binary file object the file is appended to, by default None
+    hash_name : str, optional
+        `hashlib` algorithm hashing the file in the same pass, e.g. 'sha256', `sink` must then start
+        empty, by default None
+
+    Yields
+    ------
+    Generator[Tuple[int, int], Any, Optional[str]]
+        (downloaded bytes, total bytes) after each chunk, total is 0 if unknown. Returns the hex digest
+        of the file, None without `hash_name`.
 
-def download_file(link_href: str = None, file_path: str = None) -> str:
+    Raises
+    ------
+    httpx.HTTPStatusError
+        raised when the server answers with an error status, once retries are exhausted
+    """
+    download = _SinkDownload(sink=sink, hash_name=hash_name)
+
+    attempt = 0
+    while True:
+        attempt += 1
+        acquire(upstream="download")
+        try:
+            with get_http_client().stream("GET", link_href, headers=download.range_headers()) as response:
+                if download.start(response):
+                    for chunk in response.iter_bytes(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        yield download.write(chunk)
+                else:
+                    yield download.offset, download.total
+            break
+        except Exception as e:
+            backoff(upstream="download", attempt=attempt, exception=e)
+
+    return download.finish()
+
+
+def download_file(link_href: str = None, file_path: str = None) -> Generator[Tuple[int, int], Any, str]:
     """Download file from link and save to file path.
 
+    The file is streamed to `<file_path>.part` and renamed once complete, so `file_path` never
+    holds a partial file. An existing `.part` file is resumed with an HTTP Range request.
+
     Parameters
     ----------
     link_href : str, optional
@@ -33,14 +176,26 @@ def download_file(link_href: str = None, file_path: str = None) -> str:
     file_path : str, optional
         path to store the file, by default None
 
-    Returns
-    -------
-    str
-        path to the file.
+    Yields
+    ------
+    Generator[Tuple[int, int], Any, str]
+        (downloaded bytes, total bytes) after each chunk, total is 0 if unknown. Returns the path to the file.
+
+    Raises
+    ------
+    httpx.HTTPStatusError
+        raised when the server answers with an error status, once retries are exhausted
     """
-    with proxy_context():
-        os.system(f"curl {link_href} --output {file_path}")
-    
+    part_path = f"{file_path}.part"
+
+    downloaded, total = 0, 0
+    with open(part_path, 'ab') as part:
+        for downloaded, total in download_to_sink(link_href=link_href, sink=part):
+            yield downloaded, total
+
+    os.replace(part_path, file_path)
+    yield downloaded, total
+
     return file_path
 
 
@@ -67,21 +222,36 @@ def upload_file(client: OpenAI = None, file_path: str = None) -> Generator[Any,
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File {file_path} not found.")
     
+    file_hash = hash_file(file_path=file_path)
+    owner = getattr(client, "owner", None)
+
+    # concurrent uploads of the same content to the same key wait on a single one
+    for msg in uploads.run(f"{owner}:{file_hash}", lambda: _upload_file(client=client, file_path=file_path, file_hash=file_hash)):
+        yield msg
+
+
+def _upload_file(client: OpenAI, file_path: str, file_hash: str) -> Generator[Any, Any, Any]:
     file_name = os.path.basename(file_path)
 
-    # Upload file if not exists
-    should_upload = True
-    for file in client.files.list().data:
-        if file.filename == file_name:
-            yield f"File {file_name} already exists, skip uploading..."
-            file_id = file.id
-            should_upload = False
-            break
+    # Upload file if the same content has not been uploaded yet, whatever its name, to the key of the chat if pinned
+    file_id = lookup_file_id(sha256=file_hash, owner=getattr(client, "owner", None))
 
-    if should_upload:
+    if file_id is not None:
+        touch_files(file_ids=[file_id])
+        yield f"File {file_name} already exists, skip uploading..."
+    else:
         yield f"Uploading file {file_name}..."
-        file_object = client.files.create(file=Path(file_path), purpose="file-extract")
+        with span("files_create"):
+            file_object = call_with_retry("files", client.files.create, file=Path(file_path), purpose="file-extract")
+        observe("transfer_bytes", os.path.getsize(file_path), direction="upload")
         file_id = file_object.id
+        register_file(
+            file_id=file_id,
+            filename=file_name,
+            sha256=file_hash,
+            created_at=file_object.created_at,
+            size=os.path.getsize(file_path)
+        )
 
     yield file_id
 
@@ -101,11 +271,9 @@ def get_file_id(client: OpenAI = None, file_name: str = None) -> str:
     str
         File id of the file
     """
-    file_id = None
-    for file in client.files.list().data:
-        if file.filename == file_name:
-            file_id = file.id
-            break
+    file_id = lookup_file_id(filename=file_name)
+    if file_id is None and refresh_registry(client=client):
+        file_id = lookup_file_id(filename=file_name)
 
     if file_id is None:
         print(f"File {file_name} not found...")
@@ -115,13 +283,34 @@ def get_file_id(client: OpenAI = None, file_name: str = None) -> str:
     return file_id
 
 
-def query_arxiv_api(search_query: str = None) -> dict:
+def delete_file(client: OpenAI = None, file_id: str = None) -> None:
+    """Delete file through OpenAI API and drop it from the local registry.
+
+    Parameters
+    ----------
+    client : OpenAI, optional
+        client used, by default None
+    file_id : str, optional
+        id of the file to be deleted, by default None
+    """
+    with span("files_delete"):
+        call_with_retry("files", client.files.delete, file_id)
+    unregister_file(file_id=file_id)
+
+
+def query_arxiv_api(search_query: str = None, id_list: str = None, max_results: int = 1, start: int = 0) -> dict:
     """Query ArXiv API.
 
     Parameters
     ----------
     search_query : str, optional
         query used, by default None
+    id_list : str, optional
+        comma separated arxiv ids to be retrieved, by default None
+    max_results : int, optional
+        maximum number of entries returned, by default 1
+    start : int, optional
+        index of the first entry returned, to fetch results page by page, by default 0
 
     Returns
     -------
@@ -132,37 +321,74 @@ def query_arxiv_api(search_query: str = None) -> dict:
     # I adapt the code to Python 3.
 
     # Base api query url
-    base_url = 'http://export.arxiv.org/api/query?'
+    base_url = ARXIV_API_URL + '?'
 
     # Search parameters
     # sortBy = 'submittedDate'
     sortBy = 'relevance'
     sortOrder = 'descending'
-    start = 0                     # retreive the first results
-    max_results = 1
 
     data = {
-        "search_query": search_query,
         "sortBy": sortBy,
         "sortOrder": sortOrder,
         "start": start,
         "max_results": max_results
     }
+    if search_query is not None:
+        data["search_query"] = search_query
+    if id_list is not None:
+        data["id_list"] = id_list
+
+    url = base_url + urlencode(data)
+    cache_key = f"url:{url}"
+
+    cached = arxiv_cache.get(cache_key)
+    if cached is not None and arxiv_cache.is_fresh(cached):
+        increment("cache_requests_total", cache="arxiv", result="hit")
+        return cached.value
+
+    # revalidate stale responses instead of downloading them again
+    headers = {}
+    if cached is not None and cached.etag is not None:
+        headers["If-None-Match"] = cached.etag
+    if cached is not None and cached.last_modified is not None:
+        headers["If-Modified-Since"] = cached.last_modified
 
     # perform a GET request using the base_url and query
-    print("Searching url: " + base_url + urlencode(data))
+    print("Searching url: " + url)
+
+    def fetch() -> httpx.Response:
+        response = get_http_client().get(url, headers=headers)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    with span("arxiv_query"):
+        response = call_with_retry("arxiv", fetch)
+
+    if response.status_code == 304 and cached is not None:
+        increment("cache_requests_total", cache="arxiv", result="revalidated")
+        arxiv_cache.touch(cache_key)
+        return cached.value
 
-    with libreq.urlopen(base_url + urlencode(data)) as url:
-        response = url.read()
+    increment("cache_requests_total", cache="arxiv", result="miss")
 
-    # parse the response using feedparser
-    feed = feedparser.parse(response)
+    # parse the response using feedparser, imported on first use for a fast startup
+    import feedparser
+    feed = feedparser.parse(response.content)
 
     # Run through each entry, and print out information
     # for entry in feed.entries:
     if len(feed.entries) <= 0:
-        print(f"Haven't found paper for search query: {search_query}, continue...")
-        exit(0)
+        print(f"Haven't found paper for search query: {search_query or id_list}, continue...")
+        return feed
+
+    arxiv_cache.set(
+        cache_key,
+        feed,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified")
+    )
 
     return feed
 
@@ -186,25 +412,263 @@ def query_arxiv_keyword(keyword: str = None) -> dict:
     return feed
 
 
+def search_arxiv(
+    keyword: str = None,
+    max_results: int = ARXIV_SEARCH_MAX_RESULTS,
+    page_size: int = ARXIV_SEARCH_PAGE_SIZE,
+    max_workers: int = ARXIV_SEARCH_MAX_WORKERS
+) -> Generator[dict, Any, None]:
+    """Search ArXiv by keyword, yielding entries as soon as their page is parsed.
+
+    The first page gives the number of results, the next pages are then fetched concurrently
+    (still paced by the 'arxiv' rate limit) and yielded in order of relevance. Entries repeated
+    across pages, as happens when the ranking changes between two requests, are yielded once.
+    Entries are cached by id, so loading one of them next needs no metadata query.
+
+    Parameters
+    ----------
+    keyword : str, optional
+        keywords to be searched in all fields, by default None
+    max_results : int, optional
+        maximum number of entries yielded, by default ARXIV_SEARCH_MAX_RESULTS
+    page_size : int, optional
+        entries per ArXiv API query, by default ARXIV_SEARCH_PAGE_SIZE
+    max_workers : int, optional
+        maximum number of pages fetched at the same time, by default ARXIV_SEARCH_MAX_WORKERS
+
+    Yields
+    ------
+    Generator[dict, Any, None]
+        entries of the results
+    """
+    search_query = f'all:{keyword.lower()}'
+    seen = set()
+
+    def fetch_page(start: int) -> list:
+        return query_arxiv_api(search_query=search_query, start=start, max_results=min(page_size, max_results - start)).entries
+
+    def new_entries(entries: list) -> list:
+        fresh = []
+        for entry in entries:
+            arxiv_id = get_arxiv_id(entry)
+            if arxiv_id not in seen:
+                seen.add(arxiv_id)
+                arxiv_cache.set(f"id:{arxiv_id}", entry)
+                fresh.append(entry)
+        return fresh
+
+    feed = query_arxiv_api(search_query=search_query, max_results=min(page_size, max_results))
+    for entry in new_entries(feed.entries):
+        yield entry
+
+    total = min(max_results, int(feed.feed.get("opensearch_totalresults", 0)))
+    starts = list(range(page_size, total, page_size))
+    if len(starts) == 0:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [executor.submit(fetch_page, start) for start in starts]
+        for future in futures:
+            # ArXiv API sometimes answers with an empty page, the next pages are still yielded
+            for entry in new_entries(future.result()):
+                yield entry
+    finally:
+        # pages not needed anymore when the caller stops early
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def format_arxiv_entry(entry: dict = None) -> str:
+    """Format an entry on one line, e.g. for search results.
+
+    Parameters
+    ----------
+    entry : dict, optional
+        entry of ArXiv API, by default None
+
+    Returns
+    -------
+    str
+        '<arxiv id>: <title>'
+    """
+    return f"{get_arxiv_id(entry)}: {' '.join(entry.title.split())}"
+
+
 def query_arxiv_id_list(id_list: str = None) -> dict:
     """Query ArXiv API by id list.
 
     Parameters
     ----------
     id_list : str, optional
-        id list to be queried, by default None
+        comma separated ids to be queried, by default None
 
     Returns
     -------
     dict
-        parsed response from ArXiv API
+        parsed response from ArXiv API, with one entry per id
     """
-    search_query = f'id_list="{id_list}"' # search for id in all fields
-    feed = query_arxiv_api(search_query=search_query)
+    arxiv_ids = [arxiv_id.strip() for arxiv_id in id_list.split(',')]
+
+    # answer from the cache first, only query the missing ids
+    entries = {}
+    for arxiv_id in arxiv_ids:
+        cached = arxiv_cache.get(f"id:{arxiv_id}")
+        if cached is not None and arxiv_cache.is_fresh(cached):
+            entries[arxiv_id] = cached.value
+
+    missing_ids = [arxiv_id for arxiv_id in arxiv_ids if arxiv_id not in entries]
+    increment("cache_requests_total", len(entries), cache="arxiv_id", result="hit")
+    increment("cache_requests_total", len(missing_ids), cache="arxiv_id", result="miss")
+    if len(missing_ids) > 0:
+        feed = query_arxiv_api(id_list=','.join(missing_ids), max_results=len(missing_ids))
+        queried = {get_arxiv_id(entry): entry for entry in feed.entries}
+
+        for arxiv_id in missing_ids:
+            entry = queried.get(strip_arxiv_version(arxiv_id))
+            if entry is not None:
+                arxiv_cache.set(f"id:{arxiv_id}", entry)
+                entries[arxiv_id] = entry
+
+    import feedparser
+    feed = feedparser.FeedParserDict(entries=[entries[arxiv_id] for arxiv_id in arxiv_ids if arxiv_id in entries])
 
     return feed
 
-def upload_file_from_arxiv(client: OpenAI = None, arxiv_id: str = None) -> Generator[Any, Any, Any]:
+
+def get_arxiv_id(entry: dict = None) -> str:
+    """Get the arxiv id of a feed entry, without version suffix.
+
+    Parameters
+    ----------
+    entry : dict, optional
+        entry parsed from ArXiv API, e.g. with id 'http://arxiv.org/abs/2311.11100v1', by default None
+
+    Returns
+    -------
+    str
+        arxiv id, e.g. '2311.11100'
+    """
+    return strip_arxiv_version(entry.id.split('/abs/')[-1])
+
+
+def strip_arxiv_version(arxiv_id: str = None) -> str:
+    """Strip the version suffix of an arxiv id, e.g. '2311.11100v2' -> '2311.11100'.
+
+    Parameters
+    ----------
+    arxiv_id : str, optional
+        arxiv id, by default None
+
+    Returns
+    -------
+    str
+        arxiv id without version
+    """
+    return re.sub(r'v\d+$', '', arxiv_id.strip())
+
+
+def get_pdf_link(entry: dict = None) -> str:
+    """Get the link to the PDF of a feed entry.
+
+    Parameters
+    ----------
+    entry : dict, optional
+        entry parsed from ArXiv API, by default None
+
+    Returns
+    -------
+    str
+        hyper link to the PDF
+
+    Raises
+    ------
+    LookupError
+        raised when the entry has no PDF link
+    """
+    for link in entry.links:
+        if link.type == 'application/pdf':
+            return link.href
+
+    raise LookupError(f"Haven't found PDF link for paper {entry.id}.")
+
+
+def get_arxiv_file_path(arxiv_id: str = None) -> str:
+    """Get the local path of a paper downloaded from ArXiv.
+
+    Parameters
+    ----------
+    arxiv_id : str, optional
+        arxiv id of the paper, by default None
+
+    Returns
+    -------
+    str
+        path to the PDF under `FILE_DIR`
+    """
+    return os.path.join(FILE_DIR, f"{arxiv_id}.pdf")
+
+
+def _download_progress(arxiv_id: str, downloaded: int, total: int) -> str:
+    if total > 0:
+        return f"Downloading paper {arxiv_id}: {format_size(downloaded)} / {format_size(total)} ({downloaded / total:.0%})..."
+
+    return f"Downloading paper {arxiv_id}: {format_size(downloaded)}..."
+
+
+def download_file_from_arxiv(arxiv_id: str = None, entry: dict = None) -> Generator[Any, Any, Any]:
+    """Download a paper from ArXiv to `FILE_DIR`, skipping papers already downloaded.
+
+    Parameters
+    ----------
+    arxiv_id : str, optional
+        arxiv id of the paper to be downloaded, by default None
+    entry : dict, optional
+        entry already queried from ArXiv API, skips the metadata query if given, by default None
+
+    Yields
+    ------
+    Generator[Any, Any, Any]
+        message to be displayed
+
+    Raises
+    ------
+    LookupError
+        raised when the paper or its PDF is not found on ArXiv
+    """
+    # concurrent requests for the same paper wait on a single download, instead of racing on its `.part` file
+    for msg in downloads.run(arxiv_id, lambda: _download_file_from_arxiv(arxiv_id=arxiv_id, entry=entry)):
+        yield msg
+
+
+def _download_file_from_arxiv(arxiv_id: str, entry: dict = None) -> Generator[Any, Any, Any]:
+    if not os.path.exists(FILE_DIR):
+        os.makedirs(FILE_DIR, exist_ok=True)
+
+    file_path = get_arxiv_file_path(arxiv_id)
+
+    if not os.path.exists(file_path):
+        if entry is None:
+            entries = query_arxiv_id_list(id_list=arxiv_id).entries
+            if len(entries) <= 0:
+                raise LookupError(f"Haven't found paper {arxiv_id} on ArXiv.")
+            entry = entries[0]
+        link_href = get_pdf_link(entry)
+        yield f"Downloading paper {arxiv_id} from {link_href}..."
+
+        last_report = time.monotonic()
+        for downloaded, total in download_file(link_href=link_href, file_path=file_path):
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                yield _download_progress(arxiv_id, downloaded, total)
+
+        yield f"Downloaded paper {arxiv_id} ({format_size(downloaded)})."
+    else:
+        # the modification time of papers is their last use, for the least recently used eviction of `src/lifecycle.py`
+        os.utime(file_path)
+        yield f"File {file_path} already exists, skip downloading..."
+
+
+def upload_file_from_arxiv(client: OpenAI = None, arxiv_id: str = None, entry: dict = None) -> Generator[Any, Any, Any]:
     """Upload file queried from ArXiv API.
 
     Parameters
@@ -213,28 +677,605 @@ def upload_file_from_arxiv(client: OpenAI = None, arxiv_id: str = None) -> Gener
         client used, by default None
     arxiv_id : str, optional
         arxiv id of the paper to be download/upload, by default None
+    entry : dict, optional
+        entry already queried from ArXiv API, skips the metadata query if given, by default None
 
     Yields
     ------
     Generator[Any, Any, Any]
         message to be displayed
     """
+    for msg in download_file_from_arxiv(arxiv_id=arxiv_id, entry=entry):
+        yield msg
+
+    for msg in upload_file(client=client, file_path=get_arxiv_file_path(arxiv_id)):
+        yield msg
+
+
+def index_file_from_arxiv(arxiv_id: str = None, entry: dict = None) -> Generator[Any, Any, Any]:
+    """Download a paper from ArXiv and index it locally for retrieval mode, instead of uploading it.
+
+    Parameters
+    ----------
+    arxiv_id : str, optional
+        arxiv id of the paper to be download/index, by default None
+    entry : dict, optional
+        entry already queried from ArXiv API, skips the metadata query if given, by default None
+
+    Yields
+    ------
+    Generator[Any, Any, Any]
+        message to be displayed, the last one being the document id
+    """
+    for msg in download_file_from_arxiv(arxiv_id=arxiv_id, entry=entry):
+        yield msg
+
+    for msg in index_file(file_path=get_arxiv_file_path(arxiv_id)):
+        yield msg
+
+
+def download_to_spool(link_href: str = None, spool: IO[bytes] = None) -> Generator[Tuple[int, int], Any, str]:
+    """Download a file into a file object, hashing it in the same pass, e.g. to upload it without a
+    local copy.
+
+    Parameters
+    ----------
+    link_href : str, optional
+        hyper link to download the file, by default None
+    spool : IO[bytes], optional
+        empty binary file object the file is written to, by default None
+
+    Yields
+    ------
+    Generator[Tuple[int, int], Any, str]
+        (downloaded bytes, total bytes) after each chunk, total is 0 if unknown. Returns the SHA-256 hex digest of the file.
+    """
+    return (yield from download_to_sink(link_href=link_href, sink=spool, hash_name="sha256"))
+
+
+def ingest_file_from_arxiv(
+    client: OpenAI = None,
+    arxiv_id: str = None,
+    entry: dict = None,
+    max_memory: int = DISKLESS_SPOOL_MAX_BYTES
+) -> Generator[Any, Any, Any]:
+    """Upload a paper from ArXiv as it is downloaded, without storing it in `FILE_DIR`.
+
+    The paper is buffered in memory, spilling to a temporary file beyond `max_memory` bytes, and
+    hashed while downloaded, so that its bytes are written and read once. A paper already in
+    `FILE_DIR` is uploaded from there, as by `upload_file_from_arxiv`.
+
+    Parameters
+    ----------
+    client : OpenAI, optional
+        client used, by default None
+    arxiv_id : str, optional
+        arxiv id of the paper to be download/upload, by default None
+    entry : dict, optional
+        entry already queried from ArXiv API, skips the metadata query if given, by default None
+    max_memory : int, optional
+        bytes buffered in memory at most, by default DISKLESS_SPOOL_MAX_BYTES
+
+    Yields
+    ------
+    Generator[Any, Any, Any]
+        message to be displayed, the last one being the file id
+    """
+    if os.path.exists(get_arxiv_file_path(arxiv_id)):
+        for msg in upload_file_from_arxiv(client=client, arxiv_id=arxiv_id, entry=entry):
+            yield msg
+        return
+
+    # concurrent requests for the same paper to the same key wait on a single transfer
+    owner = getattr(client, "owner", None)
+    for msg in uploads.run(
+        f"{owner}:{arxiv_id}.pdf",
+        lambda: _ingest_file_from_arxiv(client=client, arxiv_id=arxiv_id, entry=entry, max_memory=max_memory)
+    ):
+        yield msg
+
+
+def _ingest_file_from_arxiv(client: OpenAI, arxiv_id: str, entry: dict, max_memory: int) -> Generator[Any, Any, Any]:
+    file_name = f"{arxiv_id}.pdf"
+    owner = getattr(client, "owner", None)
+
+    if entry is None:
+        entries = query_arxiv_id_list(id_list=arxiv_id).entries
+        if len(entries) <= 0:
+            raise LookupError(f"Haven't found paper {arxiv_id} on ArXiv.")
+        entry = entries[0]
+    link_href = get_pdf_link(entry)
+    yield f"Downloading paper {arxiv_id} from {link_href}..."
+
+    with SpooledTemporaryFile(max_size=max_memory) as spool:
+        steps = download_to_spool(link_href=link_href, spool=spool)
+        downloaded = 0
+        last_report = time.monotonic()
+        while True:
+            try:
+                downloaded, total = next(steps)
+            except StopIteration as stop:
+                file_hash = stop.value
+                break
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                yield _download_progress(arxiv_id, downloaded, total)
+        yield f"Downloaded paper {arxiv_id} ({format_size(downloaded)})."
+
+        # deduplicated by content, as in `upload_file`, a file name says nothing about its bytes
+        file_id = lookup_file_id(sha256=file_hash, owner=owner)
+        if file_id is not None:
+            touch_files(file_ids=[file_id])
+            yield f"File {file_name} already exists, skip uploading..."
+        else:
+            yield f"Uploading file {file_name}..."
+
+            def create():
+                # each attempt sends the paper from its beginning
+                spool.seek(0)
+                return client.files.create(file=(file_name, spool), purpose="file-extract")
+
+            with span("files_create"):
+                file_object = call_with_retry("files", create)
+            observe("transfer_bytes", downloaded, direction="upload")
+            file_id = file_object.id
+            register_file(
+                file_id=file_id,
+                filename=file_name,
+                sha256=file_hash,
+                created_at=file_object.created_at,
+                size=downloaded
+            )
+
+    yield file_id
+
+
+def upload_files_from_arxiv(
+    client: OpenAI = None,
+    arxiv_ids: List[str] = None,
+    max_workers: int = ARXIV_MAX_WORKERS,
+    retrieval: bool = False
+) -> Generator[Any, Any, Any]:
+    """Upload several files queried from ArXiv API.
+
+    The metadata of all papers missing locally is resolved with a single ArXiv API query, then
+    papers are downloaded and uploaded (or indexed in retrieval mode) concurrently by a bounded
+    pool of workers.
+
+    Parameters
+    ----------
+    client : OpenAI, optional
+        client used, by default None
+    arxiv_ids : List[str], optional
+        arxiv ids of the papers to be download/upload, by default None
+    max_workers : int, optional
+        maximum number of papers processed at the same time, by default ARXIV_MAX_WORKERS
+    retrieval : bool, optional
+        whether to index the papers locally instead of uploading them, by default False
+
+    Yields
+    ------
+    Generator[Any, Any, Any]
+        (arxiv id, message to be displayed) while processing, then a dict mapping each
+        successfully uploaded arxiv id to its file id (document id in retrieval mode)
+    """
+    missing_ids = [arxiv_id for arxiv_id in arxiv_ids if not os.path.exists(get_arxiv_file_path(arxiv_id))]
+
+    entries = {}
+    if len(missing_ids) > 0:
+        yield None, f"Querying metadata of {len(missing_ids)} papers..."
+        feed = query_arxiv_id_list(id_list=','.join(missing_ids))
+        entries = {get_arxiv_id(entry): entry for entry in feed.entries}
+
+    messages = queue.Queue()
+
+    def process(arxiv_id: str) -> str:
+        file_id = None
+        try:
+            entry = entries.get(strip_arxiv_version(arxiv_id))
+            if arxiv_id in missing_ids and entry is None:
+                raise LookupError(f"Haven't found paper {arxiv_id} on ArXiv.")
+
+            if retrieval:
+                steps = index_file_from_arxiv(arxiv_id=arxiv_id, entry=entry)
+            else:
+                steps = upload_file_from_arxiv(client=client, arxiv_id=arxiv_id, entry=entry)
+
+            # the last message is the file id, only progress messages are forwarded
+            for msg in steps:
+                if file_id is not None:
+                    messages.put((arxiv_id, file_id))
+                file_id = msg
+        except Exception as e:
+            messages.put((arxiv_id, f"Failed: {e}"))
+            file_id = None
+        finally:
+            messages.put((arxiv_id, None))
+
+        return file_id
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {arxiv_id: executor.submit(process, arxiv_id) for arxiv_id in dict.fromkeys(arxiv_ids)}
+
+        num_running = len(futures)
+        while num_running > 0:
+            arxiv_id, msg = messages.get()
+            if msg is None:
+                num_running -= 1
+            else:
+                yield arxiv_id, msg
+
+    file_ids = {}
+    for arxiv_id, future in futures.items():
+        if future.result() is not None:
+            file_ids[arxiv_id] = future.result()
+
+    yield file_ids
+
+
+async def async_download_to_sink(link_href: str = None, sink: IO[bytes] = None) -> AsyncGenerator[Tuple[int, int], Any]:
+    """Asynchronous version of `download_to_sink`, built on the shared asynchronous HTTP client,
+    without hashing.
+
+    Parameters
+    ----------
+    link_href : str, optional
+        hyper link to download the file, by default None
+    sink : IO[bytes], optional
+        seekable binary file object the file is appended to, by default None
+
+    Yields
+    ------
+    AsyncGenerator[Tuple[int, int], Any]
+        (downloaded bytes, total bytes) after each chunk, total is 0 if unknown
+    """
+    download = _SinkDownload(sink=sink)
+
+    attempt = 0
+    while True:
+        attempt += 1
+        await async_acquire(upstream="download")
+        try:
+            async with get_async_http_client().stream("GET", link_href, headers=download.range_headers()) as response:
+                if download.start(response):
+                    async for chunk in response.aiter_bytes(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        yield download.write(chunk)
+                else:
+                    yield download.offset, download.total
+            break
+        except Exception as e:
+            await async_backoff(upstream="download", attempt=attempt, exception=e)
+
+    download.finish()
+
+
+async def async_download_file(link_href: str = None, file_path: str = None) -> AsyncGenerator[Tuple[int, int], Any]:
+    """Asynchronous version of `download_file`.
+
+    Parameters
+    ----------
+    link_href : str, optional
+        hyper link to download the file, by default None
+    file_path : str, optional
+        path to store the file, by default None
+
+    Yields
+    ------
+    AsyncGenerator[Tuple[int, int], Any]
+        (downloaded bytes, total bytes) after each chunk, total is 0 if unknown
+    """
+    part_path = f"{file_path}.part"
+
+    downloaded, total = 0, 0
+    with open(part_path, 'ab') as part:
+        async for downloaded, total in async_download_to_sink(link_href=link_href, sink=part):
+            yield downloaded, total
+
+    os.replace(part_path, file_path)
+    yield downloaded, total
+
+
+async def async_upload_file(client: AsyncOpenAI = None, file_path: str = None) -> AsyncGenerator[Any, Any]:
+    """Asynchronous version of `upload_file`.
+
+    Parameters
+    ----------
+    client : AsyncOpenAI, optional
+        client used, by default None
+    file_path : str, optional
+        path to the file to be uploaded, by default None
+
+    Yields
+    ------
+    AsyncGenerator[Any, Any]
+        output messages, the last one being the file id
+
+    Raises
+    ------
+    FileNotFoundError
+        raised when file not found
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File {file_path} not found.")
+
+    file_hash = await asyncio.to_thread(hash_file, file_path=file_path)
+    owner = getattr(client, "owner", None)
+
+    async for msg in async_uploads.run(
+        f"{owner}:{file_hash}", lambda: _async_upload_file(client=client, file_path=file_path, file_hash=file_hash)
+    ):
+        yield msg
+
+
+async def _async_upload_file(client: AsyncOpenAI, file_path: str, file_hash: str) -> AsyncGenerator[Any, Any]:
+    file_name = os.path.basename(file_path)
+
+    file_id = lookup_file_id(sha256=file_hash, owner=getattr(client, "owner", None))
+
+    if file_id is not None:
+        touch_files(file_ids=[file_id])
+        yield f"File {file_name} already exists, skip uploading..."
+    else:
+        yield f"Uploading file {file_name}..."
+        with span("files_create"):
+            file_object = await async_call_with_retry(
+                "files", client.files.create, file=Path(file_path), purpose="file-extract"
+            )
+        observe("transfer_bytes", os.path.getsize(file_path), direction="upload")
+        file_id = file_object.id
+        register_file(
+            file_id=file_id,
+            filename=file_name,
+            sha256=file_hash,
+            created_at=file_object.created_at,
+            size=os.path.getsize(file_path)
+        )
+
+    yield file_id
+
+
+async def async_get_file_id(client: AsyncOpenAI = None, file_name: str = None) -> Optional[str]:
+    """Asynchronous version of `get_file_id`.
+
+    Parameters
+    ----------
+    client : AsyncOpenAI, optional
+        client used, by default None
+    file_name : str, optional
+        name of the file, by default None
+
+    Returns
+    -------
+    Optional[str]
+        File id of the file, None if not found
+    """
+    file_id = lookup_file_id(filename=file_name)
+    if file_id is None and await async_refresh_registry(client=client):
+        file_id = lookup_file_id(filename=file_name)
+
+    if file_id is None:
+        print(f"File {file_name} not found...")
+    else:
+        print(f"File {file_name}. File id: {file_id}...")
+
+    return file_id
+
+
+async def async_delete_file(client: AsyncOpenAI = None, file_id: str = None) -> None:
+    """Asynchronous version of `delete_file`.
+
+    Parameters
+    ----------
+    client : AsyncOpenAI, optional
+        client used, by default None
+    file_id : str, optional
+        id of the file to be deleted, by default None
+    """
+    with span("files_delete"):
+        await async_call_with_retry("files", client.files.delete, file_id)
+    unregister_file(file_id=file_id)
+
+
+async def async_download_file_from_arxiv(arxiv_id: str = None, entry: dict = None) -> AsyncGenerator[Any, Any]:
+    """Asynchronous version of `download_file_from_arxiv`.
+
+    The metadata query, answered from `arxiv_cache` most of the time, runs in a worker thread.
+
+    Parameters
+    ----------
+    arxiv_id : str, optional
+        arxiv id of the paper to be downloaded, by default None
+    entry : dict, optional
+        entry already queried from ArXiv API, skips the metadata query if given, by default None
+
+    Yields
+    ------
+    AsyncGenerator[Any, Any]
+        message to be displayed
+    """
+    async for msg in async_downloads.run(arxiv_id, lambda: _async_download_file_from_arxiv(arxiv_id=arxiv_id, entry=entry)):
+        yield msg
+
+
+async def _async_download_file_from_arxiv(arxiv_id: str, entry: dict = None) -> AsyncGenerator[Any, Any]:
     if not os.path.exists(FILE_DIR):
-        os.makedirs(FILE_DIR)
+        os.makedirs(FILE_DIR, exist_ok=True)
 
-    file_path = os.path.join(FILE_DIR, f"{arxiv_id}.pdf")
+    file_path = get_arxiv_file_path(arxiv_id)
 
     if not os.path.exists(file_path):
-        feed = query_arxiv_id_list(id_list=arxiv_id)
-        links = feed.entries[0].links
+        if entry is None:
+            feed = await asyncio.to_thread(query_arxiv_id_list, id_list=arxiv_id)
+            if len(feed.entries) <= 0:
+                raise LookupError(f"Haven't found paper {arxiv_id} on ArXiv.")
+            entry = feed.entries[0]
 
-        for link in links:
-            if link.type == 'application/pdf':
-                yield f"Downloading paper {arxiv_id} from {link.href}..."
-                download_file(link_href=link.href, file_path=file_path)
-                break
+        link_href = get_pdf_link(entry)
+        yield f"Downloading paper {arxiv_id} from {link_href}..."
+
+        last_report = time.monotonic()
+        async for downloaded, total in async_download_file(link_href=link_href, file_path=file_path):
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                yield _download_progress(arxiv_id, downloaded, total)
+
+        yield f"Downloaded paper {arxiv_id} ({format_size(downloaded)})."
     else:
+        # the modification time of papers is their last use, for the least recently used eviction of `src/lifecycle.py`
+        os.utime(file_path)
         yield f"File {file_path} already exists, skip downloading..."
 
-    for msg in upload_file(client=client, file_path=file_path):
+
+async def async_upload_file_from_arxiv(
+    client: AsyncOpenAI = None,
+    arxiv_id: str = None,
+    entry: dict = None
+) -> AsyncGenerator[Any, Any]:
+    """Asynchronous version of `upload_file_from_arxiv`.
+
+    Parameters
+    ----------
+    client : AsyncOpenAI, optional
+        client used, by default None
+    arxiv_id : str, optional
+        arxiv id of the paper to be download/upload, by default None
+    entry : dict, optional
+        entry already queried from ArXiv API, skips the metadata query if given, by default None
+
+    Yields
+    ------
+    AsyncGenerator[Any, Any]
+        message to be displayed, the last one being the file id
+    """
+    async for msg in async_download_file_from_arxiv(arxiv_id=arxiv_id, entry=entry):
+        yield msg
+
+    async for msg in async_upload_file(client=client, file_path=get_arxiv_file_path(arxiv_id)):
+        yield msg
+
+
+async def async_index_file_from_arxiv(arxiv_id: str = None, entry: dict = None) -> AsyncGenerator[Any, Any]:
+    """Asynchronous version of `index_file_from_arxiv`.
+
+    Parameters
+    ----------
+    arxiv_id : str, optional
+        arxiv id of the paper to be download/index, by default None
+    entry : dict, optional
+        entry already queried from ArXiv API, skips the metadata query if given, by default None
+
+    Yields
+    ------
+    AsyncGenerator[Any, Any]
+        message to be displayed, the last one being the document id
+    """
+    async for msg in async_download_file_from_arxiv(arxiv_id=arxiv_id, entry=entry):
         yield msg
+
+    async for msg in async_index_file(file_path=get_arxiv_file_path(arxiv_id)):
+        yield msg
+
+
+async def async_search_arxiv(keyword: str = None, max_results: int = ARXIV_SEARCH_MAX_RESULTS) -> AsyncGenerator[dict, Any]:
+    """Asynchronous version of `search_arxiv`, each entry being awaited in a worker thread.
+
+    Parameters
+    ----------
+    keyword : str, optional
+        keywords to be searched in all fields, by default None
+    max_results : int, optional
+        maximum number of entries yielded, by default ARXIV_SEARCH_MAX_RESULTS
+
+    Yields
+    ------
+    AsyncGenerator[dict, Any]
+        entries of the results
+    """
+    entries = search_arxiv(keyword=keyword, max_results=max_results)
+    try:
+        while True:
+            entry = await asyncio.to_thread(next, entries, None)
+            if entry is None:
+                break
+            yield entry
+    finally:
+        entries.close()
+
+
+async def async_upload_files_from_arxiv(
+    client: AsyncOpenAI = None,
+    arxiv_ids: List[str] = None,
+    max_workers: int = ARXIV_MAX_WORKERS,
+    retrieval: bool = False
+) -> AsyncGenerator[Any, Any]:
+    """Asynchronous version of `upload_files_from_arxiv`, papers being processed as concurrent tasks.
+
+    Parameters
+    ----------
+    client : AsyncOpenAI, optional
+        client used, by default None
+    arxiv_ids : List[str], optional
+        arxiv ids of the papers to be download/upload, by default None
+    max_workers : int, optional
+        maximum number of papers processed at the same time, by default ARXIV_MAX_WORKERS
+    retrieval : bool, optional
+        whether to index the papers locally instead of uploading them, by default False
+
+    Yields
+    ------
+    AsyncGenerator[Any, Any]
+        (arxiv id, message to be displayed) while processing, then a dict mapping each
+        successfully uploaded arxiv id to its file id (document id in retrieval mode)
+    """
+    missing_ids = [arxiv_id for arxiv_id in arxiv_ids if not os.path.exists(get_arxiv_file_path(arxiv_id))]
+
+    entries = {}
+    if len(missing_ids) > 0:
+        yield None, f"Querying metadata of {len(missing_ids)} papers..."
+        feed = await asyncio.to_thread(query_arxiv_id_list, id_list=','.join(missing_ids))
+        entries = {get_arxiv_id(entry): entry for entry in feed.entries}
+
+    messages = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def process(arxiv_id: str) -> str:
+        file_id = None
+        async with semaphore:
+            try:
+                entry = entries.get(strip_arxiv_version(arxiv_id))
+                if arxiv_id in missing_ids and entry is None:
+                    raise LookupError(f"Haven't found paper {arxiv_id} on ArXiv.")
+
+                if retrieval:
+                    steps = async_index_file_from_arxiv(arxiv_id=arxiv_id, entry=entry)
+                else:
+                    steps = async_upload_file_from_arxiv(client=client, arxiv_id=arxiv_id, entry=entry)
+
+                async for msg in steps:
+                    if file_id is not None:
+                        await messages.put((arxiv_id, file_id))
+                    file_id = msg
+            except Exception as e:
+                await messages.put((arxiv_id, f"Failed: {e}"))
+                file_id = None
+            finally:
+                await messages.put((arxiv_id, None))
+
+        return file_id
+
+    tasks = {arxiv_id: asyncio.create_task(process(arxiv_id)) for arxiv_id in dict.fromkeys(arxiv_ids)}
+
+    num_running = len(tasks)
+    while num_running > 0:
+        arxiv_id, msg = await messages.get()
+        if msg is None:
+            num_running -= 1
+        else:
+            yield arxiv_id, msg
+
+    file_ids = {}
+    for arxiv_id, task in tasks.items():
+        if await task is not None:
+            file_ids[arxiv_id] = task.result()
+
+    yield file_ids
@@ -3,23 +3,352 @@
 '''
 Author             : 陈蔚 (weichen.cw@zju.edu.cn)
 Date               : 2024-08-17 14:22
-Last Modified By   : 陈蔚 (weichen.cw@zju.edu.cn)
-Last Modified Date : 2024-08-20 01:24
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:27
 Description        : Query API through openai package.
 -------- 
 Copyright (c) 2024 Wei Chen. 
 '''
 
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
 import re
-from typing import Generator, Any, List
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, AsyncGenerator, AsyncIterable, Generator, Any, Iterable, List, Optional, Tuple
+
+from src.cache import DiskCache
+from src.config_and_variables import MODEL_TYPE, SYSTEM_PROMPT, STREAM_FLUSH_INTERVAL
+from src.config_and_variables import CACHE_DIR, USE_RESPONSE_CACHE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES
+from src.conversation import ConversationHistory
+from src.context_window import MESSAGE_OVERHEAD, count_tokens, fit_context
+from src.metrics import increment, record_stream, span
+from src.rate_limit import call_with_retry, async_call_with_retry
+from src.retrieval import expand_retrieval
+
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+
+
+# Answers of the LLM, keyed by `get_response_cache_key`
+response_cache = DiskCache(
+    path=os.path.join(CACHE_DIR, "responses.db"),
+    ttl=RESPONSE_CACHE_TTL,
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES
+)
+
+
+def normalize_query(query: str = None) -> str:
+    """Normalize a query so that trivially different phrasings share a cache entry.
+
+    Parameters
+    ----------
+    query : str, optional
+        query to the LLM, by default None
+
+    Returns
+    -------
+    str
+        lower-cased query with collapsed whitespace and without trailing punctuation
+    """
+    return ' '.join(query.lower().split()).rstrip(' .?!。？！')
+
+
+def get_response_cache_key(messages: List[dict] = None) -> str:
+    """Compute the cache key of the answer to the last message of `messages`.
+
+    The key covers the model, the normalized query, the set of attached `fileid://` entries and the
+    rest of the history sent before the query.
+
+    Parameters
+    ----------
+    messages : List[dict], optional
+        messages sent to the LLM, the last one being the query, by default None
+
+    Returns
+    -------
+    str
+        hex digest identifying the answer
+    """
+    file_ids = sorted(
+        message['content'] for message in messages[:-1]
+        if message['role'] == 'system' and message['content'].startswith('fileid://')
+    )
+    history = [
+        (message['role'], message['content']) for message in messages[:-1]
+        if not (message['role'] == 'system' and message['content'].startswith('fileid://'))
+    ]
+
+    key = json.dumps([MODEL_TYPE, normalize_query(messages[-1]['content']), file_ids, history], ensure_ascii=False)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def lookup_response(cache_key: str = None) -> Optional[str]:
+    """Look up a fresh cached answer.
+
+    Parameters
+    ----------
+    cache_key : str, optional
+        key returned by `get_response_cache_key`, by default None
+
+    Returns
+    -------
+    Optional[str]
+        cached answer, None if missing, expired or if the cache is disabled
+    """
+    if not USE_RESPONSE_CACHE:
+        return None
+
+    cached = response_cache.get(cache_key)
+    if cached is None or not response_cache.is_fresh(cached):
+        increment("cache_requests_total", cache="response", result="miss")
+        return None
+
+    increment("cache_requests_total", cache="response", result="hit")
+    return cached.value
+
+
+def store_response(cache_key: str = None, response_text: str = None) -> None:
+    """Cache a complete answer.
+
+    Parameters
+    ----------
+    cache_key : str, optional
+        key returned by `get_response_cache_key`, by default None
+    response_text : str, optional
+        answer of the LLM, by default None
+    """
+    if USE_RESPONSE_CACHE and response_text:
+        response_cache.set(cache_key, response_text)
+
+
+class StreamAccumulator:
+    """Accumulate the text of a streamed completion in O(1) per chunk.
+
+    Deltas are read from `delta.content` directly and appended to a list, which is only joined
+    when the full text is needed.
+
+    Parameters
+    ----------
+    flush_interval : float, optional
+        minimum seconds between two yielded deltas, smaller deltas are coalesced, by default 0
+    """
+
+    __slots__ = ('flush_interval', 'first_token_at', '_parts', '_num_flushed')
+
+    def __init__(self, flush_interval: float = 0) -> None:
+        self.flush_interval = flush_interval
+        self.first_token_at = None  # `time.perf_counter()` when the first delta arrived
+        self._parts = []
+        self._num_flushed = 0
+
+    @property
+    def text(self) -> str:
+        """Text received so far."""
+        if self._num_flushed > 1:
+            # compact the flushed parts so that later joins do not walk them again
+            self._parts[:self._num_flushed] = [''.join(self._parts[:self._num_flushed])]
+            self._num_flushed = 1
+
+        return ''.join(self._parts)
+
+    def _append(self, chunk: Any) -> bool:
+        if len(chunk.choices) == 0:
+            return False
+
+        content = chunk.choices[0].delta.content
+        if content:
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self._parts.append(content)
+
+        return bool(content)
+
+    def _flush(self) -> str:
+        delta = ''.join(self._parts[self._num_flushed:])
+        self._num_flushed = len(self._parts)
+        return delta
+
+    def stream(self, completion: Iterable = None) -> Generator[str, Any, Any]:
+        """Consume a streamed completion.
+
+        Parameters
+        ----------
+        completion : Iterable, optional
+            chunks returned by `client.chat.completions.create(..., stream=True)`, by default None
+
+        Yields
+        ------
+        Generator[str, Any, Any]
+            coalesced deltas, at most one every `flush_interval` seconds, the last one on completion
+        """
+        last_flush = time.monotonic()
+        for chunk in completion:
+            if self._append(chunk):
+                now = time.monotonic()
+                if now - last_flush >= self.flush_interval:
+                    last_flush = now
+                    yield self._flush()
+
+        if self._num_flushed < len(self._parts):
+            yield self._flush()
+
+    async def astream(self, completion: AsyncIterable = None) -> AsyncGenerator[str, Any]:
+        """Asynchronous version of `stream`.
+
+        Parameters
+        ----------
+        completion : AsyncIterable, optional
+            chunks returned by `AsyncOpenAI` with `stream=True`, by default None
+
+        Yields
+        ------
+        AsyncGenerator[str, Any]
+            coalesced deltas, at most one every `flush_interval` seconds, the last one on completion
+        """
+        last_flush = time.monotonic()
+        async for chunk in completion:
+            if self._append(chunk):
+                now = time.monotonic()
+                if now - last_flush >= self.flush_interval:
+                    last_flush = now
+                    yield self._flush()
+
+        if self._num_flushed < len(self._parts):
+            yield self._flush()
+
+
+def prepare_query(query: str = None, messages: ConversationHistory = None) -> Tuple[List[dict], str, Optional[str]]:
+    """Append a query to the history, then fit the context sent to the LLM and look up its answer.
+
+    Parameters
+    ----------
+    query : str, optional
+        query to the LLM, by default None
+    messages : ConversationHistory, optional
+        messages in the history, by default None
+
+    Returns
+    -------
+    Tuple[List[dict], str, Optional[str]]
+        context sent to the LLM, its cache key and the cached answer (None if missing)
+    """
+    messages.append(role='user', content=query)
+    context = fit_context(messages=expand_retrieval(messages=messages.to_messages()))
+    cache_key = get_response_cache_key(messages=context)
+    return context, cache_key, lookup_response(cache_key=cache_key)
+
+
+async def async_prepare_query(query: str = None, messages: ConversationHistory = None) -> Tuple[List[dict], str, Optional[str]]:
+    """Asynchronous version of `prepare_query`, the retrieval and the cache lookup running in a thread."""
+    messages.append(role='user', content=query)
+    context = fit_context(messages=await asyncio.to_thread(expand_retrieval, messages=messages.to_messages()))
+    cache_key = get_response_cache_key(messages=context)
+    return context, cache_key, await asyncio.to_thread(lookup_response, cache_key=cache_key)
+
+
+def request_completion(client: OpenAI = None, context: List[dict] = None) -> Iterable:
+    """Send the context to the LLM.
+
+    Parameters
+    ----------
+    client : OpenAI, optional
+        client used, by default None
+    context : List[dict], optional
+        messages returned by `prepare_query`, by default None
+
+    Returns
+    -------
+    Iterable
+        chunks of the streamed answer
+    """
+    with span("chat_request"):
+        return call_with_retry("chat", client.chat.completions.create, model=MODEL_TYPE, messages=context, stream=True)
+
+
+async def async_request_completion(client: AsyncOpenAI = None, context: List[dict] = None) -> AsyncIterable:
+    """Asynchronous version of `request_completion`."""
+    with span("chat_request"):
+        return await async_call_with_retry("chat", client.chat.completions.create, model=MODEL_TYPE, messages=context, stream=True)
+
+
+@contextmanager
+def drop_query_on_failure(messages: ConversationHistory = None) -> Generator[None, Any, Any]:
+    """Remove the query from the history if it is not answered, e.g. the request or the stream
+    failing, or the caller closing the stream.
+
+    Parameters
+    ----------
+    messages : ConversationHistory, optional
+        messages in the history, the last one being the query, by default None
+    """
+    try:
+        yield
+    except BaseException:
+        messages.pop()
+        raise
+
+
+def finish_query(
+    messages: ConversationHistory = None,
+    cache_key: str = None,
+    accumulator: StreamAccumulator = None,
+    started_at: float = None
+) -> str:
+    """Record the metrics of a complete answer, cache it and append it to the history.
+
+    Parameters
+    ----------
+    messages : ConversationHistory, optional
+        messages in the history, by default None
+    cache_key : str, optional
+        key returned by `prepare_query`, by default None
+    accumulator : StreamAccumulator, optional
+        accumulator which consumed the whole answer, by default None
+    started_at : float, optional
+        `time.perf_counter()` when the request was sent, by default None
+
+    Returns
+    -------
+    str
+        answer of the LLM
+    """
+    record_stream(
+        started_at=started_at,
+        first_token_at=accumulator.first_token_at,
+        num_tokens=count_tokens(accumulator.text) - MESSAGE_OVERHEAD
+    )
+    store_response(cache_key=cache_key, response_text=accumulator.text)
+    messages.append(role='assistant', content=accumulator.text)
+    return accumulator.text
 
-from openai import OpenAI
 
-from src.config_and_variables import MODEL_TYPE, SYSTEM_PROMPT
-from src.utils import append_message, remove_message
+async def async_finish_query(
+    messages: ConversationHistory = None,
+    cache_key: str = None,
+    accumulator: StreamAccumulator = None,
+    started_at: float = None
+) -> str:
+    """Asynchronous version of `finish_query`, the answer being cached in a thread."""
+    record_stream(
+        started_at=started_at,
+        first_token_at=accumulator.first_token_at,
+        num_tokens=count_tokens(accumulator.text) - MESSAGE_OVERHEAD
+    )
+    await asyncio.to_thread(store_response, cache_key=cache_key, response_text=accumulator.text)
+    messages.append(role='assistant', content=accumulator.text)
+    return accumulator.text
 
 
-def query_api_command_line(client: OpenAI = None, query: str = None, messages: List[dict] = None) -> List[dict]:
+def query_api_command_line(
+    client: OpenAI = None,
+    query: str = None,
+    messages: ConversationHistory = None
+) -> ConversationHistory:
     """Query API through openai package in command line.
 
     Parameters
@@ -28,35 +357,43 @@ def query_api_command_line(client: OpenAI = None, query: str = None, messages: L
         client used, by default None
     query : str, optional
         query to the LLM, by default None
-    messages : List[dict], optional
+    messages : ConversationHistory, optional
         messages in the history, by default None
 
     Returns
     -------
-    List[dict]
+    ConversationHistory
         messages after the query
     """
-    append_message(messages, role='user', content=query)
+    context, cache_key, response_text = prepare_query(query=query, messages=messages)
+    if response_text is not None:
+        messages.append(role='assistant', content=response_text)
+        print("\n=== Model Response Start (Cached) ===\n")
+        print(response_text, end="", flush=True)
+        print("\n\n=== Model Response End ===\n")
+        return messages
 
-    completion = client.chat.completions.create(
-        model=MODEL_TYPE,
-        messages=messages,
-        stream=True
-    )
+    started_at = time.perf_counter()
+    accumulator = StreamAccumulator()
+    with drop_query_on_failure(messages=messages):
+        completion = request_completion(client=client, context=context)
 
-    print("\n=== Model Response Start ===\n")
-    response_text = ""
-    for chunk in completion:
-        if chunk.choices[0].delta.content is not None:
-            print(chunk.choices[0].model_dump()['delta']['content'], end="", flush=True)
-            response_text += chunk.choices[0].model_dump()['delta']['content']
-    print("\n\n=== Model Response End ===\n")
+        print("\n=== Model Response Start ===\n")
+        for delta in accumulator.stream(completion):
+            print(delta, end="", flush=True)
+        print("\n\n=== Model Response End ===\n")
 
-    append_message(messages, role='assistant', content=response_text)
+    finish_query(messages=messages, cache_key=cache_key, accumulator=accumulator, started_at=started_at)
     return messages
 
 
-def query_api_webapp(client: OpenAI = None, query: str = None, messages: List[dict] = None) -> Generator[Any, Any, Any]:
+def query_api_webapp(
+    client: OpenAI = None,
+    query: str = None,
+    messages: ConversationHistory = None,
+    flush_interval: float = STREAM_FLUSH_INTERVAL,
+    yield_deltas: bool = False
+) -> Generator[Any, Any, Any]:
     """Query API through openai package in Web APP.
 
     Parameters
@@ -65,35 +402,117 @@ def query_api_webapp(client: OpenAI = None, query: str = None, messages: List[di
         client used, by default None
     query : str, optional
         query to the LLM, by default None
-    messages : List[dict], optional
+    messages : ConversationHistory, optional
         messages in the history, by default None
+    flush_interval : float, optional
+        minimum seconds between two yields, by default STREAM_FLUSH_INTERVAL
+    yield_deltas : bool, optional
+        whether to yield only the new text instead of the whole response, by default False
 
     Yields
     ------
     Generator[Any, Any, Any]
-        messages after the query
+        response text so far (or its new part if `yield_deltas`)
     """
-    append_message(messages, role='user', content=query)
+    context, cache_key, response_text = prepare_query(query=query, messages=messages)
+    if response_text is not None:
+        # replay the cached answer as a single flush
+        messages.append(role='assistant', content=response_text)
+        yield response_text
+        return
 
-    completion = client.chat.completions.create(
-        model=MODEL_TYPE,
-        messages=messages,
-        stream=True
-    )
+    started_at = time.perf_counter()
+    accumulator = StreamAccumulator(flush_interval=flush_interval)
+    with drop_query_on_failure(messages=messages):
+        completion = request_completion(client=client, context=context)
 
-    print("\n=== Model Response Start ===\n")
-    response_text = ""
-    for chunk in completion:
-        if chunk.choices[0].delta.content is not None:
-            print(chunk.choices[0].model_dump()['delta']['content'], end="", flush=True)
-            response_text += chunk.choices[0].model_dump()['delta']['content']
-            yield response_text
-    print("\n\n=== Model Response End ===\n")
+        print("\n=== Model Response Start ===\n")
+        for delta in accumulator.stream(completion):
+            print(delta, end="", flush=True)
+            yield delta if yield_deltas else accumulator.text
+        print("\n\n=== Model Response End ===\n")
 
-    append_message(messages, role='assistant', content=response_text)
+    finish_query(messages=messages, cache_key=cache_key, accumulator=accumulator, started_at=started_at)
 
 
-def convert_tuples_to_messages(tuples: List[tuple] = None) -> List[dict]:
+def query_api_batch(client: OpenAI = None, query: str = None, messages: ConversationHistory = None) -> str:
+    """Query API through openai package without printing, for the batch mode.
+
+    Parameters
+    ----------
+    client : OpenAI, optional
+        client used, by default None
+    query : str, optional
+        query to the LLM, by default None
+    messages : ConversationHistory, optional
+        messages in the history, by default None
+
+    Returns
+    -------
+    str
+        answer of the LLM, also appended to `messages`
+    """
+    context, cache_key, response_text = prepare_query(query=query, messages=messages)
+    if response_text is not None:
+        messages.append(role='assistant', content=response_text)
+        return response_text
+
+    started_at = time.perf_counter()
+    accumulator = StreamAccumulator()
+    with drop_query_on_failure(messages=messages):
+        completion = request_completion(client=client, context=context)
+        for _ in accumulator.stream(completion):
+            pass
+
+    return finish_query(messages=messages, cache_key=cache_key, accumulator=accumulator, started_at=started_at)
+
+
+async def async_query_api_webapp(
+    client: AsyncOpenAI = None,
+    query: str = None,
+    messages: ConversationHistory = None,
+    flush_interval: float = STREAM_FLUSH_INTERVAL,
+    yield_deltas: bool = False
+) -> AsyncGenerator[Any, Any]:
+    """Asynchronous version of `query_api_webapp`. The answer is not echoed to the console, as many
+    chats are served concurrently.
+
+    Parameters
+    ----------
+    client : AsyncOpenAI, optional
+        client used, by default None
+    query : str, optional
+        query to the LLM, by default None
+    messages : ConversationHistory, optional
+        messages in the history, by default None
+    flush_interval : float, optional
+        minimum seconds between two yields, by default STREAM_FLUSH_INTERVAL
+    yield_deltas : bool, optional
+        whether to yield only the new text instead of the whole response, by default False
+
+    Yields
+    ------
+    AsyncGenerator[Any, Any]
+        response text so far (or its new part if `yield_deltas`)
+    """
+    context, cache_key, response_text = await async_prepare_query(query=query, messages=messages)
+    if response_text is not None:
+        # replay the cached answer as a single flush
+        messages.append(role='assistant', content=response_text)
+        yield response_text
+        return
+
+    started_at = time.perf_counter()
+    accumulator = StreamAccumulator(flush_interval=flush_interval)
+    with drop_query_on_failure(messages=messages):
+        completion = await async_request_completion(client=client, context=context)
+        async for delta in accumulator.astream(completion):
+            yield delta if yield_deltas else accumulator.text
+
+    await async_finish_query(messages=messages, cache_key=cache_key, accumulator=accumulator, started_at=started_at)
+
+
+def convert_tuples_to_messages(tuples: List[tuple] = None) -> ConversationHistory:
     """Convert history tuples to messages in OpenAI format.
 
     Parameters
@@ -103,30 +522,41 @@ def convert_tuples_to_messages(tuples: List[tuple] = None) -> List[dict]:
 
     Returns
     -------
-    List[dict]
+    ConversationHistory
         messages in OpenAI format
     """
-    messages = []
-    append_message(messages, role='system', content=SYSTEM_PROMPT)
+    messages = ConversationHistory()
+    messages.append(role='system', content=SYSTEM_PROMPT)
 
     for user, assistant in tuples:
         if user.startswith('arxiv:') or user.startswith('file:'):
 
-            match = re.search(r'File id: ([\w-]+)', assistant)
-            if match:
-                file_id = match.group(1)
-                append_message(messages, role='system', content=f'fileid://{file_id}')
+            # batch uploads report one file id per paper
+            for file_id in re.findall(r'File id: ([\w-]+)', assistant):
+                messages.append(role='system', content=f'fileid://{file_id}')
+            for doc_id in re.findall(r'Doc id: (\w+)', assistant):
+                messages.append(role='system', content=f'docid://{doc_id}')
 
         elif user.startswith('delete:'):
 
             match = re.search(r'File id: ([\w-]+)', assistant)
             if match:
                 file_id = match.group(1)
-                remove_message(messages, role='system', content=f'fileid://{file_id}')
-            
+                messages.remove(role='system', content=f'fileid://{file_id}')
+
+            match = re.search(r'Doc id: (\w+)', assistant)
+            if match:
+                doc_id = match.group(1)
+                messages.remove(role='system', content=f'docid://{doc_id}')
+
+        elif user.startswith('search:'):
+
+            # search results are only displayed
+            continue
+
         else:
 
-            append_message(messages, role='user', content=user)
-            append_message(messages, role='assistant', content=assistant)
+            messages.append(role='user', content=user)
+            messages.append(role='assistant', content=assistant)
 
     return messages
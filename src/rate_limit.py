@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 12:46
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:13
+Description        : Client-side rate limiting and retry with backoff for upstream services.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from src.config_and_variables import UPSTREAM_POLICIES
+from src.metrics import increment, observe
+
+if TYPE_CHECKING:
+    import httpx
+
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second, holding at most `burst` tokens.
+
+    Parameters
+    ----------
+    rate : float
+        tokens added per second
+    burst : int
+        capacity of the bucket
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take one token, possibly in advance.
+
+        Returns
+        -------
+        float
+            seconds to wait before the token may be used
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+
+            return -self._tokens / self.rate
+
+    def acquire(self) -> float:
+        """Block until a token is available, returning the seconds waited."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def async_acquire(self) -> float:
+        """Wait until a token is available, without blocking the event loop, returning the seconds waited."""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+_buckets = {
+    upstream: TokenBucket(rate=policy["rate"], burst=policy["burst"])
+    for upstream, policy in UPSTREAM_POLICIES.items()
+}
+
+
+def is_retryable(exception: Exception = None) -> bool:
+    """Whether a failed call is worth retrying: network errors, timeouts, 408, 429 and 5xx responses.
+
+    Parameters
+    ----------
+    exception : Exception, optional
+        exception raised by the call, by default None
+
+    Returns
+    -------
+    bool
+        True if the call can be retried
+    """
+    import httpx
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(exception, APIStatusError):
+        return exception.status_code in RETRYABLE_STATUS
+    if isinstance(exception, httpx.HTTPStatusError):
+        return exception.response.status_code in RETRYABLE_STATUS
+
+    return isinstance(exception, (APIConnectionError, httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def get_retry_delay(upstream: str = None, attempt: int = 1, exception: Exception = None) -> float:
+    """Compute the backoff before the next attempt: exponential with full jitter, or `Retry-After` if longer.
+
+    Parameters
+    ----------
+    upstream : str, optional
+        name of the upstream in `UPSTREAM_POLICIES`, by default None
+    attempt : int, optional
+        number of attempts made so far, by default 1
+    exception : Exception, optional
+        exception raised by the last attempt, by default None
+
+    Returns
+    -------
+    float
+        seconds to wait
+    """
+    policy = UPSTREAM_POLICIES[upstream]
+    delay = random.uniform(0, min(policy["max_delay"], policy["base_delay"] * 2 ** (attempt - 1)))
+
+    response: Optional[httpx.Response] = getattr(exception, "response", None)
+    if response is not None:
+        try:
+            delay = max(delay, min(policy["max_delay"], float(response.headers.get("Retry-After", 0))))
+        except ValueError:
+            # Retry-After given as a date, fall back to the backoff
+            pass
+
+    return delay
+
+
+def scale_upstream(upstream: str = None, factor: float = 1) -> None:
+    """Scale the rate and burst of `upstream` from its policy, e.g. by the number of API keys sharing the load.
+
+    Parameters
+    ----------
+    upstream : str, optional
+        name of the upstream in `UPSTREAM_POLICIES`, by default None
+    factor : float, optional
+        multiplier of the rate and burst of the policy, by default 1
+    """
+    policy = UPSTREAM_POLICIES[upstream]
+    bucket = _buckets[upstream]
+    with bucket._lock:
+        bucket.rate = policy["rate"] * factor
+        bucket.burst = policy["burst"] * factor
+
+
+def acquire(upstream: str = None) -> None:
+    """Block until the rate limit of `upstream` allows one more call.
+
+    Parameters
+    ----------
+    upstream : str, optional
+        name of the upstream in `UPSTREAM_POLICIES`, by default None
+    """
+    wait = _buckets[upstream].acquire()
+    if wait > 0:
+        observe("rate_limit_wait_seconds", wait, upstream=upstream)
+
+
+async def async_acquire(upstream: str = None) -> None:
+    """Asynchronous version of `acquire`.
+
+    Parameters
+    ----------
+    upstream : str, optional
+        name of the upstream in `UPSTREAM_POLICIES`, by default None
+    """
+    wait = await _buckets[upstream].async_acquire()
+    if wait > 0:
+        observe("rate_limit_wait_seconds", wait, upstream=upstream)
+
+
+def _check_retry(upstream: str = None, attempt: int = 1, exception: Exception = None) -> float:
+    """Re-raise `exception` if it should not be retried, otherwise return the backoff delay."""
+    if attempt >= UPSTREAM_POLICIES[upstream]["max_attempts"] or not is_retryable(exception):
+        raise exception
+
+    delay = get_retry_delay(upstream=upstream, attempt=attempt, exception=exception)
+    increment("upstream_retries_total", upstream=upstream)
+    print(f"Calling {upstream} failed ({exception}), retrying in {delay:.1f}s...")
+    return delay
+
+
+def backoff(upstream: str = None, attempt: int = 1, exception: Exception = None) -> None:
+    """Sleep before retrying a failed call, or re-raise its exception if it should not be retried.
+
+    Parameters
+    ----------
+    upstream : str, optional
+        name of the upstream in `UPSTREAM_POLICIES`, by default None
+    attempt : int, optional
+        number of attempts made so far, by default 1
+    exception : Exception, optional
+        exception raised by the last attempt, by default None
+
+    Raises
+    ------
+    Exception
+        `exception` itself, once retries are exhausted or if it is not retryable
+    """
+    time.sleep(_check_retry(upstream=upstream, attempt=attempt, exception=exception))
+
+
+async def async_backoff(upstream: str = None, attempt: int = 1, exception: Exception = None) -> None:
+    """Asynchronous version of `backoff`.
+
+    Parameters
+    ----------
+    upstream : str, optional
+        name of the upstream in `UPSTREAM_POLICIES`, by default None
+    attempt : int, optional
+        number of attempts made so far, by default 1
+    exception : Exception, optional
+        exception raised by the last attempt, by default None
+    """
+    await asyncio.sleep(_check_retry(upstream=upstream, attempt=attempt, exception=exception))
+
+
+def call_with_retry(upstream: str = None, func: Callable = None, *args, **kwargs) -> Any:
+    """Call `func(*args, **kwargs)` under the rate limit and retry policy of `upstream`.
+
+    Parameters
+    ----------
+    upstream : str, optional
+        name of the upstream in `UPSTREAM_POLICIES`, by default None
+    func : Callable, optional
+        function performing the call, by default None
+
+    Returns
+    -------
+    Any
+        result of `func`
+
+    Raises
+    ------
+    Exception
+        the last exception raised by `func` once retries are exhausted or if it is not retryable
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        acquire(upstream=upstream)
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            backoff(upstream=upstream, attempt=attempt, exception=e)
+
+
+async def async_call_with_retry(upstream: str = None, func: Callable = None, *args, **kwargs) -> Any:
+    """Asynchronous version of `call_with_retry`, `func` being a coroutine function.
+
+    Parameters
+    ----------
+    upstream : str, optional
+        name of the upstream in `UPSTREAM_POLICIES`, by default None
+    func : Callable, optional
+        coroutine function performing the call, by default None
+
+    Returns
+    -------
+    Any
+        result of `func`
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        await async_acquire(upstream=upstream)
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            await async_backoff(upstream=upstream, attempt=attempt, exception=e)
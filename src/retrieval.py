@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 12:54
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:40
+Description        : Local PDF text extraction, chunking and BM25 retrieval of relevant passages.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import asyncio
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import AsyncGenerator, Generator, Any, List, Optional, Tuple
+
+from src.config_and_variables import FILE_DIR, RETRIEVAL_INDEX_FILE, RETRIEVAL_CHUNK_WORDS, RETRIEVAL_CHUNK_OVERLAP
+from src.config_and_variables import RETRIEVAL_TOP_K
+from src.utils import hash_file
+
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B  = 0.75
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]')    # words, or single kana / CJK ideograph / hangul
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id      TEXT PRIMARY KEY,
+    file_name   TEXT NOT NULL,
+    num_chunks  INTEGER NOT NULL,
+    total_len   INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    doc_id      TEXT NOT NULL,
+    chunk_id    INTEGER NOT NULL,
+    page        INTEGER NOT NULL,
+    text        TEXT NOT NULL,
+    length      INTEGER NOT NULL,
+    PRIMARY KEY (doc_id, chunk_id)
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term        TEXT NOT NULL,
+    doc_id      TEXT NOT NULL,
+    chunk_id    INTEGER NOT NULL,
+    tf          INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_postings_term ON postings (term, doc_id);
+"""
+
+_lock = threading.RLock()
+_connection = None
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Open (once per process) the retrieval index database under `FILE_DIR`."""
+    global _connection
+
+    if _connection is None:
+        if not os.path.exists(FILE_DIR):
+            os.makedirs(FILE_DIR)
+
+        _connection = sqlite3.connect(os.path.join(FILE_DIR, RETRIEVAL_INDEX_FILE), check_same_thread=False)
+        _connection.executescript(_SCHEMA)
+        _connection.commit()
+
+    return _connection
+
+
+def tokenize(text: str = None) -> List[str]:
+    """Split text into lower-cased words, CJK characters being words on their own.
+
+    Parameters
+    ----------
+    text : str, optional
+        text to be tokenized, by default None
+
+    Returns
+    -------
+    List[str]
+        tokens of the text
+    """
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def extract_pdf_text(file_path: str = None) -> List[str]:
+    """Extract the text of each page of a PDF.
+
+    Parameters
+    ----------
+    file_path : str, optional
+        path to the PDF, by default None
+
+    Returns
+    -------
+    List[str]
+        text of each page, with ligatures normalized and end-of-line hyphenations joined
+
+    Raises
+    ------
+    ImportError
+        raised when `pypdf` is not installed
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise ImportError("Retrieval mode needs `pypdf`, please run `pip install pypdf`.") from e
+
+    pages = []
+    for page in PdfReader(file_path).pages:
+        text = unicodedata.normalize('NFKC', page.extract_text() or '')
+        pages.append(re.sub(r'-\n(\w)', r'\1', text))
+
+    return pages
+
+
+def chunk_pages(
+    pages: List[str] = None,
+    chunk_words: int = RETRIEVAL_CHUNK_WORDS,
+    overlap: int = RETRIEVAL_CHUNK_OVERLAP
+) -> List[Tuple[int, str]]:
+    """Split pages into overlapping chunks of words.
+
+    Parameters
+    ----------
+    pages : List[str], optional
+        text of each page, by default None
+    chunk_words : int, optional
+        number of words per chunk, by default RETRIEVAL_CHUNK_WORDS
+    overlap : int, optional
+        number of words shared by two consecutive chunks, by default RETRIEVAL_CHUNK_OVERLAP
+
+    Returns
+    -------
+    List[Tuple[int, str]]
+        (page number starting from 1, text) of each chunk
+    """
+    # keep track of the page each word comes from
+    words = [(page_number, word) for page_number, page in enumerate(pages, 1) for word in page.split()]
+
+    chunks = []
+    step = max(1, chunk_words - overlap)
+    for start in range(0, len(words), step):
+        window = words[start:start + chunk_words]
+        chunks.append((window[0][0], ' '.join(word for _, word in window)))
+        if start + chunk_words >= len(words):
+            break
+
+    return chunks
+
+
+def index_file(file_path: str = None) -> Generator[Any, Any, Any]:
+    """Extract, chunk and index a PDF for retrieval, skipping files already indexed.
+
+    Parameters
+    ----------
+    file_path : str, optional
+        path to the PDF, by default None
+
+    Yields
+    ------
+    Generator[Any, Any, Any]
+        output messages, the last one being the document id (SHA-256 of the file)
+
+    Raises
+    ------
+    FileNotFoundError
+        raised when file not found
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File {file_path} not found.")
+
+    file_name = os.path.basename(file_path)
+    doc_id = hash_file(file_path=file_path)
+
+    with _lock:
+        indexed = _get_connection().execute("SELECT 1 FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+
+    if indexed is not None:
+        yield f"File {file_name} already indexed, skip indexing..."
+    else:
+        yield f"Indexing file {file_name}..."
+        chunks = chunk_pages(pages=extract_pdf_text(file_path=file_path))
+
+        chunk_rows, posting_rows, total_len = [], [], 0
+        for chunk_id, (page, text) in enumerate(chunks):
+            tokens = tokenize(text)
+            total_len += len(tokens)
+            chunk_rows.append((doc_id, chunk_id, page, text, len(tokens)))
+            posting_rows.extend((term, doc_id, chunk_id, tf) for term, tf in Counter(tokens).items())
+
+        with _lock:
+            conn = _get_connection()
+            # indexed meanwhile by a concurrent call, e.g. the prefetcher and a user loading the same paper
+            if conn.execute("SELECT 1 FROM documents WHERE doc_id = ?", (doc_id,)).fetchone() is None:
+                conn.executemany("INSERT INTO chunks (doc_id, chunk_id, page, text, length) VALUES (?, ?, ?, ?, ?)", chunk_rows)
+                conn.executemany("INSERT INTO postings (term, doc_id, chunk_id, tf) VALUES (?, ?, ?, ?)", posting_rows)
+                conn.execute(
+                    "INSERT INTO documents (doc_id, file_name, num_chunks, total_len) VALUES (?, ?, ?, ?)",
+                    (doc_id, file_name, len(chunks), total_len)
+                )
+                conn.commit()
+
+    yield doc_id
+
+
+async def async_index_file(file_path: str = None) -> AsyncGenerator[Any, Any]:
+    """Asynchronous version of `index_file`, each step running in a worker thread.
+
+    Parameters
+    ----------
+    file_path : str, optional
+        path to the PDF, by default None
+
+    Yields
+    ------
+    AsyncGenerator[Any, Any]
+        output messages, the last one being the document id
+    """
+    steps = index_file(file_path=file_path)
+    while True:
+        msg = await asyncio.to_thread(next, steps, None)
+        if msg is None:
+            break
+        yield msg
+
+
+def lookup_doc_id(file_name: str = None) -> Optional[str]:
+    """Look up the document id of an indexed file.
+
+    Parameters
+    ----------
+    file_name : str, optional
+        name of the file, by default None
+
+    Returns
+    -------
+    Optional[str]
+        document id, None if the file is not indexed
+    """
+    with _lock:
+        row = _get_connection().execute(
+            "SELECT doc_id FROM documents WHERE file_name = ? ORDER BY rowid DESC LIMIT 1", (file_name,)
+        ).fetchone()
+
+    return None if row is None else row[0]
+
+
+def retrieve(doc_ids: List[str] = None, query: str = None, top_k: int = RETRIEVAL_TOP_K) -> List[dict]:
+    """Retrieve the passages of some documents most relevant to a query, ranked by BM25.
+
+    Parameters
+    ----------
+    doc_ids : List[str], optional
+        ids of the documents to search, by default None
+    query : str, optional
+        query to the LLM, by default None
+    top_k : int, optional
+        number of passages returned, by default RETRIEVAL_TOP_K
+
+    Returns
+    -------
+    List[dict]
+        passages with keys `file_name`, `page`, `text` and `score`, most relevant first
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if len(doc_ids) == 0 or len(terms) == 0:
+        return []
+
+    doc_marks = ','.join('?' * len(doc_ids))
+
+    with _lock:
+        conn = _get_connection()
+        num_chunks, total_len = conn.execute(
+            f"SELECT SUM(num_chunks), SUM(total_len) FROM documents WHERE doc_id IN ({doc_marks})", doc_ids
+        ).fetchone()
+        if not num_chunks:
+            return []
+        avg_len = total_len / num_chunks
+
+        scores = Counter()
+        for term in terms:
+            postings = conn.execute(
+                f"SELECT p.doc_id, p.chunk_id, p.tf, c.length FROM postings p "
+                f"JOIN chunks c ON c.doc_id = p.doc_id AND c.chunk_id = p.chunk_id "
+                f"WHERE p.term = ? AND p.doc_id IN ({doc_marks})",
+                [term, *doc_ids]
+            ).fetchall()
+
+            idf = math.log(1 + (num_chunks - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, chunk_id, tf, length in postings:
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len)
+                scores[(doc_id, chunk_id)] += idf * tf * (BM25_K1 + 1) / norm
+
+        passages = []
+        for (doc_id, chunk_id), score in scores.most_common(top_k):
+            file_name, page, text = conn.execute(
+                "SELECT d.file_name, c.page, c.text FROM chunks c JOIN documents d ON d.doc_id = c.doc_id "
+                "WHERE c.doc_id = ? AND c.chunk_id = ?",
+                (doc_id, chunk_id)
+            ).fetchone()
+            passages.append({'file_name': file_name, 'page': page, 'text': text, 'score': score})
+
+    return passages
+
+
+def expand_retrieval(messages: List[dict] = None, top_k: int = RETRIEVAL_TOP_K) -> List[dict]:
+    """Replace the `docid://` entries of the messages by the passages relevant to the last message.
+
+    Parameters
+    ----------
+    messages : List[dict], optional
+        messages in the history, the last one being the query, by default None
+    top_k : int, optional
+        number of passages injected, by default RETRIEVAL_TOP_K
+
+    Returns
+    -------
+    List[dict]
+        messages to be sent; `messages` itself if no document is attached
+    """
+    doc_ids = [
+        message['content'][len('docid://'):] for message in messages
+        if message['role'] == 'system' and message['content'].startswith('docid://')
+    ]
+    if len(doc_ids) == 0:
+        return messages
+
+    passages = retrieve(doc_ids=doc_ids, query=messages[-1]['content'], top_k=top_k)
+    context = "Relevant passages from the attached papers:\n\n" + "\n\n".join(
+        f"[{passage['file_name']}, page {passage['page']}]\n{passage['text']}" for passage in passages
+    )
+
+    expanded = [
+        message for message in messages[:-1]
+        if not (message['role'] == 'system' and message['content'].startswith('docid://'))
+    ]
+    expanded.append({'role': 'system', 'content': context})
+    expanded.append(messages[-1])
+
+    return expanded
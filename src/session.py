@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 12:49
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:45
+Description        : Per-session chat state for the webapp.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Set
+
+from src.config_and_variables import SESSION_MAX_COUNT, SESSION_IDLE_TIMEOUT
+from src.conversation import ConversationHistory
+from src.query_api import convert_tuples_to_messages
+
+
+class Session:
+    """Chat state of one webapp session.
+
+    Parameters
+    ----------
+    messages : ConversationHistory
+        messages of the chat, updated incrementally turn after turn
+    num_turns : int
+        number of (user_input, assistant_response) turns the messages account for
+    """
+
+    __slots__ = ('messages', 'num_turns', 'log_name', 'last_access')
+
+    def __init__(self, messages: ConversationHistory, num_turns: int) -> None:
+        self.messages = messages
+        self.num_turns = num_turns
+        self.log_name = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
+        self.last_access = time.monotonic()
+
+
+class SessionStore:
+    """Sessions keyed by Gradio session hash, bounded in number and evicted when idle.
+
+    Parameters
+    ----------
+    max_sessions : int, optional
+        maximum number of sessions kept, the least recently used are evicted first, by default SESSION_MAX_COUNT
+    idle_timeout : float, optional
+        seconds after which an inactive session is evicted, by default SESSION_IDLE_TIMEOUT
+    on_evict : Callable[[str], None], optional
+        called with the id of each evicted session, e.g. to drop state kept elsewhere for it, by default None
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = SESSION_MAX_COUNT,
+        idle_timeout: float = SESSION_IDLE_TIMEOUT,
+        on_evict: Callable[[str], None] = None
+    ) -> None:
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.on_evict = on_evict
+
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def _evict(self) -> List[str]:
+        deadline = time.monotonic() - self.idle_timeout
+        evicted = []
+        while len(self._sessions) > 0:
+            session_id, session = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and session.last_access >= deadline:
+                break
+            del self._sessions[session_id]
+            evicted.append(session_id)
+
+        return evicted
+
+    def attachments(self, scheme: str = 'fileid') -> Set[str]:
+        """Ids of the papers attached to any session, e.g. to keep them from being deleted.
+
+        Parameters
+        ----------
+        scheme : str, optional
+            'fileid' for uploaded files, 'docid' for indexed documents, by default 'fileid'
+
+        Returns
+        -------
+        Set[str]
+            file or document ids
+        """
+        with self._lock:
+            sessions = list(self._sessions.values())
+
+        return {attachment for session in sessions for attachment in session.messages.attachments(scheme=scheme)}
+
+    def get(self, session_id: str = None, history: List[tuple] = None) -> Session:
+        """Get the session of a user for the current turn.
+
+        The session is reused as long as it accounts for exactly the turns in `history`. Otherwise
+        (new chat, evicted session, retried or undone turn) its messages are rebuilt from `history`.
+
+        Parameters
+        ----------
+        session_id : str, optional
+            Gradio session hash, by default None
+        history : List[tuple], optional
+            history tuples displayed in the chatbot, by default None
+
+        Returns
+        -------
+        Session
+            session to be used for the current turn
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.num_turns != len(history):
+                rebuilt = Session(messages=convert_tuples_to_messages(tuples=history), num_turns=len(history))
+                if session is not None and len(history) > 0:
+                    # same chat, keep logging to the same file
+                    rebuilt.log_name = session.log_name
+                session = rebuilt
+                self._sessions[session_id] = session
+
+            session.last_access = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            evicted = self._evict()
+
+        if self.on_evict is not None:
+            for evicted_id in evicted:
+                self.on_evict(evicted_id)
+
+        return session
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 13:14
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:43
+Description        : Coalesce concurrent identical downloads and uploads into a single transfer.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import asyncio
+import threading
+from typing import Any, AsyncGenerator, Callable, Generator
+
+from src.metrics import increment
+
+
+class _Flight:
+    """Messages of a transfer in progress, shared by every caller waiting on it."""
+
+    __slots__ = ('messages', 'done', 'error', 'changed', 'task')
+
+    def __init__(self, changed: Any) -> None:
+        self.messages = []
+        self.done = False
+        self.error = None
+        self.changed = changed
+        self.task = None
+
+
+class SingleFlight:
+    """Run a single generator per key at a time, in a background thread: callers asking for a key
+    already in flight wait on it instead of starting their own, and all of them receive every
+    message of the transfer, from the first one.
+
+    The transfer does not belong to any caller, so it goes on if the caller who started it stops
+    iterating, e.g. a user closing the page.
+
+    Parameters
+    ----------
+    name : str
+        name of the flights in `single_flight_total`, e.g. 'download' or 'upload'
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def run(self, key: str, steps: Callable[[], Generator[Any, Any, Any]]) -> Generator[Any, Any, Any]:
+        """Iterate the messages of `steps()`, started now unless `key` is already in flight.
+
+        Parameters
+        ----------
+        key : str
+            identity of the transfer, e.g. an arxiv id or a content hash
+        steps : Callable[[], Generator[Any, Any, Any]]
+            builds the generator of the transfer, only called if `key` is not in flight
+
+        Yields
+        ------
+        Generator[Any, Any, Any]
+            messages of the transfer
+
+        Raises
+        ------
+        Exception
+            raised by the transfer, in every waiting caller
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = _Flight(changed=threading.Condition())
+                self._flights[key] = flight
+                threading.Thread(target=self._drive, args=(key, flight, steps), name=f"{self.name}-flight", daemon=True).start()
+                increment("single_flight_total", flight=self.name, result="started")
+            else:
+                increment("single_flight_total", flight=self.name, result="joined")
+
+        index = 0
+        while True:
+            with flight.changed:
+                flight.changed.wait_for(lambda: index < len(flight.messages) or flight.done)
+                messages = flight.messages[index:]
+                done = flight.done
+
+            for msg in messages:
+                yield msg
+            index += len(messages)
+
+            if done:
+                break
+
+        if flight.error is not None:
+            raise flight.error
+
+    def _drive(self, key: str, flight: _Flight, steps: Callable[[], Generator[Any, Any, Any]]) -> None:
+        try:
+            for msg in steps():
+                with flight.changed:
+                    flight.messages.append(msg)
+                    flight.changed.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            # the next call for the key starts afresh, e.g. skipping an already downloaded paper
+            with self._lock:
+                del self._flights[key]
+            with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
+
+
+class AsyncSingleFlight:
+    """Asynchronous version of `SingleFlight`, each transfer running as a task of the event loop.
+
+    Parameters
+    ----------
+    name : str
+        name of the flights in `single_flight_total`, e.g. 'download' or 'upload'
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._flights = {}
+
+    async def run(self, key: str, steps: Callable[[], AsyncGenerator[Any, Any]]) -> AsyncGenerator[Any, Any]:
+        """Asynchronous version of `SingleFlight.run`.
+
+        Parameters
+        ----------
+        key : str
+            identity of the transfer, e.g. an arxiv id or a content hash
+        steps : Callable[[], AsyncGenerator[Any, Any]]
+            builds the asynchronous generator of the transfer, only called if `key` is not in flight
+
+        Yields
+        ------
+        AsyncGenerator[Any, Any]
+            messages of the transfer
+
+        Raises
+        ------
+        BaseException
+            raised by the transfer, in every waiting caller, including `asyncio.CancelledError` when
+            the transfer is cancelled
+        """
+        # no await between the lookup and the registration, so no other task can start the same flight
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(changed=asyncio.Condition())
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._drive(key, flight, steps))
+            increment("single_flight_total", flight=self.name, result="started")
+        else:
+            increment("single_flight_total", flight=self.name, result="joined")
+
+        index = 0
+        while True:
+            async with flight.changed:
+                await flight.changed.wait_for(lambda: index < len(flight.messages) or flight.done)
+                messages = flight.messages[index:]
+                done = flight.done
+
+            for msg in messages:
+                yield msg
+            index += len(messages)
+
+            if done:
+                break
+
+        if flight.error is not None:
+            raise flight.error
+
+    async def _drive(self, key: str, flight: _Flight, steps: Callable[[], AsyncGenerator[Any, Any]]) -> None:
+        try:
+            async for msg in steps():
+                async with flight.changed:
+                    flight.messages.append(msg)
+                    flight.changed.notify_all()
+        except BaseException as e:
+            # a cancelled transfer fails its waiters too, instead of ending them as if it were complete
+            flight.error = e
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            del self._flights[key]
+            async with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
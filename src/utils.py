@@ -3,47 +3,29 @@
 '''
 Author             : 陈蔚 (weichen.cw@zju.edu.cn)
 Date               : 2024-08-17 14:24
-Last Modified By   : 陈蔚 (weichen.cw@zju.edu.cn)
-Last Modified Date : 2024-10-17 11:49
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:17
 Description        : Utils for the project.
 -------- 
 Copyright (c) 2024 Wei Chen. 
 '''
 
+import hashlib
 import json
 import os
-from contextlib import contextmanager
-from typing import Generator, List
+import threading
+import time
+from collections import OrderedDict
+from src.config_and_variables import LOG_DIR, LOG_FSYNC, LOG_STATE_MAX_COUNT, HASH_CHUNK_SIZE
+from src.conversation import ConversationHistory
+from src.metrics import span
 
-from src.config_and_variables import LOG_DIR, USE_PROXY, HTTP_PROXY, ALL_PROXY, NO_PROXY
 
+LOG_VERSION = 1
 
-@contextmanager
-def proxy_context() -> Generator[None, None, None]:
-    """Context manager to set/unset proxy environment variables.
-
-    Yields
-    ------
-    Generator[None, None, None]
-        Enter/Exist context.
-    """
-    try:
-        if USE_PROXY:
-            print('Setting proxy...')
-            os.environ['http_proxy']    = HTTP_PROXY
-            os.environ['https_proxy']   = HTTP_PROXY
-            os.environ['all_proxy']     = ALL_PROXY
-            os.environ['no_proxy']      = NO_PROXY
-        else:
-            print('Not setting proxy...')
-        yield
-    finally:
-        if USE_PROXY:
-            print('Unsetting proxy...')
-            del os.environ['http_proxy']
-            del os.environ['https_proxy']
-            del os.environ['all_proxy']
-            del os.environ['no_proxy']
+# Messages already written to each JSONL log, in order, to only append the new ones
+_logged_messages = OrderedDict()
+_log_lock = threading.Lock()
 
 
 def remove_proxy() -> None:
@@ -64,61 +46,71 @@ def remove_proxy() -> None:
         del os.environ['no_proxy']
 
 
-def append_message(messages: List[dict], role: str = None, content: str = None) -> None:
-    """Append a message to the messages list.
+def hash_file(file_path: str = None, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """Compute the SHA-256 digest of a file, reading it in fixed-size chunks.
 
     Parameters
     ----------
-    messages : List[dict]
-        messages list to be appended.
-    role : str, optional
-        role of the message, by default None
-    content : str, optional
-        content of the message, by default None
+    file_path : str, optional
+        path to the file, by default None
+    chunk_size : int, optional
+        bytes read at a time, by default HASH_CHUNK_SIZE
+
+    Returns
+    -------
+    str
+        hex digest of the file content
     """
-    if role != 'system':
-        messages.append({
-            'role': role,
-            'content': content
-        })
-    else:
-        need_to_append = True
-        for message in messages:
-            if message['role'] == 'system' and message['content'] == content:
-                need_to_append = False
-        if need_to_append:
-            messages.append({
-                'role': role,
-                'content': content
-            })
-
-
-def remove_message(messages: List[dict], role: str = None, content: str = None) -> None:
-    """Remove a message from the messages list.
+    digest = hashlib.sha256()
+    with span("hash_file"), open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def format_size(num_bytes: int = 0) -> str:
+    """Format a number of bytes for display.
 
     Parameters
     ----------
-    messages : List[dict]
-        messages list to be removed.
-    role : str, optional
-        role of the message, by default None
-    content : str, optional
-        content of the message, by default None
+    num_bytes : int, optional
+        number of bytes, by default 0
+
+    Returns
+    -------
+    str
+        human readable size, e.g. '1.2 MB'
     """
-    delete_index = []
-    for i, message in enumerate(reversed(messages)):
-        if message['role'] == role and message['content'] == content:
-            delete_index.append(len(messages) - 1 - i)
+    size = float(num_bytes)
+    for unit in ['B', 'KB', 'MB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
 
-    for index in delete_index:
-        messages.pop(index)
+    return f"{size:.1f} GB"
 
-def log_history(history: List[dict], file_name: str = None) -> None:
+
+def ends_with_torn_record(file_path: str) -> bool:
+    """Whether a log file ends in the middle of a record, i.e. not with a newline."""
+    with open(file_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return False
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b'\n'
+
+
+def log_history(history: ConversationHistory, file_name: str = None) -> None:
     """Log the history to a file.
 
+    The log is an append-only JSONL file: a header, then one record per message. Only the messages
+    added since the previous call are written; if earlier messages were removed, a `truncate`
+    record is written first, followed by the messages after the removed ones.
+
     Parameters
     ----------
-    history : List[dict]
+    history : ConversationHistory
         history to be logged.
     file_name : str, optional
         file name, by default None
@@ -129,14 +121,57 @@ def log_history(history: List[dict], file_name: str = None) -> None:
     if file_name is None:
         file_name = 'default_log'
 
-    file_path = os.path.join(LOG_DIR, f"{file_name}.log")
-    
-    with open(file_path, 'w') as f:
-        f.write(json.dumps(history, ensure_ascii=False, indent=4))
-
-
-def load_log(file_name: str = None) -> List[dict]:
-    """Load the log from a file.
+    file_path = os.path.join(LOG_DIR, f"{file_name}.jsonl")
+
+    # snapshots share their message dicts, so logged messages are recognized by identity
+    history = history.to_messages()
+
+    with _log_lock:
+        records = []
+        prefix = ''
+
+        logged = _logged_messages.get(file_path)
+        if logged is None:
+            # nothing known about the file (new log, or evicted state): (re)write it entirely
+            logged = []
+            if os.path.exists(file_path):
+                records.append({'type': 'truncate', 'length': 0})
+                prefix = '\n' if ends_with_torn_record(file_path) else ''
+            else:
+                records.append({'type': 'header', 'version': LOG_VERSION, 'created': time.time()})
+
+        # messages are only appended in general, so checking the last logged one is enough
+        keep = len(logged)
+        if keep > len(history) or (keep > 0 and history[keep - 1] is not logged[-1]):
+            keep = 0
+            while keep < min(len(logged), len(history)) and history[keep] is logged[keep]:
+                keep += 1
+            records.append({'type': 'truncate', 'length': keep})
+            del logged[keep:]
+
+        for message in history[keep:]:
+            records.append({'type': 'message', 'role': message['role'], 'content': message['content']})
+            logged.append(message)
+
+        _logged_messages[file_path] = logged
+        _logged_messages.move_to_end(file_path)
+        while len(_logged_messages) > LOG_STATE_MAX_COUNT:
+            _logged_messages.popitem(last=False)
+
+        if len(records) > 0:
+            with open(file_path, 'a') as f:
+                f.write(prefix + ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+                if LOG_FSYNC:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            # imported here, `src/log_index.py` depends on `src/retrieval.py`, which depends on this module
+            from src.log_index import update_log
+            update_log(log_name=file_name)
+
+
+def load_log(file_name: str = None) -> ConversationHistory:
+    """Load the log from a file, either a JSONL log or a legacy `.log` JSON file.
 
     Parameters
     ----------
@@ -145,18 +180,43 @@ def load_log(file_name: str = None) -> List[dict]:
 
     Returns
     -------
-    List[dict]
-        messages list loaded.
+    ConversationHistory
+        history loaded.
     """
     if file_name is None:
         file_name = 'default_log'
 
-    file_path = os.path.join(LOG_DIR, f"{file_name}.log")
+    file_path = os.path.join(LOG_DIR, f"{file_name}.jsonl")
 
     if not os.path.exists(file_path):
-        return []
-    
-    with open(file_path, 'r') as f:
-        history = json.load(f)
+        legacy_path = os.path.join(LOG_DIR, f"{file_name}.log")
+        if not os.path.exists(legacy_path):
+            return ConversationHistory()
 
-    return history
\ No newline at end of file
+        with open(legacy_path, 'r') as f:
+            return ConversationHistory(messages=json.load(f))
+
+    messages = []
+    with open(file_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # torn record, written by a crashed process
+                continue
+
+            if record['type'] == 'message':
+                messages.append({'role': record['role'], 'content': record['content']})
+            elif record['type'] == 'truncate':
+                del messages[record['length']:]
+
+    history = ConversationHistory(messages=messages)
+
+    # further logging of this history appends to the file
+    with _log_lock:
+        logged = list(history.to_messages())
+        if len(logged) == len(messages):
+            _logged_messages[file_path] = logged
+            _logged_messages.move_to_end(file_path)
+
+    return history
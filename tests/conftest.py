@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 13:38
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:38
+Description        : Fixtures of the tests, run with `python -m pytest tests`.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.mock_server import MockServer, MockState
+
+SAMPLE_PAPER = os.path.join(ROOT_DIR, "files", "HowtoReadPaper.pdf")
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory, with the databases of `FILE_DIR` and `LOG_DIR` opened afresh in it."""
+    from src import file_registry, log_index, retrieval
+
+    monkeypatch.chdir(tmp_path)
+    for module in (file_registry, log_index, retrieval):
+        monkeypatch.setattr(module, "_connection", None)
+
+    return tmp_path
+
+
+@pytest.fixture
+def mock_server(workdir):
+    """Mock DashScope endpoint, see `benchmarks/mock_server.py`."""
+    with MockServer(MockState(pdf_bytes=b"%PDF-1.4 mock paper", num_tokens=4)) as server:
+        yield server
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 13:38
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:40
+Description        : Circuit breaking and pinning of the client pool.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.mock_server import MockServer, MockState
+
+
+def make_pool(server, cooldown: float = 0.0):
+    from src.client_pool import ClientPool
+
+    pool = ClientPool(api_keys="sk-mock", endpoints=f"{server.url}/v1", max_retries=0)
+    member = pool.members[0]
+    member.breaker.failure_threshold = 1
+    member.breaker.cooldown = cooldown
+    return pool, member
+
+
+def chat(pool, file_id: str = None):
+    """Stream a chat, about `file_id` (pinning it to the key storing the file) if given."""
+    messages = [{"role": "user", "content": "Hello"}]
+    if file_id is not None:
+        messages.insert(0, {"role": "system", "content": f"fileid://{file_id}"})
+    return pool.chat.completions.create(model="mock", messages=messages, stream=True)
+
+
+def upload(client) -> str:
+    return client.files.create(file=("paper.pdf", b"%PDF-1.4 paper"), purpose="file-extract").id
+
+
+def test_breaker_recovers_after_non_health_probe_failure(mock_server):
+    from openai import BadRequestError, InternalServerError
+
+    pool, member = make_pool(mock_server)
+    file_id = upload(pool)
+
+    mock_server._server.state.failures.extend([500, 400])
+    with pytest.raises(InternalServerError):
+        chat(pool, file_id=file_id)
+    assert member.breaker.opened_at is not None
+
+    # the cooldown is over, the probe is answered by a working key
+    with pytest.raises(BadRequestError):
+        chat(pool, file_id=file_id)
+    assert member.breaker.available(time.monotonic())
+
+    assert len(list(chat(pool, file_id=file_id))) > 0
+    assert member.outstanding == 0
+
+
+def test_breaker_recovers_after_probe_stream_closed(mock_server):
+    from openai import InternalServerError
+
+    pool, member = make_pool(mock_server)
+    file_id = upload(pool)
+
+    mock_server._server.state.failures.append(500)
+    with pytest.raises(InternalServerError):
+        chat(pool, file_id=file_id)
+
+    # the probe is dropped before its first chunk
+    chat(pool, file_id=file_id).close()
+    assert member.outstanding == 0
+    assert member.breaker.available(time.monotonic())
+
+
+def test_pinned_key_fails_fast_during_cooldown(mock_server):
+    from openai import InternalServerError
+    from src.client_pool import KeyUnavailableError
+
+    pool, member = make_pool(mock_server, cooldown=60)
+    file_id = upload(pool)
+
+    mock_server._server.state.failures.append(500)
+    with pytest.raises(InternalServerError):
+        chat(pool, file_id=file_id)
+
+    with pytest.raises(KeyUnavailableError):
+        chat(pool, file_id=file_id)
+
+
+@pytest.fixture
+def two_key_pool(mock_server):
+    """Pool of two keys on two mock servers, one file uploaded to each, the second key out of the pool."""
+    from src.client_pool import ClientPool, _Files
+
+    with MockServer(MockState(pdf_bytes=b"%PDF-1.4 mock paper")) as other_server:
+        endpoints = f"{mock_server.url}/v1,{other_server.url}/v1"
+        pool = ClientPool(api_keys="sk-a,sk-b", endpoints=endpoints, max_retries=0)
+        healthy, tripped = pool.members
+        file_ids = [upload(SimpleNamespace(files=_Files(pool, owner=member.owner))) for member in (healthy, tripped)]
+
+        tripped.breaker.failure_threshold = 1
+        tripped.breaker.cooldown = 60
+        tripped.breaker.record_failure(time.monotonic())
+
+        yield pool, mock_server._server.state, file_ids, endpoints
+
+
+def test_listing_skips_keys_out_of_the_pool(two_key_pool):
+    from src.file_registry import lookup_file_owners, refresh_registry
+
+    pool, healthy_state, (healthy_id, tripped_id), endpoints = two_key_pool
+    healthy_state.files.clear()
+
+    assert refresh_registry(client=pool, force=True)
+    # the file of the tripped key is kept, the file deleted from the healthy key is dropped
+    assert set(lookup_file_owners(file_ids=[healthy_id, tripped_id])) == {tripped_id}
+
+
+def test_async_listing_skips_keys_out_of_the_pool(two_key_pool):
+    from src.client_pool import AsyncClientPool
+    from src.file_registry import async_refresh_registry, lookup_file_owners
+
+    pool, healthy_state, (healthy_id, tripped_id), endpoints = two_key_pool
+    async_pool = AsyncClientPool(api_keys="sk-a,sk-b", endpoints=endpoints, max_retries=0)
+    async_pool.members[1].breaker = pool.members[1].breaker
+    healthy_state.files.clear()
+
+    assert asyncio.run(async_refresh_registry(client=async_pool, force=True))
+    assert set(lookup_file_owners(file_ids=[healthy_id, tripped_id])) == {tripped_id}
+
+
+def test_listing_fails_without_any_key(two_key_pool):
+    from src.client_pool import KeyUnavailableError
+    from src.file_registry import refresh_registry
+
+    pool = two_key_pool[0]
+    pool.members[0].breaker = pool.members[1].breaker
+
+    with pytest.raises(KeyUnavailableError):
+        refresh_registry(client=pool, force=True)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 13:42
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:42
+Description        : Paging and search of the log index.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import pytest
+
+
+def write_log(log_name: str, num_turns: int, topic: str) -> list:
+    from src.conversation import ConversationHistory
+    from src.utils import log_history
+
+    history = ConversationHistory()
+    history.append(role='system', content='You are an expert.')
+    for i in range(num_turns):
+        history.append(role='user', content=f'Question {i} about {topic}')
+        history.append(role='assistant', content=f'Answer {i}')
+        # logged turn by turn, as by the chat loops
+        log_history(history=history, file_name=log_name)
+
+    return list(history.to_messages())
+
+
+def test_log_pages_round_trip(workdir):
+    from src.log_index import load_log_page
+
+    messages = write_log('2024-08-19_10-00-00', num_turns=7, topic='transformers')
+
+    first, num_pages = load_log_page(log_name='2024-08-19_10-00-00', page=1, page_size=4)
+    assert num_pages == 4
+
+    pages = [first] + [load_log_page(log_name='2024-08-19_10-00-00', page=page, page_size=4)[0] for page in range(2, num_pages + 1)]
+    assert [message for page in pages for message in page] == messages
+    assert load_log_page(log_name='2024-08-19_10-00-00', page=-1, page_size=4)[0] == pages[-1]
+
+    for page in (0, -5):
+        with pytest.raises(ValueError):
+            load_log_page(log_name='2024-08-19_10-00-00', page=page, page_size=4)
+
+
+def test_list_resolve_and_search_logs(workdir):
+    from src.log_index import list_logs, resolve_log_name, search_logs
+
+    write_log('2024-08-19_10-00-00', num_turns=2, topic='transformers')
+    write_log('2024-08-19_11-00-00', num_turns=3, topic='diffusion')
+    write_log('2024-08-20_09-00-00', num_turns=1, topic='diffusion')
+
+    entries, num_pages = list_logs(page=1, page_size=2)
+    assert num_pages == 2
+    assert [entry['log_name'] for entry in entries + list_logs(page=2, page_size=2)[0]] == [
+        '2024-08-20_09-00-00', '2024-08-19_11-00-00', '2024-08-19_10-00-00'
+    ]
+    assert entries[1]['num_turns'] == 3
+
+    assert resolve_log_name(prefix='2024-08-19') == '2024-08-19_11-00-00'
+    assert resolve_log_name(prefix='2023') is None
+    with pytest.raises(ValueError):
+        resolve_log_name(prefix='')
+    with pytest.raises(ValueError):
+        list_logs(page=0)
+
+    assert {entry['log_name'] for entry in search_logs(query='diffusion')} == {'2024-08-19_11-00-00', '2024-08-20_09-00-00'}
+    assert search_logs(query='transformers diffusion') == []
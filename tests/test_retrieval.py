@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 13:40
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:40
+Description        : Concurrent indexing of the retrieval index.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import shutil
+import threading
+
+import pytest
+
+from tests.conftest import SAMPLE_PAPER
+
+
+def test_concurrent_index_file_same_document(workdir, monkeypatch):
+    pytest.importorskip("pypdf")
+    from src import retrieval
+
+    file_path = str(workdir / "paper.pdf")
+    shutil.copy(SAMPLE_PAPER, file_path)
+
+    # both calls extract the text before either inserts it
+    extracted = threading.Barrier(2)
+    extract_pdf_text = retrieval.extract_pdf_text
+
+    def slow_extract(file_path: str = None):
+        pages = extract_pdf_text(file_path=file_path)
+        extracted.wait(timeout=10)
+        return pages
+
+    monkeypatch.setattr(retrieval, "extract_pdf_text", slow_extract)
+
+    results, errors = [], []
+
+    def index():
+        try:
+            results.append(list(retrieval.index_file(file_path=file_path))[-1])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=index) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(set(results)) == 1
+
+    conn = retrieval._get_connection()
+    num_chunks = conn.execute("SELECT num_chunks FROM documents WHERE doc_id = ?", (results[0],)).fetchone()[0]
+    assert conn.execute("SELECT COUNT(*) FROM chunks WHERE doc_id = ?", (results[0],)).fetchone()[0] == num_chunks
+    assert len(retrieval.retrieve(doc_ids=[results[0]], query="first pass")) > 0
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 13:45
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:45
+Description        : Eviction of the webapp sessions, and of the state kept for them elsewhere.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+from src.prefetch import Prefetcher
+from src.session import SessionStore
+
+
+def test_evicted_sessions_are_forgotten_by_the_prefetcher(workdir):
+    prefetcher = Prefetcher()
+    try:
+        sessions = SessionStore(max_sessions=2, on_evict=prefetcher.forget)
+        for session_id in ("a", "b"):
+            sessions.get(session_id=session_id, history=[])
+            prefetcher._used_bytes[session_id] = 1024
+        prefetcher._queued["2311.11100"] = "a"
+        prefetcher._seen.add("2311.11100")
+
+        # the least recently used session is evicted by a new one
+        sessions.get(session_id="b", history=[])
+        sessions.get(session_id="c", history=[])
+
+        assert prefetcher.used_bytes(session="a") == 0
+        assert prefetcher.used_bytes(session="b") == 1024
+        assert "a" not in prefetcher._used_bytes
+        assert "2311.11100" not in prefetcher._queued and "2311.11100" not in prefetcher._seen
+    finally:
+        prefetcher.close()
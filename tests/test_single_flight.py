@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Author             : agent (agent@local)
+Date               : 2026-10-18 13:43
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:43
+Description        : Coalesced transfers, and their failure in every waiting caller.
+--------
+Copyright (c) 2026 Wei Chen.
+'''
+
+import asyncio
+
+import pytest
+
+from src.single_flight import AsyncSingleFlight, SingleFlight
+
+
+def test_waiters_receive_every_message_and_error():
+    flight = SingleFlight(name="test")
+
+    def steps():
+        yield 1
+        yield 2
+        raise ConnectionError("transfer failed")
+
+    for _ in range(2):
+        received = []
+        with pytest.raises(ConnectionError):
+            for msg in flight.run("key", steps):
+                received.append(msg)
+        assert received == [1, 2]
+
+
+def test_async_cancelled_flight_fails_its_waiters():
+    async def main():
+        flight = AsyncSingleFlight(name="test")
+        started = asyncio.Event()
+        num_calls = 0
+
+        async def steps():
+            nonlocal num_calls
+            num_calls += 1
+            yield 1
+            started.set()
+            await asyncio.sleep(60)
+            yield 2
+
+        async def consume():
+            return [msg async for msg in flight.run("key", steps)]
+
+        leader = asyncio.create_task(consume())
+        await started.wait()
+        waiter = asyncio.create_task(consume())
+        await asyncio.sleep(0)
+
+        next(iter(flight._flights.values())).task.cancel()
+        results = await asyncio.gather(leader, waiter, return_exceptions=True)
+        assert all(isinstance(result, asyncio.CancelledError) for result in results)
+
+        # the cancelled flight is forgotten, the next call starts afresh
+        assert flight._flights == {}
+        started.clear()
+        leader = asyncio.create_task(consume())
+        await started.wait()
+        assert num_calls == 2
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(main())
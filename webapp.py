@@ -3,80 +3,176 @@
 '''
 Author             : 陈蔚 (weichen.cw@zju.edu.cn)
 Date               : 2024-08-17 14:28
-Last Modified By   : 陈蔚 (weichen.cw@zju.edu.cn)
-Last Modified Date : 2024-10-17 13:00
+Last Modified By   : agent (agent@local)
+Last Modified Date : 2026-10-18 13:45
 Description        : This is the interface for the webapp.
 -------- 
 Copyright (c) 2024 Wei Chen. 
 '''
 
-import time
+import asyncio
 import os
-
-import gradio as gr
-from openai import OpenAI
+import time
 
 from src.arguments import get_args
-from src.process_file import upload_file, upload_file_from_arxiv, get_file_id
-from src.query_api import query_api_webapp, convert_tuples_to_messages
+from src.process_file import async_upload_file, async_upload_file_from_arxiv, async_upload_files_from_arxiv
+from src.process_file import async_get_file_id, async_delete_file, async_index_file_from_arxiv, get_arxiv_file_path
+from src.process_file import async_search_arxiv, format_arxiv_entry
+from src.prefetch import Prefetcher
+from src.lifecycle import LifecycleManager
+from src.query_api import async_query_api_webapp
+from src.retrieval import async_index_file, lookup_doc_id
+from src.metrics import start_metrics_server
+from src.session import SessionStore
 from src.utils import log_history, remove_proxy
-from src.config_and_variables import APP_INSTRUCTION, ENDPOINT, NO_PROXY
+from src.config_and_variables import APP_INSTRUCTION, ENDPOINT, NO_PROXY, WEBAPP_CONCURRENCY_LIMIT, METRICS_PORT
+from src.config_and_variables import PROGRESS_INTERVAL
 
 remove_proxy()
 os.environ['no_proxy'] = NO_PROXY
 
 
-log_name = None
-
 def main():
     args = get_args()
     print(args)
     print(APP_INSTRUCTION)
 
-    client = OpenAI(
-        api_key=args.accessKey,
-        base_url=ENDPOINT
+    # imported after the arguments are parsed, so that `--help` and argument errors return at once
+    import gradio as gr
+    from src.client_pool import AsyncClientPool, ClientPool, split_entries
+
+    client = AsyncClientPool(
+        api_keys=split_entries(args.accessKey),
+        endpoints=split_entries(ENDPOINT),
+        max_retries=0   # retries are handled by `src/rate_limit.py`
     )
 
-    def response(query, history):
-        global log_name
-        
-        if len(history) == 0:
-            # which means that we are starting a new chat
-            log_name = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
-        
-        messages = convert_tuples_to_messages(tuples=history)
-
-        if query.startswith("arxiv:"):
-            arxiv_id = query.split(":")[1]
-            for i, msg in enumerate(upload_file_from_arxiv(client=client, arxiv_id=arxiv_id)):
-                yield f"[STEP {i+1}/3]: {msg}"
-            file_id = msg
-            yield f"Finish Uploading Paper. File id: {file_id}."
-            messages.append({"role": "system", "content": f"fileid://{file_id}"})
-        elif query.startswith("file:"):
-            file_path = query.split(":")[1].strip(':').strip("'")
-            for i, msg in enumerate(upload_file(client=client, file_path=file_path)):
-                yield f"[STEP {i + 1} / 2]: {msg}"
-            file_id = msg
-            yield f"Finish Uploading Paper. File id: {file_id}."
-            messages.append({"role": "system", "content": f"fileid://{file_id}"})
-        elif query.startswith("delete:"):
-            file_name = query.split(":")[1].split('/')[-1]
-
-            file_id = get_file_id(client=client, file_name=file_name)
-            if file_id is not None:
-                client.files.delete(file_id)
-                yield f"Finish Deleting Paper. File id: {file_id}."
-        else:
-            for response_text in query_api_webapp(
-                client=client,
-                query=query,
-                messages=messages
-            ):
-                yield response_text
-
-        log_history(history=messages, file_name=log_name)
+    # shared by every session, each with its own quota, prefetched papers are only downloaded (indexed in retrieval mode)
+    prefetcher = Prefetcher(retrieval=args.retrieval) if args.prefetch else None
+
+    # the quota of an evicted session is dropped with it
+    sessions = SessionStore(on_evict=prefetcher.forget if prefetcher is not None else None)
+
+    if args.lifecycle is not None:
+        # deletions run in a background thread, with a synchronous client of their own
+        LifecycleManager(
+            client=ClientPool(api_keys=split_entries(args.accessKey), endpoints=split_entries(ENDPOINT), max_retries=0),
+            active_file_ids=lambda: sessions.attachments(scheme="fileid"),
+            interval=args.lifecycle
+        )
+
+    if METRICS_PORT is not None:
+        start_metrics_server(port=METRICS_PORT)
+
+    # papers are attached as whole remote files, or as local documents searched on each query
+    scheme, label = ("docid", "Doc id") if args.retrieval else ("fileid", "File id")
+    action = "Indexing" if args.retrieval else "Uploading"
+
+    async def response(query, history, request: gr.Request):
+        session = sessions.get(session_id=request.session_hash, history=history)
+        session.num_turns += 1
+        messages = session.messages
+
+        try:
+            if query.startswith("arxiv:") and "," in query:
+                arxiv_ids = [arxiv_id.strip() for arxiv_id in query.split(":")[1].split(",") if arxiv_id.strip()]
+                if prefetcher is not None:
+                    for arxiv_id in arxiv_ids:
+                        await asyncio.to_thread(prefetcher.wait, arxiv_id)
+                progress = {}
+                async for msg in async_upload_files_from_arxiv(
+                    client=await client.pinned(file_ids=messages.attachments(scheme="fileid")),
+                    arxiv_ids=arxiv_ids,
+                    retrieval=args.retrieval
+                ):
+                    if isinstance(msg, tuple):
+                        progress[msg[0] or "arxiv"] = msg[1]
+                        yield "\n".join(f"[{arxiv_id}]: {text}" for arxiv_id, text in progress.items())
+                file_ids = msg
+                yield "\n".join(
+                    f"Finish {action} Paper {arxiv_id}. {label}: {file_id}." for arxiv_id, file_id in file_ids.items()
+                ) or f"No paper has been {action.lower()}."
+                for arxiv_id, file_id in file_ids.items():
+                    messages.append(role="system", content=f"{scheme}://{file_id}")
+                    if prefetcher is not None:
+                        prefetcher.submit(file_path=get_arxiv_file_path(arxiv_id), arxiv_id=arxiv_id, session=request.session_hash)
+            elif query.startswith("arxiv:"):
+                arxiv_id = query.split(":")[1]
+                if prefetcher is not None:
+                    # a paper being prefetched is finished rather than downloaded twice
+                    await asyncio.to_thread(prefetcher.wait, arxiv_id)
+                if args.retrieval:
+                    steps = async_index_file_from_arxiv(arxiv_id=arxiv_id)
+                else:
+                    steps = async_upload_file_from_arxiv(client=await client.pinned(file_ids=messages.attachments(scheme="fileid")), arxiv_id=arxiv_id)
+                i = 0
+                async for msg in steps:
+                    i += 1
+                    yield f"[STEP {i}]: {msg}"
+                file_id = msg
+                yield f"Finish {action} Paper. {label}: {file_id}."
+                messages.append(role="system", content=f"{scheme}://{file_id}")
+
+                if prefetcher is not None:
+                    prefetcher.submit(file_path=get_arxiv_file_path(arxiv_id), arxiv_id=arxiv_id, session=request.session_hash)
+            elif query.startswith("file:"):
+                file_path = query.split(":")[1].strip(':').strip("'")
+                if args.retrieval:
+                    steps = async_index_file(file_path=file_path)
+                else:
+                    steps = async_upload_file(client=await client.pinned(file_ids=messages.attachments(scheme="fileid")), file_path=file_path)
+                i = 0
+                async for msg in steps:
+                    i += 1
+                    yield f"[STEP {i} / 2]: {msg}"
+                file_id = msg
+                yield f"Finish {action} Paper. {label}: {file_id}."
+                messages.append(role="system", content=f"{scheme}://{file_id}")
+            elif query.startswith("delete:") and args.retrieval:
+                file_name = query.split(":")[1].split('/')[-1]
+
+                # indexed papers are only detached from the chat, the local index is kept
+                doc_id = lookup_doc_id(file_name=file_name)
+                if doc_id is not None:
+                    messages.remove(role="system", content=f"docid://{doc_id}")
+                    yield f"Finish Removing Paper. Doc id: {doc_id}."
+            elif query.startswith("delete:"):
+                file_name = query.split(":")[1].split('/')[-1]
+
+                file_id = await async_get_file_id(client=client, file_name=file_name)
+                if file_id is not None:
+                    await async_delete_file(client=client, file_id=file_id)
+                    messages.remove(role="system", content=f"fileid://{file_id}")
+                    yield f"Finish Deleting Paper. File id: {file_id}."
+            elif query.startswith("search:"):
+                keyword = query.split(":", 1)[1].strip()
+
+                # the list is refreshed as pages arrive, at most every `PROGRESS_INTERVAL` seconds
+                results = []
+                last_report = 0.0
+                async for entry in async_search_arxiv(keyword=keyword):
+                    results.append(f"{len(results) + 1}. {format_arxiv_entry(entry)}")
+                    if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                        last_report = time.monotonic()
+                        yield "\n".join(results)
+                results.append(f"\nFinish Searching {keyword}: {len(results)} papers found, load them with 'arxiv:<arxiv_id>'.")
+                yield "\n".join(results)
+                # search results are not part of the chat history sent to the LLM
+                return
+            else:
+                async for response_text in async_query_api_webapp(
+                    client=client,
+                    query=query,
+                    messages=messages
+                ):
+                    yield response_text
+        except Exception as e:
+            # report the failure instead of breaking the chat
+            yield f"Error: {e}"
+            return
+
+        # the log and its index are written in a worker thread, not to block the other sessions
+        await asyncio.to_thread(log_history, history=messages, file_name=session.log_name)
 
     chatbot = gr.Chatbot(
         height=600, 
@@ -98,6 +194,7 @@ def main():
         theme="soft",
         examples=["Hello, who are you?", "arxiv:2311.11100", "file:files/HowtoReadPaper.pdf", "delete:2311.11100.pdf"],
         cache_examples=False,
+        concurrency_limit=WEBAPP_CONCURRENCY_LIMIT,
     ).launch()
 
 